@@ -1,8 +1,20 @@
 import json
 import os
 import main
+import calendar_pool
+import event_cache
+import fastpath
+import freebusy
+import model_router
+import prompt_cache
+import token_refresh
+import log_sink
+import prompt_log
+import prompt_migration
+import sec
+import replay
 import requests
-from flask import Flask, send_from_directory, jsonify, request, redirect, session, abort
+from flask import Flask, Response, g, send_from_directory, jsonify, request, redirect, session, abort, stream_with_context, has_request_context
 from flask_session import Session
 from google_auth_oauthlib.flow import InstalledAppFlow
 from flask_cors import CORS
@@ -13,9 +25,8 @@ import logging
 import jwt
 import uuid
 from supabase import create_client, Client
-from cryptography.fernet import Fernet
-import base64
-from redis import Redis
+from redis_store import get_redis
+from retry_policy import calendar_policy
 #hello world
 
 # Load environment variables from .env file
@@ -31,19 +42,36 @@ app.secret_key = os.environ.get("SECRET_KEY") or os.urandom(24)
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
 
-if not SUPABASE_URL or not SUPABASE_ANON_KEY:
+if replay.replaying():
+    # In-memory stand-in for offline load tests; see replay.py
+    supabase = replay.supabase_client()
+elif not SUPABASE_URL or not SUPABASE_ANON_KEY:
     logger = logging.getLogger(__name__)
     supabase: Client = None
 else:
     supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
 
+if log_sink.LOG_SINK_ENABLED:
+    # Prompt logs are written in the background, in bulk; see log_sink.py
+    log_sink.configure(lambda: supabase)
+# Rows still in the old prompt_text format are rewritten as they are read
+prompt_migration.configure(lambda: supabase)
+
 # Determine environment
 environment = os.environ.get("FLASK_ENV", "development")
 frontend_url = os.getenv('frontend_url', 'http://localhost:8080')
 
+# Check new events against free/busy time unless the request says otherwise
+CONFLICT_CHECK_ENABLED = os.getenv('CONFLICT_CHECK_ENABLED', 'false').lower() == 'true'
+
 # Session configuration - different for dev and prod
 app.config['SESSION_TYPE'] = 'redis'
-app.config['SESSION_REDIS'] = Redis.from_url(os.environ.get('REDIS_URL'))
+app.config['SESSION_REDIS'] = get_redis()
+if replay.replaying() and app.config['SESSION_REDIS'] is None:
+    # Offline load tests run without Redis; keep sessions in process memory
+    from cachelib import SimpleCache
+    app.config['SESSION_TYPE'] = 'cachelib'
+    app.config['SESSION_CACHELIB'] = SimpleCache(threshold=100000)
 app.config['SESSION_PERMANENT'] = True
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=5)
 app.config['SESSION_COOKIE_HTTPONLY'] = True
@@ -86,6 +114,12 @@ CORS(app,
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Pre-build Calendar services before this worker accepts traffic
+try:
+    calendar_pool.warm_up()
+except Exception as e:
+    logger.warning(f"Calendar service warm-up failed: {e}")
+
 # User Database Operations
 def create_or_update_user(email, name, google_id=None, picture=None):
     """Create or update user in Supabase database"""
@@ -154,31 +188,68 @@ def create_prompt_log(user_email, user_id, prompt_text, ai_response=None, action
         return None
     
     try:
-        prompt_data = {
-            'id': str(uuid.uuid4()),
-            'user_id': user_id,
-            'user_email': user_email,
-            'prompt_text': prompt_text,
-            'ai_response': ai_response,
-            'action_type': action_type,
-            'status': status,
-            'error_message': error_message,
-            'user_timezone': user_timezone,
-            'processing_time_ms': processing_time_ms,
-            'token_usage': token_usage,
-            'event_created': event_created,
-            'event_data': event_data,
-            'ip_address': ip_address,
-            'user_agent': user_agent,
-            'created_at': datetime.now(timezone.utc).isoformat()
-        }
-        
-        result = supabase.table('prompts').insert(prompt_data).execute()
-        return result.data[0] if result.data else None
+        prompt_data = build_prompt_log(
+            user_email, user_id, prompt_text, ai_response=ai_response, action_type=action_type,
+            status=status, error_message=error_message, user_timezone=user_timezone,
+            processing_time_ms=processing_time_ms, token_usage=token_usage, event_created=event_created,
+            event_data=event_data, ip_address=ip_address, user_agent=user_agent
+        )
+
+        if has_request_context():
+            # Kept in memory and written once when the request ends
+            log = prompt_log.open_log(prompt_data)
+            g.setdefault('prompt_logs', {})[log.id] = log
+            return prompt_data
+
+        save_prompt_log(prompt_data)
+        return prompt_data
         
     except Exception as e:
         return None
 
+def save_prompt_log(row):
+    """Write a finished prompts row: one upsert, also replacing any write-ahead copy"""
+    if log_sink.sink is not None:
+        log_sink.sink.insert(row)
+        log_sink.sink.complete(row['id'])
+    else:
+        supabase.table('prompts').upsert(row).execute()
+
+def write_ahead_prompt_log(row):
+    """Crash-safe copy of a long-running request's row; written directly, off the request thread"""
+    supabase.table('prompts').upsert(row).execute()
+
+prompt_log.configure(save=save_prompt_log, write_ahead=write_ahead_prompt_log)
+
+@app.teardown_request
+def save_prompt_logs(exc=None):
+    for log in g.pop('prompt_logs', {}).values():
+        prompt_log.close_log(log)
+
+def build_prompt_log(user_email, user_id, prompt_text, ai_response=None, action_type=None,
+                     status='processing', error_message=None, user_timezone=None,
+                     processing_time_ms=None, token_usage=None, event_created=False,
+                     event_data=None, ip_address=None, user_agent=None):
+    """The prompts row create_prompt_log writes"""
+    return {
+        'id': str(uuid.uuid4()),
+        'user_id': user_id,
+        'user_email': user_email,
+        'prompt_text': prompt_text,
+        'ai_response': ai_response,
+        'action_type': action_type,
+        'status': status,
+        'error_message': error_message,
+        'user_timezone': user_timezone,
+        'processing_time_ms': processing_time_ms,
+        'token_usage': token_usage,
+        'event_created': event_created,
+        'event_data': event_data,
+        'ip_address': ip_address,
+        'user_agent': user_agent,
+        'created_at': datetime.now(timezone.utc).isoformat()
+    }
+
 def update_prompt_log(prompt_id, ai_response=None, status='success', error_message=None, 
                      processing_time_ms=None, token_usage=None, event_created=False, 
                      event_data=None, action_type=None):
@@ -207,6 +278,16 @@ def update_prompt_log(prompt_id, ai_response=None, status='success', error_messa
             update_data['event_data'] = event_data
         if action_type is not None:
             update_data['action_type'] = action_type
+
+        log = g.get('prompt_logs', {}).get(prompt_id) if has_request_context() else None
+        if log is not None:
+            log.update(update_data)
+            return log.row
+
+        if log_sink.sink is not None:
+            log_sink.sink.update(prompt_id, update_data)
+            return update_data
+
             
         result = supabase.table('prompts').update(update_data).eq('id', prompt_id).execute()
         return result.data[0] if result.data else None
@@ -214,19 +295,24 @@ def update_prompt_log(prompt_id, ai_response=None, status='success', error_messa
     except Exception as e:
         return None
 
-def get_user_prompts(user_email, limit=50, offset=0):
-    """Get prompts for a specific user"""
+# Every prompts column except prompt_text, for list views that don't show it
+PROMPT_LIST_COLUMNS = ','.join([
+    'id', 'user_id', 'user_email', 'ai_response', 'action_type', 'status', 'error_message',
+    'user_timezone', 'processing_time_ms', 'token_usage', 'event_created', 'event_data',
+    'ip_address', 'user_agent', 'created_at', 'updated_at'
+])
+
+def get_user_prompts(user_email, limit=50, offset=0, include_text=True):
+    """Get prompts for a specific user; include_text=False skips fetching and decrypting prompt_text"""
     if not supabase:
         return []
         
     try:
-        result = supabase.table('prompts').select('*').eq('user_email', user_email).order('created_at', desc=True).limit(limit).offset(offset).execute()
-        encryptor = PromptEncryptor()
-        for prompt in result.data:
-            try:
-                prompt['prompt_text'] = encryptor.decrypt(prompt['prompt_text'])
-            except Exception:
-                prompt['prompt_text'] = '[decryption failed]'
+        columns = '*' if include_text else PROMPT_LIST_COLUMNS
+        result = supabase.table('prompts').select(columns).eq('user_email', user_email).order('created_at', desc=True).limit(limit).offset(offset).execute()
+        if include_text:
+            prompt_migration.schedule([dict(prompt) for prompt in result.data])
+            PromptEncryptor().decrypt_rows(result.data)
         return result.data
     except Exception as e:
         return []
@@ -252,8 +338,264 @@ def require_tokens():
     tokens = session.get('tokens')
     if not tokens:
         abort(401, "Login required")
+    token_refresh.track(tokens)
     return tokens
 
+@app.before_request
+def start_background_workers():
+    # Started lazily so each forked worker gets its own thread
+    token_refresh.start_background_refresher()
+
+def _sse(event, data):
+    """One server-sent event frame."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def budget_user(user_id, tokens):
+    """Who a prompt's LLM tokens are charged to: the database user, else the Google account."""
+    return str(user_id) if user_id else calendar_pool.user_key(tokens)
+
+
+def wants_stream(data):
+    """Streaming is opt-in: {"stream": true} in the body or an event-stream Accept header."""
+    return bool(data.get("stream")) or request.accept_mimetypes.best == "text/event-stream"
+
+
+def open_prompt_log(user_email, user_id, prompt, user_tz):
+    """
+    Open the request's prompt log before the model runs, so a slow request gets
+    its write-ahead copy (see prompt_log.py). Returns the row id, or None.
+    """
+    try:
+        log_row = create_prompt_log(
+            user_email=user_email,
+            user_id=user_id,
+            prompt_text=PromptEncryptor().encrypt(prompt),
+            status='processing',
+            user_timezone=user_tz,
+            ip_address=str(request.remote_addr),
+            user_agent=request.headers.get('User-Agent', '')
+        )
+        return log_row.get('id') if log_row else None
+    except Exception as log_error:
+        return None
+
+
+def parse_prompt(prompt, user_tz, user_id, tokens, token_usage):
+    """Parse the prompt with the model, charging the user's token budget"""
+    return main.promptToEvent(prompt, user_tz, user_id=budget_user(user_id, tokens), usage=token_usage)
+
+
+def finish_prompt_log(prompt_log_id, ai_response, body, status_code, start_time, token_usage, log_fields):
+    """Record how the request ended on its prompt log"""
+    if not prompt_log_id:
+        return
+    error_message = log_fields.pop('error_message', None)
+    if status_code != 200 and not error_message:
+        error_message = body.get("error") or body.get("message")
+    try:
+        update_prompt_log(
+            prompt_id=prompt_log_id,
+            ai_response=ai_response or None,
+            status='success' if status_code == 200 else 'error',
+            error_message=error_message,
+            processing_time_ms=int((time.time() - start_time) * 1000),
+            # The column predates per-model usage; it holds the total token count
+            token_usage=token_usage.get('total_tokens') or None,
+            **log_fields
+        )
+    except Exception as log_error:
+        pass
+
+
+def prompt_stages(tokens, data, ai_response, log_fields):
+    """
+    Carry out a parsed prompt. A generator: it yields (event, data) as each
+    stage finishes (`conflicts`, `created`, `events` per page, `deleted`) and
+    returns the (body, status_code) /prompt responds with. The JSON endpoint
+    runs it to the end; the streaming one sends each event as it comes.
+    Prompt log fields are added to log_fields.
+    """
+    try:
+        if ai_response.get("budget_exceeded"):
+            return {"error": ai_response["message"]}, 429
+
+        if "action_type" not in ai_response:
+            return {"error": "Invalid response format from AI service"}, 400
+
+        action_type = ai_response["action_type"]
+        log_fields['action_type'] = action_type
+        if action_type == "create":
+            return (yield from create_stage(tokens, data, ai_response, log_fields))
+        if action_type == "view":
+            return (yield from view_stage(tokens, data, ai_response, log_fields))
+        if action_type == "delete":
+            return (yield from delete_stage(tokens, data, ai_response, log_fields))
+
+        log_fields['error_message'] = f"Unsupported action type: {action_type}"
+        return {"error": "Unsupported action type"}, 400
+
+    except Exception as e:
+        log_fields['error_message'] = f"An unexpected error occurred: {str(e)}"
+        return {"error": "An unexpected error occurred. Please try again."}, 500
+
+
+def run_stages(stages):
+    """Run prompt_stages to the end without sending its events; returns (body, status_code)"""
+    while True:
+        try:
+            next(stages)
+        except StopIteration as done:
+            return done.value
+
+
+def create_stage(tokens, data, response_dict, log_fields):
+    if "eventParams" not in response_dict or "eventCompletion" not in response_dict:
+        return {"error": "Invalid event creation parameters"}, 400
+
+    event_params = response_dict["eventParams"]
+    if not isinstance(event_params, list) or not event_params:
+        return {"error": "Invalid event parameters format"}, 400
+
+    for params in event_params:
+        params["timeZone"] = data["userTimeZone"]
+    event_data = event_params[0] if len(event_params) == 1 else event_params
+    log_fields['event_data'] = event_data
+
+    try:
+        conflicts = None
+        if data.get("checkConflicts", CONFLICT_CHECK_ENABLED):
+            conflict_result, _ = main.checkConflicts(token_info=tokens, events=event_params)
+            conflicts = conflict_result.get("conflicts", [])
+            yield "conflicts", conflicts
+
+        print("Event data to formatEvent:", event_data)
+        if len(event_params) == 1:
+            result, _ = main.formatEvent(token_info=tokens, event=event_data)
+        else:
+            # Several events: create them all in one Calendar batch request
+            result, _ = main.formatEvents(token_info=tokens, events=event_params)
+        print("Result from formatEvent:", result)
+        yield "created", result
+    except Exception as e:
+        return {"error": f"Error processing event: {str(e)}"}, 400
+
+    if not result or not (result.get("success", False) or result.get("partial", False)):
+        log_fields['error_message'] = f"Failed to create event: {result}"
+        return {"error": "Failed to create event"}, 400
+
+    log_fields['event_created'] = True
+    if result.get("partial", False):
+        log_fields['error_message'] = result.get("message")
+        body = {
+            "message": result["message"],
+            "success": False,
+            "partial": True,
+            "error": f"Only {result['message'].lower()}",
+            "results": result["results"]
+        }
+        status_code = 207
+    else:
+        body = {"message": response_dict["eventCompletion"], "success": True}
+        if "results" in result:
+            body["results"] = result["results"]
+        status_code = 200
+    if conflicts is not None:
+        body["conflicts"] = conflicts
+    return body, status_code
+
+
+def view_stage(tokens, data, response_dict, log_fields):
+    query_details = response_dict.get("query_details")
+    if query_details is None:
+        return {"error": "Missing event query parameters"}, 400
+    log_fields['event_data'] = query_details
+
+    found = []
+    try:
+        for page in main.streamEvents(token_info=tokens, query_details=query_details, user_tz=data["userTimeZone"]):
+            found.extend(page)
+            yield "events", page
+    except Exception as e:
+        return {"error": f"Error finding events: {str(e)}"}, 400
+
+    return {
+        "success": True,
+        "message": f"Found {len(found)} events." if found else "No events found for the specified criteria.",
+        "events": found
+    }, 200
+
+
+def delete_stage(tokens, data, response_dict, log_fields):
+    query_details = response_dict.get("query_details")
+    if query_details is None:
+        return {"error": "Missing event query parameters for deletion"}, 400
+    log_fields['event_data'] = query_details
+
+    try:
+        # First find the event to get its ID
+        find_result, _ = main.findEvent(token_info=tokens, query_details=query_details, user_tz=data["userTimeZone"])
+        if not (find_result.get("success") and find_result.get("events")):
+            return {"success": False, "message": "No matching event found to delete"}, 404
+
+        # Delete the first matching event
+        delete_result, _ = main.deleteEvent(
+            token_info=tokens,
+            eventId=find_result["events"][0].get("id"),
+            calendarId=query_details.get("calendarId", "primary")
+        )
+    except Exception as e:
+        return {"error": f"Error deleting event: {str(e)}"}, 400
+
+    yield "deleted", delete_result
+    return delete_result, 200 if delete_result.get("success") else 400
+
+
+def stream_prompt(tokens, data, user_email, user_id, should_log, response_headers, start_time):
+    """
+    Server-sent-events variant of /prompt. Emits `intent` once the prompt is
+    parsed, then each event prompt_stages yields as its stage finishes, and
+    always ends with `done` carrying the same body and status the JSON endpoint
+    would have returned.
+    """
+    prompt = data["prompt"]
+    user_tz = data["userTimeZone"]
+
+    # The session is saved before the body streams, so refresh now; a token
+    # refreshed mid-stream is still published to the shared store for the next request
+    token_refresh.ensure_fresh(tokens)
+    session['tokens'] = tokens
+
+    def generate():
+        prompt_log_id = open_prompt_log(user_email, user_id, prompt, user_tz) if should_log else None
+        token_usage = {}
+        log_fields = {}
+        ai_response = None
+
+        try:
+            ai_response = parse_prompt(prompt, user_tz, user_id, tokens, token_usage)
+            yield _sse("intent", ai_response)
+
+            stages = prompt_stages(tokens, data, ai_response, log_fields)
+            while True:
+                try:
+                    event, payload = next(stages)
+                except StopIteration as done:
+                    body, status_code = done.value
+                    break
+                yield _sse(event, payload)
+        except Exception as e:
+            # Same body as the JSON endpoint's 500, so the client still gets its `done`
+            log_fields['error_message'] = f"An unexpected error occurred: {str(e)}"
+            body, status_code = {"error": "An unexpected error occurred. Please try again."}, 500
+
+        yield _sse("done", {"status": status_code, "body": body})
+        finish_prompt_log(prompt_log_id, ai_response, body, status_code, start_time, token_usage, log_fields)
+
+    headers = dict(response_headers)
+    headers.update({"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+
 @app.route("/prompt", methods=["POST", "OPTIONS"])
 def onboard():
     # Handle OPTIONS preflight
@@ -329,357 +671,24 @@ def onboard():
             
             return jsonify({"error": error_msg}), 400, response_headers
 
+        if wants_stream(data):
+            return stream_prompt(tokens, data, user_email, user_id, should_log, response_headers, start_time)
+
         prompt = data["prompt"]
         user_tz = data["userTimeZone"]
 
-        # Send plain prompt to AI
-        ai_response = main.promptToEvent(prompt, user_tz)
-        print("AI response:", ai_response)
-
-        # Encrypt only for storage
-        encryptor = PromptEncryptor()
-        encrypted_prompt = encryptor.encrypt(prompt)
-
-        # Create initial prompt log entry only if user is authenticated
-        if should_log:
-            try:
-                prompt_log = create_prompt_log(
-                    user_email=user_email,
-                    user_id=user_id,
-                    prompt_text=encrypted_prompt,
-                    status='processing',
-                    user_timezone=user_tz,
-                    ip_address=str(request.remote_addr),
-                    user_agent=request.headers.get('User-Agent', '')
-                )
-                prompt_log_id = prompt_log.get('id') if prompt_log else None
-            except Exception as log_error:
-                prompt_log_id = None
-        else:
-            prompt_log_id = None
-
-        processing_time_ms = int((time.time() - start_time) * 1000)
-
-        # Determine status and error message
-        if isinstance(ai_response, dict) and "error" in ai_response:
-            status = "error"
-            error_message = ai_response.get("error")
-        else:
-            status = "success"
-            error_message = None
-
-        # Update prompt log with final status, response, and processing time
-        if prompt_log_id:
-            try:
-                update_prompt_log(
-                    prompt_id=prompt_log_id,
-                    ai_response=ai_response,
-                    status=status,
-                    error_message=error_message,
-                    processing_time_ms=processing_time_ms,
-                    action_type=ai_response.get("action_type") if isinstance(ai_response, dict) else None,
-                    event_data=ai_response.get("eventParams") if isinstance(ai_response, dict) else None
-                )
-            except Exception as log_error:
-                pass
-
-        response_dict = ai_response
-        if "action_type" not in response_dict:
-            error_msg = "Invalid response format from AI service"
-            
-            if prompt_log_id:
-                update_prompt_log(
-                    prompt_id=prompt_log_id,
-                    ai_response=response_dict,
-                    status='error',
-                    error_message=error_msg,
-                    processing_time_ms=processing_time_ms
-                )
-            
-            return jsonify({"error": error_msg}), 400, response_headers
-
-        action_type = response_dict["action_type"]
-        event_created = False
-        event_data = None
+        prompt_log_id = open_prompt_log(user_email, user_id, prompt, user_tz) if should_log else None
 
-        if action_type == "create":
-            if "eventParams" not in response_dict or "eventCompletion" not in response_dict:
-                error_msg = "Invalid event creation parameters"
-                
-                if prompt_log_id:
-                    update_prompt_log(
-                        prompt_id=prompt_log_id,
-                        ai_response=response_dict,
-                        status='error',
-                        error_message=error_msg,
-                        processing_time_ms=processing_time_ms
-                    )
-                
-                return jsonify({"error": error_msg}), 400, response_headers
-
-            eventParams = response_dict["eventParams"]
-            if isinstance(eventParams, list) and len(eventParams) > 0:
-                event_data = eventParams[0]
-                event_data["timeZone"] = user_tz
-
-                try:
-                    print("Event data to formatEvent:", event_data)
-                    # Pass session to formatEvent
-                    result, refreshed_tokens = main.formatEvent(token_info=tokens, event=event_data)
-                    session['tokens'] = refreshed_tokens
-                    print("Result from formatEvent:", result)
-                    processing_time_ms = int((time.time() - start_time) * 1000)
-                    
-                    if result and result.get("success", False):
-                        event_created = True
-                        message = response_dict["eventCompletion"]
-                        
-                        # Update prompt log with success
-                        if prompt_log_id:
-                            try:
-                                update_prompt_log(
-                                    prompt_id=prompt_log_id,
-                                    ai_response=response_dict,
-                                    status='success',
-                                    processing_time_ms=processing_time_ms,
-                                    event_created=True,
-                                    event_data=event_data,
-                                    action_type=action_type
-                                )
-                            except Exception as log_error:
-                                pass
-                        
-                        return jsonify({"message": message, "success": True}), 200, response_headers
-                    else:
-                        error_msg = f"Failed to create event: {result}"
-                        
-                        if prompt_log_id:
-                            try:
-                                update_prompt_log(
-                                    prompt_id=prompt_log_id,
-                                    ai_response=response_dict,
-                                    status='error',
-                                    error_message=error_msg,
-                                    processing_time_ms=processing_time_ms,
-                                    event_data=event_data,
-                                    action_type=action_type
-                                )
-                            except Exception as log_error:
-                                pass
-                        
-                        return jsonify({"error": "Failed to create event"}), 400, response_headers
-                        
-                except Exception as e:
-                    processing_time_ms = int((time.time() - start_time) * 1000)
-                    error_msg = f"Error processing event: {str(e)}"
-                    
-                    if prompt_log_id:
-                        try:
-                            update_prompt_log(
-                                prompt_id=prompt_log_id,
-                                ai_response=response_dict,
-                                status='error',
-                                error_message=error_msg,
-                                processing_time_ms=processing_time_ms,
-                                event_data=event_data,
-                                action_type=action_type
-                            )
-                        except Exception as log_error:
-                            pass
-                    
-                    return jsonify({"error": error_msg}), 400, response_headers
-            else:
-                processing_time_ms = int((time.time() - start_time) * 1000)
-                error_msg = "Invalid event parameters format"
-                
-                if prompt_log_id:
-                    try:
-                        update_prompt_log(
-                            prompt_id=prompt_log_id,
-                            ai_response=response_dict,
-                            status='error',
-                            error_message=error_msg,
-                            processing_time_ms=processing_time_ms,
-                            action_type=action_type
-                        )
-                    except Exception as log_error:
-                        pass
-                
-                return jsonify({"error": error_msg}), 400, response_headers
-
-        elif action_type == "view":
-            if "query_details" not in response_dict:
-                error_msg = "Missing event query parameters"
-                
-                if prompt_log_id:
-                    try:
-                        update_prompt_log(
-                            prompt_id=prompt_log_id,
-                            ai_response=response_dict,
-                            status='error',
-                            error_message=error_msg,
-                            processing_time_ms=processing_time_ms,
-                            action_type=action_type
-                        )
-                    except Exception as log_error:
-                        pass
-                
-                return jsonify({"error": error_msg}), 400, response_headers
-
-            query_details = response_dict["query_details"]
-
-            try:
-                # Pass session to findEvent
-                view_result , refreshed_tokens = main.findEvent(token_info=tokens, query_details=query_details, user_tz=user_tz)
-                session['tokens'] = refreshed_tokens
-                processing_time_ms = int((time.time() - start_time) * 1000)
-                
-                # Update prompt log with success
-                if prompt_log_id:
-                    try:
-                        update_prompt_log(
-                            prompt_id=prompt_log_id,
-                            ai_response=response_dict,
-                            status='success',
-                            processing_time_ms=processing_time_ms,
-                            action_type=action_type,
-                            event_data=query_details
-                        )
-                    except Exception as log_error:
-                        pass
-                
-                return jsonify(view_result), 200, response_headers
-                
-            except Exception as e:
-                processing_time_ms = int((time.time() - start_time) * 1000)
-                error_msg = f"Error finding events: {str(e)}"
-                
-                if prompt_log_id:
-                    try:
-                        update_prompt_log(
-                            prompt_id=prompt_log_id,
-                            ai_response=response_dict,
-                            status='error',
-                            error_message=error_msg,
-                            processing_time_ms=processing_time_ms,
-                            action_type=action_type
-                        )
-                    except Exception as log_error:
-                        pass
-                
-                return jsonify({"error": error_msg}), 400, response_headers
-
-        elif action_type == "delete":
-            if "query_details" not in response_dict:
-                error_msg = "Missing event query parameters for deletion"
-                
-                if prompt_log_id:
-                    try:
-                        update_prompt_log(
-                            prompt_id=prompt_log_id,
-                            ai_response=response_dict,
-                            status='error',
-                            error_message=error_msg,
-                            processing_time_ms=processing_time_ms,
-                            action_type=action_type
-                        )
-                    except Exception as log_error:
-                        pass
-                
-                return jsonify({"error": error_msg}), 400, response_headers
-
-            query_details = response_dict["query_details"]
-            
-            try:
-                # First find the event to get its ID
-                find_result, refreshed_tokens = main.findEvent(token_info=tokens, query_details=query_details, user_tz=user_tz)
-                session['tokens'] = refreshed_tokens
-                
-                if find_result.get("success") and find_result.get("events") and len(find_result["events"]) > 0:
-                    # Delete the first matching event
-                    event_to_delete = find_result["events"][0]
-                    delete_result, refreshed_tokens = main.deleteEvent(
-                        token_info=tokens,
-                        eventId=event_to_delete.get("id"),
-                        calendarId=query_details.get("calendarId", "primary")
-                    )
-                    session['tokens'] = refreshed_tokens
-                    
-                    processing_time_ms = int((time.time() - start_time) * 1000)
-                    
-                    # Update prompt log
-                    if prompt_log_id:
-                        try:
-                            update_prompt_log(
-                                prompt_id=prompt_log_id,
-                                ai_response=response_dict,
-                                status='success' if delete_result.get("success") else 'error',
-                                error_message=delete_result.get("error") if not delete_result.get("success") else None,
-                                processing_time_ms=processing_time_ms,
-                                action_type=action_type,
-                                event_data=query_details
-                            )
-                        except Exception as log_error:
-                            pass
-                    
-                    return jsonify(delete_result), 200 if delete_result.get("success") else 400, response_headers
-                else:
-                    error_msg = "No matching event found to delete"
-                    
-                    if prompt_log_id:
-                        try:
-                            update_prompt_log(
-                                prompt_id=prompt_log_id,
-                                ai_response=response_dict,
-                                status='error',
-                                error_message=error_msg,
-                                processing_time_ms=int((time.time() - start_time) * 1000),
-                                action_type=action_type
-                            )
-                        except Exception as log_error:
-                            pass
-                    
-                    return jsonify({
-                        "success": False,
-                        "message": error_msg
-                    }), 404, response_headers
-                    
-            except Exception as e:
-                processing_time_ms = int((time.time() - start_time) * 1000)
-                error_msg = f"Error deleting event: {str(e)}"
-                
-                if prompt_log_id:
-                    try:
-                        update_prompt_log(
-                            prompt_id=prompt_log_id,
-                            ai_response=response_dict,
-                            status='error',
-                            error_message=error_msg,
-                            processing_time_ms=processing_time_ms,
-                            action_type=action_type
-                        )
-                    except Exception as log_error:
-                        pass
-                
-                return jsonify({"error": error_msg}), 400, response_headers
+        token_usage = {}
+        ai_response = parse_prompt(prompt, user_tz, user_id, tokens, token_usage)
+        print("AI response:", ai_response)
 
-        else:
-            error_msg = f"Unsupported action type: {action_type}"
-            
-            if prompt_log_id:
-                try:
-                    update_prompt_log(
-                        prompt_id=prompt_log_id,
-                        ai_response=response_dict,
-                        status='error',
-                        error_message=error_msg,
-                        processing_time_ms=processing_time_ms,
-                        action_type=action_type
-                    )
-                except Exception as log_error:
-                    pass
-            
-            return jsonify({"error": "Unsupported action type"}), 400, response_headers
+        log_fields = {}
+        body, status_code = run_stages(prompt_stages(tokens, data, ai_response, log_fields))
+        # The Calendar calls refresh tokens in place
+        session['tokens'] = tokens
+        finish_prompt_log(prompt_log_id, ai_response, body, status_code, start_time, token_usage, log_fields)
+        return jsonify(body), status_code, response_headers
 
     except Exception as e:
         processing_time_ms = int((time.time() - start_time) * 1000)
@@ -810,6 +819,7 @@ def auth_callback():
             'id_token': tokens.get('id_token'),
             'expires_at': time.time() + tokens.get('expires_in', 3600)
         }
+        token_refresh.track(session['tokens'])
         
         # Ensure session is saved before redirect
         session.modified = True
@@ -905,6 +915,14 @@ def check_auth():
         })
 
     tokens = session['tokens']
+    try:
+        # Renew an expired token: adopt one the background refresher or another request
+        # already published, or else refresh it here (once per user across workers)
+        if token_refresh.ensure_fresh(tokens, margin=0):
+            session.modified = True
+        token_refresh.track(tokens)
+    except Exception as e:
+        logger.warning(f"Token refresh during check-auth failed: {e}")
     if time.time() > tokens.get('expires_at', 0):
         return jsonify({
             'authenticated': False,
@@ -939,6 +957,8 @@ def check_auth():
 def api_logout():
     try:
         user_email = session.get('user', {}).get('email')
+        # The background refresher must not keep renewing a logged-out session
+        token_refresh.untrack(session.get('tokens'))
         session.clear()
         response = jsonify({
             "success": True,
@@ -1209,8 +1229,10 @@ def get_user_prompt_history():
         limit = min(int(request.args.get('limit', 20)), 100)  # Max 100 per page
         offset = (page - 1) * limit
         
+        include_text = request.args.get('include_text', 'true').lower() != 'false'
+        
         user_email = user['email']
-        prompts = get_user_prompts(user_email, limit=limit, offset=offset)
+        prompts = get_user_prompts(user_email, limit=limit, offset=offset, include_text=include_text)
         
         # Get total count for pagination
         if supabase:
@@ -1251,6 +1273,7 @@ def get_prompt_details(prompt_id):
         
         encryptor = PromptEncryptor()
         prompt = result.data[0]
+        prompt_migration.schedule([dict(prompt)])
         try:
             prompt['prompt_text'] = encryptor.decrypt(prompt['prompt_text'])
         except Exception:
@@ -1319,8 +1342,13 @@ def get_all_prompts():
         page = int(request.args.get('page', 1))
         limit = min(int(request.args.get('limit', 50)), 100)  # Max 100 per page
         offset = (page - 1) * limit
+        # Prompt text is only decrypted when asked for
+        include_text = request.args.get('include_text', 'false').lower() == 'true'
         
         result = supabase.table('prompts').select('*').order('created_at', desc=True).limit(limit).offset(offset).execute()
+        if include_text:
+            prompt_migration.schedule([dict(prompt) for prompt in result.data])
+            PromptEncryptor().decrypt_rows(result.data)
         
         # Get total count
         count_result = supabase.table('prompts').select('id', count='exact').execute()
@@ -1339,20 +1367,49 @@ def get_all_prompts():
     except Exception as e:
         return jsonify({"error": "Failed to retrieve prompts"}), 500
 
+@app.route('/api/admin/metrics', methods=['GET'])
+def get_metrics():
+    """This worker's cache, pool, retry, model and logging counters (admin endpoint)"""
+    # Note: You should add proper admin authentication here
+    return jsonify({
+        'pid': os.getpid(),
+        'fastpath': fastpath.stats(),
+        'prompt_cache': prompt_cache.cache.stats(),
+        'models': model_router.stats(),
+        'calendar_pool': dict(calendar_pool.pool.stats),
+        'calendar_retries': calendar_policy.stats(),
+        'event_cache': dict(event_cache.cache.stats),
+        'freebusy_cache': dict(freebusy.cache.stats),
+        'token_refresh': dict(token_refresh.stats),
+        'log_sink': log_sink.sink.metrics() if log_sink.sink is not None else None,
+        'prompt_logs': dict(prompt_log.stats),
+        'prompt_migration': dict(prompt_migration.stats)
+    })
+
 
 
 class PromptEncryptor:
     def __init__(self):
-        key = os.environ.get('PROMPT_ENCRYPTION_KEY')
-        if not key:
+        # The keyring is read and built once per process, not per request
+        try:
+            self.keyring = sec.get_keyring()
+        except ValueError:
             raise Exception("PROMPT_ENCRYPTION_KEY not set in environment variables.")
-        self.fernet = Fernet(key.encode())
 
     def encrypt(self, text):
-        return base64.b64encode(self.fernet.encrypt(text.encode())).decode()
+        # The compact token itself; it is already urlsafe base64
+        return self.keyring.encrypt_text(text)
 
     def decrypt(self, token):
-        return self.fernet.decrypt(base64.b64decode(token.encode())).decode()
+        # Reads both the compact form and the older base64-wrapped one
+        return self.keyring.decrypt_text(token)
+
+    def decrypt_rows(self, rows):
+        """Decrypt prompt_text in place across a page of rows, in parallel for larger pages"""
+        texts = self.keyring.decrypt_many(row.get('prompt_text') for row in rows)
+        for row, text in zip(rows, texts):
+            row['prompt_text'] = text if text is not None else '[decryption failed]'
+        return rows
 
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", 5001)), debug=False)
\ No newline at end of file
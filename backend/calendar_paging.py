@@ -0,0 +1,60 @@
+"""
+Lazy, paginated iteration over Calendar events().list results.
+
+Pages are fetched only as the caller consumes them, following nextPageToken,
+and `fields` partial responses keep each page down to the attributes we use.
+"""
+
+import os
+from typing import Any, Dict, Iterator, List, Optional
+
+from retry_policy import calendar_policy
+
+EVENTS_PAGE_SIZE = int(os.getenv('EVENTS_PAGE_SIZE', 50))
+
+# Partial-response mask covering everything the app reads from an event
+EVENT_FIELDS = 'id,status,summary,description,location,start,end,htmlLink'
+LIST_FIELDS = f'items({EVENT_FIELDS}),nextPageToken,nextSyncToken,timeZone'
+
+
+def iter_event_pages(service, page_size: int = EVENTS_PAGE_SIZE, fields: Optional[str] = LIST_FIELDS,
+                     **params) -> Iterator[Dict[str, Any]]:
+    """Yield raw events().list response pages, one API call per page."""
+    page_token = None
+    while True:
+        page = calendar_policy.execute(service.events().list(
+            maxResults=page_size,
+            pageToken=page_token,
+            fields=fields,
+            **params
+        ), name='events.list')
+        yield page
+        page_token = page.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def iter_events(service, max_results: Optional[int] = None, page_size: int = EVENTS_PAGE_SIZE,
+                fields: Optional[str] = LIST_FIELDS, **params) -> Iterator[Dict[str, Any]]:
+    """Yield events one by one across pages, stopping after max_results if given."""
+    if max_results:
+        page_size = min(page_size, max_results)
+    count = 0
+    for page in iter_event_pages(service, page_size=page_size, fields=fields, **params):
+        for event in page.get('items', []):
+            yield event
+            count += 1
+            if max_results and count >= max_results:
+                return
+
+
+def chunked(events: Iterator[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Group an event stream into lists of at most `size` events."""
+    chunk = []
+    for event in events:
+        chunk.append(event)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,219 @@
+"""
+Per-user pool of Google Calendar service objects.
+
+Building a service with googleapiclient.discovery.build() parses the discovery
+document and creates a fresh HTTP transport (new TCP + TLS handshake) every
+time. The pool keeps a small number of ready-to-use services per user so
+repeat requests reuse the parsed resource tree and keep-alive connections.
+
+httplib2 transports are not thread-safe, so services are leased exclusively:
+a lease takes an idle service (or builds one), and returns it to the pool
+when the caller is done.
+
+The Calendar v3 discovery document is pinned in discovery/calendar.v3.json and
+loaded once at import, so building a service never fetches or re-reads it.
+Call warm_up() before serving traffic to pre-build spare services.
+
+Run `python calendar_pool.py` to compare cold and warm service build times.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Dict
+
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.errors import HttpError
+
+import replay
+from retry_policy import HTTP_TIMEOUT
+
+POOL_MAX_USERS = int(os.getenv('CALENDAR_POOL_MAX_USERS', 256))
+POOL_MAX_PER_USER = int(os.getenv('CALENDAR_POOL_MAX_PER_USER', 4))
+POOL_IDLE_TTL = float(os.getenv('CALENDAR_POOL_IDLE_TTL', 300))
+POOL_WARM_SPARES = int(os.getenv('CALENDAR_POOL_WARM_SPARES', 4))
+
+DISCOVERY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'discovery', 'calendar.v3.json')
+
+with open(DISCOVERY_PATH, 'r', encoding='utf-8') as _f:
+    DISCOVERY_DOCUMENT = json.load(_f)
+
+
+def user_key(token_info: Dict[str, Any]) -> str:
+    """
+    Stable pool key for a user. The refresh token survives access-token
+    refreshes, so it is preferred; tokens are hashed so they never sit in
+    memory as dict keys.
+    """
+    secret = token_info.get('refresh_token') or token_info.get('access_token') or ''
+    return hashlib.sha256(secret.encode('utf-8')).hexdigest()
+
+
+class _PooledService:
+    def __init__(self, service, http: AuthorizedHttp):
+        self.service = service
+        self.http = http
+        self.last_used = time.monotonic()
+
+    def close(self):
+        try:
+            self.http.http.close()
+        except Exception:
+            pass
+
+
+class CalendarServicePool:
+    """Bounded LRU pool of Calendar services with idle-TTL eviction."""
+
+    def __init__(self, max_users: int = POOL_MAX_USERS, max_per_user: int = POOL_MAX_PER_USER,
+                 idle_ttl: float = POOL_IDLE_TTL):
+        self.max_users = max_users
+        self.max_per_user = max_per_user
+        self.idle_ttl = idle_ttl
+        self._idle = OrderedDict()  # user key -> deque of idle _PooledService
+        self._spares = deque()  # pre-built services not yet bound to a user
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def _build(self, credentials) -> _PooledService:
+        transport = replay.calendar_http(HTTP_TIMEOUT) or httplib2.Http(timeout=HTTP_TIMEOUT)
+        http = AuthorizedHttp(credentials, http=transport)
+        service = build_from_document(DISCOVERY_DOCUMENT, http=http)
+        return _PooledService(service, http)
+
+    def _checkout(self, key: str, credentials) -> _PooledService:
+        now = time.monotonic()
+        entry = None
+        with self._lock:
+            idle = self._idle.get(key)
+            while idle:
+                candidate = idle.pop()
+                if now - candidate.last_used <= self.idle_ttl:
+                    entry = candidate
+                    break
+                candidate.close()
+                self.stats['evictions'] += 1
+            if idle is not None:
+                self._idle.move_to_end(key)
+            self.stats['hits' if entry else 'misses'] += 1
+            if entry is None and self._spares:
+                entry = self._spares.pop()
+
+        if entry is None:
+            return self._build(credentials)
+
+        # Credentials may have been refreshed since this service was pooled
+        entry.http.credentials = credentials
+        return entry
+
+    def _checkin(self, key: str, entry: _PooledService):
+        entry.last_used = time.monotonic()
+        evicted = []
+        with self._lock:
+            idle = self._idle.setdefault(key, deque())
+            self._idle.move_to_end(key)
+            if len(idle) < self.max_per_user:
+                idle.append(entry)
+            else:
+                evicted.append(entry)
+            evicted.extend(self._evict_locked(entry.last_used))
+        for stale in evicted:
+            stale.close()
+
+    def _evict_locked(self, now: float):
+        evicted = []
+        # Drop whole users beyond the LRU bound
+        while len(self._idle) > self.max_users:
+            _, idle = self._idle.popitem(last=False)
+            evicted.extend(idle)
+        # Drop services that have sat idle too long, oldest users first
+        for key in list(self._idle):
+            idle = self._idle[key]
+            while idle and now - idle[0].last_used > self.idle_ttl:
+                evicted.append(idle.popleft())
+            if not idle:
+                del self._idle[key]
+        self.stats['evictions'] += len(evicted)
+        return evicted
+
+    @contextmanager
+    def lease(self, key: str, credentials):
+        """Lease a Calendar service for `key`, returning it to the pool afterwards."""
+        entry = self._checkout(key, credentials)
+        try:
+            yield entry.service
+        except HttpError:
+            # A complete error response was read; the transport is still usable
+            self._checkin(key, entry)
+            raise
+        except BaseException:
+            # The transport may be mid-response (or a streaming caller stopped
+            # early); don't hand it to the next caller
+            entry.close()
+            raise
+        else:
+            self._checkin(key, entry)
+
+    def warm_up(self, spares: int = POOL_WARM_SPARES):
+        """Pre-build unbound services so the first requests skip schema setup."""
+        built = [self._build(None) for _ in range(spares)]
+        for entry in built:
+            # Touch the resources the app uses so their method tables exist
+            entry.service.events()
+            entry.service.calendarList()
+            entry.service.freebusy()
+        with self._lock:
+            self._spares.extend(built)
+
+    def clear(self):
+        with self._lock:
+            entries = [entry for idle in self._idle.values() for entry in idle]
+            entries.extend(self._spares)
+            self._idle.clear()
+            self._spares.clear()
+        for entry in entries:
+            entry.close()
+
+
+pool = CalendarServicePool()
+
+
+def warm_up():
+    pool.warm_up()
+
+
+if __name__ == '__main__':
+    # Startup benchmark: discovery-based build() as used before pinning,
+    # build_from_document() with the pinned document, and a pooled lease.
+    runs = 50
+
+    started = time.perf_counter()
+    for _ in range(runs):
+        build('calendar', 'v3', http=httplib2.Http(), cache_discovery=False)
+    cold_ms = (time.perf_counter() - started) * 1000 / runs
+
+    started = time.perf_counter()
+    for _ in range(runs):
+        build_from_document(DISCOVERY_DOCUMENT, http=httplib2.Http())
+    pinned_ms = (time.perf_counter() - started) * 1000 / runs
+
+    bench_pool = CalendarServicePool()
+    started = time.perf_counter()
+    bench_pool.warm_up(spares=1)
+    warm_up_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    for _ in range(runs):
+        with bench_pool.lease('bench', None):
+            pass
+    lease_ms = (time.perf_counter() - started) * 1000 / runs
+
+    print(f"build() with discovery lookup: {cold_ms:.3f} ms/service")
+    print(f"build_from_document() pinned:  {pinned_ms:.3f} ms/service")
+    print(f"warm_up() one spare:           {warm_up_ms:.3f} ms")
+    print(f"pooled lease after warm-up:    {lease_ms:.3f} ms/lease")
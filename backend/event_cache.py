@@ -0,0 +1,220 @@
+"""
+Local per-user, per-calendar event store kept fresh with Calendar sync tokens.
+
+The first read for a calendar does a full sync of a window around today
+(EVENT_CACHE_LOOKBACK_DAYS back, EVENT_CACHE_LOOKAHEAD_DAYS ahead). After that
+Google hands back a nextSyncToken, and later reads only pull what changed
+since the last sync. View queries inside the synced window are answered from
+memory through an interval index; anything outside it, or any sync failure,
+returns None so the caller falls back to a live events().list call.
+"""
+
+import datetime
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import pytz
+from googleapiclient.errors import HttpError
+
+from calendar_paging import iter_event_pages
+from interval_index import IntervalIndex
+
+EVENT_CACHE_ENABLED = os.getenv('EVENT_CACHE_ENABLED', 'true').lower() == 'true'
+EVENT_CACHE_MAX_CALENDARS = int(os.getenv('EVENT_CACHE_MAX_CALENDARS', 512))
+# Seconds an incremental sync stays fresh before the next read syncs again
+EVENT_CACHE_FRESHNESS = float(os.getenv('EVENT_CACHE_FRESHNESS', 30))
+# A store older than this is rebuilt with a full sync so its window keeps up with today
+EVENT_CACHE_MAX_AGE = float(os.getenv('EVENT_CACHE_MAX_AGE', 6 * 3600))
+EVENT_CACHE_LOOKBACK_DAYS = int(os.getenv('EVENT_CACHE_LOOKBACK_DAYS', 7))
+EVENT_CACHE_LOOKAHEAD_DAYS = int(os.getenv('EVENT_CACHE_LOOKAHEAD_DAYS', 90))
+
+SYNC_PAGE_SIZE = 250
+
+
+def _parse_instant(value: Dict[str, Any], tz) -> Optional[datetime.datetime]:
+    """Convert an event start/end ({dateTime} or all-day {date}) to a UTC datetime."""
+    if not value:
+        return None
+    if value.get('dateTime'):
+        return datetime.datetime.fromisoformat(value['dateTime']).astimezone(datetime.timezone.utc)
+    if value.get('date'):
+        day = datetime.date.fromisoformat(value['date'])
+        return tz.localize(datetime.datetime.combine(day, datetime.time.min)).astimezone(datetime.timezone.utc)
+    return None
+
+
+class CalendarStore:
+    def __init__(self, calendar_id: str):
+        self.calendar_id = calendar_id
+        self.lock = threading.Lock()
+        self.events: Dict[str, Dict[str, Any]] = {}
+        self.index = IntervalIndex()
+        self.sync_token: Optional[str] = None
+        self.time_zone = pytz.utc
+        self.window_start: Optional[datetime.datetime] = None
+        self.window_end: Optional[datetime.datetime] = None
+        self.full_synced_at = 0.0
+        self.synced_at = 0.0
+        self.stale = True
+
+    def reset(self):
+        self.events = {}
+        self.index.clear()
+        self.sync_token = None
+        self.window_start = None
+        self.window_end = None
+        self.full_synced_at = 0.0
+        self.stale = True
+
+    def covers(self, time_min: datetime.datetime, time_max: datetime.datetime) -> bool:
+        return (self.sync_token is not None
+                and self.window_start is not None
+                and self.window_start <= time_min
+                and time_max <= self.window_end)
+
+    def apply(self, items: List[Dict[str, Any]]):
+        for item in items:
+            event_id = item.get('id')
+            if not event_id:
+                continue
+            if item.get('status') == 'cancelled':
+                self.events.pop(event_id, None)
+                self.index.delete(event_id)
+                continue
+            start, end = self.bounds(item)
+            if start is None:
+                self.events.pop(event_id, None)
+                self.index.delete(event_id)
+                continue
+            self.events[event_id] = item
+            self.index.insert(event_id, start.timestamp(), end.timestamp())
+
+    def bounds(self, event: Dict[str, Any]):
+        start = _parse_instant(event.get('start'), self.time_zone)
+        end = _parse_instant(event.get('end'), self.time_zone) or start
+        return start, end
+
+
+class EventCache:
+    def __init__(self, max_calendars: int = EVENT_CACHE_MAX_CALENDARS):
+        self.max_calendars = max_calendars
+        self._stores = OrderedDict()  # (user key, calendar id) -> CalendarStore
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'full_syncs': 0, 'incremental_syncs': 0, 'invalidations': 0}
+
+    def _count(self, field: str):
+        # gthread workers read the cache from many threads at once
+        with self._lock:
+            self.stats[field] += 1
+
+    def _store(self, user_key: str, calendar_id: str) -> CalendarStore:
+        key = (user_key, calendar_id)
+        with self._lock:
+            store = self._stores.get(key)
+            if store is None:
+                store = self._stores[key] = CalendarStore(calendar_id)
+            self._stores.move_to_end(key)
+            while len(self._stores) > self.max_calendars:
+                self._stores.popitem(last=False)
+            return store
+
+    def invalidate(self, user_key: str, calendar_id: str = 'primary'):
+        """Mark a calendar stale after we write to it, so the next read syncs first."""
+        with self._lock:
+            store = self._stores.get((user_key, calendar_id))
+        if store is not None:
+            store.stale = True
+            self._count('invalidations')
+
+    def _list_all(self, service, store: CalendarStore, **params) -> str:
+        """Page through events().list, applying every page; returns the nextSyncToken."""
+        page = {}
+        for page in iter_event_pages(service, page_size=SYNC_PAGE_SIZE, calendarId=store.calendar_id,
+                                     singleEvents=True, **params):
+            if page.get('timeZone'):
+                store.time_zone = pytz.timezone(page['timeZone'])
+            store.apply(page.get('items', []))
+        return page.get('nextSyncToken')
+
+    def _full_sync(self, service, store: CalendarStore):
+        store.reset()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        window_start = now - datetime.timedelta(days=EVENT_CACHE_LOOKBACK_DAYS)
+        window_end = now + datetime.timedelta(days=EVENT_CACHE_LOOKAHEAD_DAYS)
+        sync_token = self._list_all(
+            service, store,
+            timeMin=window_start.isoformat(),
+            timeMax=window_end.isoformat()
+        )
+        store.sync_token = sync_token
+        store.window_start = window_start
+        store.window_end = window_end
+        store.full_synced_at = store.synced_at = time.monotonic()
+        store.stale = False
+        self._count('full_syncs')
+
+    def _incremental_sync(self, service, store: CalendarStore):
+        try:
+            store.sync_token = self._list_all(service, store, syncToken=store.sync_token)
+        except HttpError as e:
+            if e.resp is not None and e.resp.status == 410:
+                # Sync token invalidated by Google; start over
+                logging.info(f"Sync token expired for calendar {store.calendar_id}; doing a full sync")
+                self._full_sync(service, store)
+                return
+            raise
+        store.synced_at = time.monotonic()
+        store.stale = False
+        self._count('incremental_syncs')
+
+    def _refresh(self, service, store: CalendarStore):
+        now = time.monotonic()
+        if not store.full_synced_at or now - store.full_synced_at > EVENT_CACHE_MAX_AGE:
+            self._full_sync(service, store)
+        elif store.sync_token and (store.stale or now - store.synced_at > EVENT_CACHE_FRESHNESS):
+            self._incremental_sync(service, store)
+
+    def query(self, service, user_key: str, calendar_id: str, time_min: datetime.datetime,
+              time_max: datetime.datetime, title: Optional[str] = None,
+              limit: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Events overlapping [time_min, time_max), ordered by start time, optionally
+        filtered by a case-insensitive title match. Returns None when the cache
+        can't answer and the caller should query the API directly.
+        """
+        if not EVENT_CACHE_ENABLED:
+            return None
+        store = self._store(user_key, calendar_id)
+        with store.lock:
+            try:
+                self._refresh(service, store)
+            except Exception as e:
+                logging.warning(f"Event cache sync failed for calendar {calendar_id}: {e}")
+                store.reset()
+                self._count('misses')
+                return None
+
+            if not store.covers(time_min, time_max):
+                self._count('misses')
+                return None
+
+            needle = title.lower() if title else None
+            events = []
+            for event_id in store.index.overlapping(time_min.timestamp(), time_max.timestamp()):
+                event = store.events[event_id]
+                if needle and not any(needle in (event.get(field) or '').lower()
+                                      for field in ('summary', 'description', 'location')):
+                    continue
+                events.append(event)
+                if limit and len(events) >= limit:
+                    break
+
+        self._count('hits')
+        return events
+
+
+cache = EventCache()
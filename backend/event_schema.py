@@ -0,0 +1,150 @@
+"""
+Schema for the event parser's output, and a local validator for it.
+
+The same schema is handed to the model (as a tool's parameters, or as a
+json_schema response format) so it can only answer in the expected shape, and
+every answer is checked here before app.py acts on it. jsonschema isn't a
+dependency, so validation is written out for the fields that matter:
+action_type, eventParams and query_details.
+"""
+
+import datetime
+import re
+from typing import Any, Dict, List
+
+ACTION_TYPES = ("create", "view", "delete")
+
+_DATETIME = {"type": "string", "description": "YYYY-MM-DDTHH:MM:SS+HH:MM in the user's time zone"}
+
+EVENT_PARSER_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "action_type": {"type": "string", "enum": list(ACTION_TYPES)},
+        "eventParams": {
+            "type": "array",
+            "description": "Events to create (create only)",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "summary": {"type": "string"},
+                    "description": {"type": "string"},
+                    "start": _DATETIME,
+                    "end": _DATETIME,
+                    "calendarId": {"type": "string"}
+                },
+                "required": ["summary", "start", "end"]
+            }
+        },
+        "eventCompletion": {
+            "type": "string",
+            "description": "Short confirmation of the created events (create only)"
+        },
+        "query_details": {
+            "type": "object",
+            "description": "Which events to view or delete (view/delete only)",
+            "properties": {
+                "date": {"type": "string", "description": "YYYY-MM-DD"},
+                "title": {"type": "string"},
+                "start": _DATETIME,
+                "end": _DATETIME,
+                "calendarId": {"type": "string"}
+            }
+        }
+    },
+    "required": ["action_type"]
+}
+
+EVENT_PARSER_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "calendar_request",
+        "description": "Record what the user wants to do with their calendar.",
+        "parameters": EVENT_PARSER_SCHEMA
+    }
+}
+
+_DATE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+def _check_datetime(value: Any, field: str, errors: List[str]):
+    if not isinstance(value, str):
+        errors.append(f"{field} must be a string")
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        errors.append(f"{field} is not an ISO-8601 datetime: {value!r}")
+        return None
+    if parsed.tzinfo is None:
+        errors.append(f"{field} has no UTC offset: {value!r}")
+        return None
+    return parsed
+
+
+def _check_event(event: Any, index: int, errors: List[str]):
+    field = f"eventParams[{index}]"
+    if not isinstance(event, dict):
+        errors.append(f"{field} must be an object")
+        return
+    if not isinstance(event.get("summary"), str) or not event["summary"].strip():
+        errors.append(f"{field}.summary is required")
+    if not isinstance(event.get("description", ""), str):
+        errors.append(f"{field}.description must be a string")
+    start = _check_datetime(event.get("start"), f"{field}.start", errors)
+    end = _check_datetime(event.get("end"), f"{field}.end", errors)
+    if start and end and end <= start:
+        errors.append(f"{field}.end must be after start")
+
+
+def _check_query(query: Any, errors: List[str]):
+    if not isinstance(query, dict):
+        errors.append("query_details is required and must be an object")
+        return
+    if not any(query.get(key) for key in ("date", "title", "start", "end")):
+        errors.append("query_details needs at least one of date, title, start, end")
+    date = query.get("date")
+    if date:
+        if not isinstance(date, str) or not _DATE.match(date):
+            errors.append(f"query_details.date must be YYYY-MM-DD: {date!r}")
+        else:
+            try:
+                datetime.date.fromisoformat(date)
+            except ValueError:
+                errors.append(f"query_details.date is not a real date: {date!r}")
+    for key in ("start", "end"):
+        if query.get(key):
+            _check_datetime(query[key], f"query_details.{key}", errors)
+    if query.get("title") is not None and not isinstance(query["title"], str):
+        errors.append("query_details.title must be a string")
+
+
+def validate(result: Any) -> List[str]:
+    """Everything wrong with a parsed result; an empty list means app.py can act on it."""
+    if not isinstance(result, dict):
+        return ["response must be a JSON object"]
+    errors: List[str] = []
+    action_type = result.get("action_type")
+    if action_type not in ACTION_TYPES:
+        return [f"action_type must be one of {', '.join(ACTION_TYPES)}"]
+    if action_type == "create":
+        events = result.get("eventParams")
+        if not isinstance(events, list) or not events:
+            errors.append("eventParams must be a non-empty list")
+        else:
+            for index, event in enumerate(events):
+                _check_event(event, index, errors)
+        if not isinstance(result.get("eventCompletion"), str):
+            errors.append("eventCompletion is required")
+    else:
+        _check_query(result.get("query_details"), errors)
+    return errors
+
+
+def apply_defaults(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill the optional fields app.py expects (calendarId, description) in place."""
+    for event in result.get("eventParams") or []:
+        event.setdefault("calendarId", "primary")
+        event.setdefault("description", "")
+    if isinstance(result.get("query_details"), dict):
+        result["query_details"].setdefault("calendarId", "primary")
+    return result
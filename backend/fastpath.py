@@ -0,0 +1,264 @@
+"""
+Rule-based parser for simple prompts, tried before the LLM.
+
+Handles the common shapes of traffic:
+    "dentist tomorrow at 5pm", "gym on friday from 7am to 8:30am",
+    "what's on tomorrow", "show my calendar for oct 21",
+    "cancel dentist on friday at 5pm"
+and returns the same JSON contract promptToEvent gets from the model
+(action_type + eventParams / query_details). The whole prompt has to match one
+pattern; anything ambiguous (no am/pm, midnight, "next friday", several events,
+recurrence, a time already past today...) returns None so the caller falls
+back to the LLM.
+"""
+
+import datetime
+import re
+import threading
+from typing import Any, Dict, Optional
+
+import pytz
+
+_WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+_MONTHS = {
+    'jan': 1, 'january': 1, 'feb': 2, 'february': 2, 'mar': 3, 'march': 3, 'apr': 4, 'april': 4,
+    'may': 5, 'jun': 6, 'june': 6, 'jul': 7, 'july': 7, 'aug': 8, 'august': 8,
+    'sep': 9, 'sept': 9, 'september': 9, 'oct': 10, 'october': 10, 'nov': 11, 'november': 11,
+    'dec': 12, 'december': 12,
+}
+
+_MONTH = '|'.join(sorted(_MONTHS, key=len, reverse=True))
+_ORD = r'(?:st|nd|rd|th)?'
+DAY = (
+    r'(?:today|tonight|tomorrow|(?:the )?day after tomorrow'
+    r'|(?:this )?(?:monday|tuesday|wednesday|thursday|friday|saturday|sunday)'
+    rf'|(?:{_MONTH})\.? \d{{1,2}}{_ORD}|(?:the )?\d{{1,2}}{_ORD} of (?:{_MONTH})'
+    r'|\d{4}-\d{2}-\d{2})'
+)
+TIME = r'(?:\d{1,2}(?::\d{2})? ?(?:am|pm|a\.m\.|p\.m\.)|(?:[01]?\d|2[0-3]):\d{2}|noon|midnight)'
+WHEN = rf'(?:(?:at|@) {TIME}|from {TIME} (?:to|until|till|-) {TIME})'
+DURATION = r'for (?:(?P<dur_n>\d+(?:\.\d+)?|an|a|one|half an) ?(?P<dur_unit>hours?|hrs?|h|minutes?|mins?|m))'
+
+_CREATE_PREFIX = r'(?:(?:schedule|add|create|book|set up|put|plan)(?: me)? (?:an? )?)?'
+_CREATE_PATTERNS = [
+    re.compile(rf'^{_CREATE_PREFIX}(?P<title>.+?) (?:on )?(?P<day>{DAY}) (?P<when>{WHEN})(?: {DURATION})?$'),
+    re.compile(rf'^{_CREATE_PREFIX}(?P<title>.+?) (?P<when>{WHEN}) (?:on )?(?P<day>{DAY})(?: {DURATION})?$'),
+]
+_VIEW_PATTERN = re.compile(
+    r'^(?:what(?:\'s|s| is)(?: on)?(?: my)?(?: calendar| schedule| agenda)?'
+    r'|what do i have(?: on| going on| planned| scheduled)?'
+    r'|what have i got(?: on)?'
+    r'|show(?: me)?(?: my)?(?: calendar| schedule| events| agenda)?'
+    r'|list(?: my)?(?: events)?)'
+    rf'(?: for| on)? (?P<day>{DAY})$'
+)
+_DELETE_PATTERN = re.compile(
+    rf'^(?:delete|cancel|remove) (?:my |the )?(?P<title>.+?) (?:on |for )?(?P<day>{DAY})(?: (?:at|@) (?P<time>{TIME}))?$'
+)
+_TIME_PARTS = re.compile(r'^(?P<h>\d{1,2})(?::(?P<m>\d{2}))? ?(?P<ampm>am|pm|a\.m\.|p\.m\.)?$')
+
+# Words that suggest more than one event, recurrence, or anything else the rules can't express
+_COMPLEX_WORDS = re.compile(r'\b(?:and|then|every|each|daily|weekly|monthly|yearly|except|remind|also|both)\b|[,;&+]')
+_NOT_A_TITLE = re.compile(r"^(?:what|whats|what's|when|where|who|why|how|show|list|do|does|did|am|is|are|any|can|could|should|delete|cancel|remove|move|reschedule)\b")
+# A time inside the title means the prompt's time landed in the wrong group ("delete my 3pm meeting tomorrow")
+_TIME_IN_TITLE = re.compile(rf'(?<!\w){TIME}(?!\w)')
+_VAGUE_TITLES = {'everything', 'all', 'all events', 'all my events', 'events', 'event', 'it', 'that', 'something'}
+
+_stats_lock = threading.Lock()
+_stats = {'attempts': 0, 'hits': 0}
+
+
+def stats() -> Dict[str, Any]:
+    with _stats_lock:
+        attempts, hits = _stats['attempts'], _stats['hits']
+    return {'attempts': attempts, 'hits': hits, 'hit_rate': round(hits / attempts, 4) if attempts else 0.0}
+
+
+def _record(hit: bool):
+    with _stats_lock:
+        _stats['attempts'] += 1
+        if hit:
+            _stats['hits'] += 1
+
+
+def _normalize(prompt: str) -> str:
+    """Collapse whitespace and trailing punctuation, keeping the user's casing."""
+    text = re.sub(r'\s+', ' ', prompt.strip().replace('’', "'"))
+    return text.rstrip('?.! ')
+
+
+def _resolve_day(phrase: str, today: datetime.date) -> Optional[datetime.date]:
+    phrase = phrase.strip()
+    if phrase in ('today', 'tonight'):
+        return today
+    if phrase == 'tomorrow':
+        return today + datetime.timedelta(days=1)
+    if phrase.endswith('day after tomorrow'):
+        return today + datetime.timedelta(days=2)
+    weekday = phrase.replace('this ', '')
+    if weekday in _WEEKDAYS:
+        return today + datetime.timedelta(days=(_WEEKDAYS.index(weekday) - today.weekday()) % 7)
+    match = re.match(r'^\d{4}-\d{2}-\d{2}$', phrase)
+    if match:
+        return datetime.date.fromisoformat(phrase)
+    match = re.match(rf'^(?P<month>{_MONTH})\.? (?P<day>\d{{1,2}}){_ORD}$', phrase) or \
+        re.match(rf'^(?:the )?(?P<day>\d{{1,2}}){_ORD} of (?P<month>{_MONTH})$', phrase)
+    if match:
+        month, day = _MONTHS[match.group('month')], int(match.group('day'))
+        for year in (today.year, today.year + 1):
+            try:
+                candidate = datetime.date(year, month, day)
+            except ValueError:
+                return None
+            # A month/day with no year means the next one that hasn't passed
+            if candidate >= today:
+                return candidate
+    return None
+
+
+def _resolve_time(phrase: str) -> Optional[datetime.time]:
+    phrase = phrase.strip()
+    if phrase == 'noon':
+        return datetime.time(12, 0)
+    if phrase == 'midnight':
+        return None  # the start or the end of the day; the model asks or decides
+    match = _TIME_PARTS.match(phrase)
+    if not match:
+        return None
+    hour, minute = int(match.group('h')), int(match.group('m') or 0)
+    ampm = (match.group('ampm') or '').replace('.', '')
+    if ampm:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if ampm == 'pm' else 0)
+    elif not match.group('m'):
+        return None  # a bare "5" could be 5am or 5pm
+    if hour > 23 or minute > 59:
+        return None
+    return datetime.time(hour, minute)
+
+
+def _duration(match) -> Optional[datetime.timedelta]:
+    if not match.group('dur_n'):
+        return datetime.timedelta(hours=1)
+    amount = match.group('dur_n')
+    amount = {'an': 1, 'a': 1, 'one': 1, 'half an': 0.5}.get(amount, amount)
+    amount = float(amount)
+    unit = match.group('dur_unit')
+    if unit.startswith('h'):
+        return datetime.timedelta(hours=amount)
+    return datetime.timedelta(minutes=amount)
+
+
+def _title(match, original: str) -> Optional[str]:
+    """The title group, cut from the original prompt so the user's casing survives."""
+    title = original[match.start('title'):match.end('title')].strip()
+    if title.lower().startswith(('a ', 'an ')):
+        title = title.split(' ', 1)[1]
+    if len(title) < 2 or title.lower() in _VAGUE_TITLES or len(title.split()) > 8:
+        return None
+    if _TIME_IN_TITLE.search(title.lower()):
+        return None
+    return title[0].upper() + title[1:]
+
+
+def _parse_create(text: str, original: str, tz, now: datetime.datetime) -> Optional[Dict[str, Any]]:
+    if _NOT_A_TITLE.match(text):
+        return None
+    for pattern in _CREATE_PATTERNS:
+        match = pattern.match(text)
+        if match:
+            break
+    else:
+        return None
+
+    title = _title(match, original)
+    day = _resolve_day(match.group('day'), now.date())
+    if not title or not day:
+        return None
+
+    when = match.group('when')
+    if when.startswith('from '):
+        start_phrase, end_phrase = re.split(r' (?:to|until|till|-) ', when[5:], maxsplit=1)
+        start_time, end_time = _resolve_time(start_phrase), _resolve_time(end_phrase)
+        if match.group('dur_n') or not start_time or not end_time:
+            return None
+    else:
+        start_time, end_time = _resolve_time(when.split(' ', 1)[1]), None
+        if not start_time:
+            return None
+
+    start = tz.localize(datetime.datetime.combine(day, start_time))
+    if end_time:
+        end = tz.localize(datetime.datetime.combine(day, end_time))
+    else:
+        end = tz.normalize(start + _duration(match))
+    # Past times and ranges that wrap past midnight are for the model to sort out
+    if start <= now or end <= start:
+        return None
+
+    return {
+        "action_type": "create",
+        "eventParams": [{
+            "summary": title,
+            "description": "",
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "calendarId": "primary"
+        }],
+        "eventCompletion": f"{title} is scheduled for {start.strftime('%A, %B')} {start.day} at {start.strftime('%I:%M %p').lstrip('0')}."
+    }
+
+
+def _parse_view(text: str, now: datetime.datetime) -> Optional[Dict[str, Any]]:
+    match = _VIEW_PATTERN.match(text)
+    if not match:
+        return None
+    day = _resolve_day(match.group('day'), now.date())
+    if not day:
+        return None
+    return {
+        "action_type": "view",
+        "query_details": {"date": day.isoformat(), "calendarId": "primary"}
+    }
+
+
+def _parse_delete(text: str, original: str, tz, now: datetime.datetime) -> Optional[Dict[str, Any]]:
+    match = _DELETE_PATTERN.match(text)
+    if not match:
+        return None
+    title = _title(match, original)
+    day = _resolve_day(match.group('day'), now.date())
+    if not title or not day:
+        return None
+    query_details = {"date": day.isoformat(), "title": title, "calendarId": "primary"}
+    if match.group('time'):
+        start_time = _resolve_time(match.group('time'))
+        if not start_time:
+            return None
+        query_details["start"] = tz.localize(datetime.datetime.combine(day, start_time)).isoformat()
+    return {"action_type": "delete", "query_details": query_details}
+
+
+def parse(prompt: str, user_tz: str, now: Optional[datetime.datetime] = None) -> Optional[Dict[str, Any]]:
+    """
+    Parse a simple prompt without the LLM. Returns the promptToEvent JSON contract,
+    or None when the prompt isn't confidently one of the supported shapes.
+    """
+    result = None
+    try:
+        tz = pytz.timezone(user_tz)
+        now = now.astimezone(tz) if now else datetime.datetime.now(tz)
+        original = _normalize(prompt)
+        text = original.lower()
+        if len(text) != len(original):
+            original = text  # casing changed the length; spans wouldn't line up
+        if text and not _COMPLEX_WORDS.search(text):
+            result = _parse_view(text, now) or _parse_delete(text, original, tz, now)
+            # A question is never a request to create something
+            if result is None and not prompt.strip().endswith('?'):
+                result = _parse_create(text, original, tz, now)
+    except (pytz.UnknownTimeZoneError, ValueError):
+        result = None
+    _record(result is not None)
+    return result
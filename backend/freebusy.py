@@ -0,0 +1,161 @@
+"""
+Free/busy lookups for conflict detection.
+
+One freebusy.query call covers every calendar the user has, for whole UTC
+days around the events being checked. Busy blocks from all calendars are
+merged into disjoint intervals locally, and each new event is checked
+against them with a bisect instead of listing full events.
+"""
+
+import bisect
+import datetime
+import os
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+from retry_policy import calendar_policy
+
+FREEBUSY_TTL = float(os.getenv('FREEBUSY_TTL', 60))
+CALENDAR_LIST_TTL = float(os.getenv('CALENDAR_LIST_TTL', 300))
+FREEBUSY_MAX_ENTRIES = int(os.getenv('FREEBUSY_MAX_ENTRIES', 1024))
+# freebusy.query accepts at most 50 calendars per call
+FREEBUSY_MAX_CALENDARS = 50
+
+Interval = Tuple[datetime.datetime, datetime.datetime]
+
+
+def merge_intervals(intervals: List[Interval]) -> List[Interval]:
+    """Merge overlapping or touching intervals into a sorted, disjoint list."""
+    merged: List[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def overlaps(busy: List[Interval], start: datetime.datetime, end: datetime.datetime) -> List[Interval]:
+    """Busy intervals (from a merged, sorted list) that overlap [start, end)."""
+    position = bisect.bisect_right(busy, (start,))
+    # The interval just before `start` may still run into the window
+    if position > 0 and busy[position - 1][1] > start:
+        position -= 1
+    found = []
+    while position < len(busy) and busy[position][0] < end:
+        if busy[position][1] > start:
+            found.append(busy[position])
+        position += 1
+    return found
+
+
+def _parse(value: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value).astimezone(datetime.timezone.utc)
+
+
+class FreeBusyCache:
+    def __init__(self, ttl: float = FREEBUSY_TTL, max_entries: int = FREEBUSY_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._busy: Dict[tuple, Tuple[float, List[Interval]]] = {}
+        self._calendars: Dict[str, Tuple[float, List[str]]] = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def invalidate(self, user_key: str):
+        with self._lock:
+            for key in [key for key in self._busy if key[0] == user_key]:
+                del self._busy[key]
+
+    def _calendar_ids(self, service, user_key: str) -> List[str]:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._calendars.get(user_key)
+        if cached and now - cached[0] < CALENDAR_LIST_TTL:
+            return cached[1]
+
+        ids = []
+        page_token = None
+        while True:
+            page = calendar_policy.execute(service.calendarList().list(
+                pageToken=page_token,
+                fields='items(id),nextPageToken'
+            ), name='calendarList.list')
+            ids.extend(item['id'] for item in page.get('items', []) if item.get('id'))
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                break
+        ids = ids[:FREEBUSY_MAX_CALENDARS] or ['primary']
+        with self._lock:
+            self._calendars[user_key] = (now, ids)
+        return ids
+
+    def busy(self, service, user_key: str, time_min: datetime.datetime,
+             time_max: datetime.datetime) -> List[Interval]:
+        """Merged busy intervals across all of the user's calendars for the whole UTC days spanning the window."""
+        day_min = datetime.datetime.combine(time_min.astimezone(datetime.timezone.utc).date(),
+                                            datetime.time.min, tzinfo=datetime.timezone.utc)
+        day_max = datetime.datetime.combine(time_max.astimezone(datetime.timezone.utc).date(),
+                                            datetime.time.min, tzinfo=datetime.timezone.utc) + datetime.timedelta(days=1)
+        key = (user_key, day_min, day_max)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._busy.get(key)
+            fresh = cached and now - cached[0] < self.ttl
+            self.stats['hits' if fresh else 'misses'] += 1
+        if fresh:
+            return cached[1]
+
+        calendar_ids = self._calendar_ids(service, user_key)
+        response = calendar_policy.execute(service.freebusy().query(body={
+            'timeMin': day_min.isoformat(),
+            'timeMax': day_max.isoformat(),
+            'items': [{'id': calendar_id} for calendar_id in calendar_ids]
+        }), name='freebusy.query')
+
+        intervals = []
+        for calendar in response.get('calendars', {}).values():
+            for block in calendar.get('busy', []):
+                intervals.append((_parse(block['start']), _parse(block['end'])))
+        merged = merge_intervals(intervals)
+
+        with self._lock:
+            if len(self._busy) >= self.max_entries:
+                # Drop the oldest entries; they expire within FREEBUSY_TTL anyway
+                for old in sorted(self._busy, key=lambda k: self._busy[k][0])[:len(self._busy) // 2 + 1]:
+                    del self._busy[old]
+            self._busy[key] = (now, merged)
+        return merged
+
+
+cache = FreeBusyCache()
+
+
+def find_conflicts(service, user_key: str, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    For each event ({summary, start, end} with ISO datetimes), the busy blocks it
+    overlaps. Events without conflicts are left out.
+    """
+    spans = []
+    for event in events:
+        try:
+            spans.append((event, _parse(event['start']), _parse(event['end'])))
+        except (KeyError, TypeError, ValueError):
+            continue
+    if not spans:
+        return []
+
+    busy = cache.busy(service, user_key, min(span[1] for span in spans), max(span[2] for span in spans))
+    conflicts = []
+    for event, start, end in spans:
+        hits = overlaps(busy, start, end)
+        if hits:
+            conflicts.append({
+                "summary": event.get("summary"),
+                "start": event["start"],
+                "end": event["end"],
+                "busy": [{"start": s.isoformat(), "end": e.isoformat()} for s, e in hits]
+            })
+    return conflicts
@@ -0,0 +1,80 @@
+"""
+Time index over cached events for overlap queries.
+
+Intervals are keyed on UTC epoch seconds. Most events are short, so they live
+in a list sorted by start: every event overlapping [a, b) then starts in
+[a - longest_short_duration, b), found with two bisects. Events longer than
+LONG_EVENT_SECONDS (multi-day all-day events, trips, ...) would widen that
+search window for everyone, so they are kept in a small side table and
+checked directly. Queries cost O(log n + k) plus the handful of long events.
+"""
+
+import bisect
+from typing import Dict, Hashable, List, Tuple
+
+LONG_EVENT_SECONDS = 24 * 3600.0
+
+
+class IntervalIndex:
+    def __init__(self, long_event_seconds: float = LONG_EVENT_SECONDS):
+        self.long_event_seconds = long_event_seconds
+        self._short: List[Tuple[float, Hashable]] = []  # (start, key), sorted
+        self._long: Dict[Hashable, Tuple[float, float]] = {}
+        self._spans: Dict[Hashable, Tuple[float, float]] = {}
+        # Upper bound on the duration of anything in _short. It only grows on
+        # insert; a stale (too large) bound costs a little scanning, never correctness.
+        self._max_short = 0.0
+
+    def __len__(self):
+        return len(self._spans)
+
+    def __contains__(self, key):
+        return key in self._spans
+
+    def clear(self):
+        self._short = []
+        self._long = {}
+        self._spans = {}
+        self._max_short = 0.0
+
+    def insert(self, key: Hashable, start: float, end: float):
+        """Add or move the interval for `key`."""
+        if key in self._spans:
+            self.delete(key)
+        end = max(start, end)
+        self._spans[key] = (start, end)
+        duration = end - start
+        if duration > self.long_event_seconds:
+            self._long[key] = (start, end)
+        else:
+            bisect.insort(self._short, (start, key))
+            self._max_short = max(self._max_short, duration)
+
+    def delete(self, key: Hashable):
+        span = self._spans.pop(key, None)
+        if span is None:
+            return
+        if self._long.pop(key, None) is not None:
+            return
+        position = bisect.bisect_left(self._short, (span[0], key))
+        if position < len(self._short) and self._short[position] == (span[0], key):
+            del self._short[position]
+        if not self._short:
+            self._max_short = 0.0
+
+    def overlapping(self, start: float, end: float) -> List[Hashable]:
+        """Keys of intervals overlapping [start, end), ordered by interval start."""
+        low = bisect.bisect_left(self._short, (start - self._max_short,))
+        high = bisect.bisect_left(self._short, (end,))
+        matches = []
+        for position in range(low, high):
+            key = self._short[position][1]
+            span = self._spans[key]
+            if span[1] > start:
+                matches.append((span[0], key))
+        for key, span in self._long.items():
+            if span[0] < end and span[1] > start:
+                matches.append((span[0], key))
+        if self._long:
+            matches.sort(key=lambda pair: pair[0])
+        return [key for _, key in matches]
@@ -0,0 +1,100 @@
+"""
+Process-wide OpenAI client.
+
+promptToEvent used to build a new OpenAI() per prompt, throwing away the HTTP
+connection pool (and TLS session) every time. The client here is created
+lazily once per process and re-created after a fork, so gunicorn workers
+never share sockets with the master. A per-worker semaphore bounds how many
+completions run at once, and every call gets an explicit timeout.
+"""
+
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+import httpx
+from openai import DefaultHttpxClient, OpenAI
+
+import replay
+
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', 30))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', 5))
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', 20))
+OPENAI_MAX_KEEPALIVE = int(os.getenv('OPENAI_MAX_KEEPALIVE', 10))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', 60))
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', 1))
+# Completions in flight per worker, and how long a prompt waits for a slot
+OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', 8))
+OPENAI_ACQUIRE_TIMEOUT = float(os.getenv('OPENAI_ACQUIRE_TIMEOUT', 10))
+
+_client: Optional[OpenAI] = None
+_client_pid: Optional[int] = None
+_semaphore = threading.BoundedSemaphore(OPENAI_MAX_CONCURRENCY)
+_lock = threading.Lock()
+
+
+class LLMBusyError(Exception):
+    """Raised when no completion slot frees up within OPENAI_ACQUIRE_TIMEOUT."""
+
+
+def _reset_after_fork():
+    global _client, _client_pid, _semaphore
+    _client = None
+    _client_pid = None
+    _semaphore = threading.BoundedSemaphore(OPENAI_MAX_CONCURRENCY)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _api_key() -> Optional[str]:
+    # The replay backend never sends the key anywhere, so it runs without one
+    return os.getenv('openai_key_v3') or ('replay' if replay.replaying() else None)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+    )
+
+
+def get_client() -> OpenAI:
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = OpenAI(
+                    api_key=_api_key(),
+                    base_url=OPENAI_BASE_URL,
+                    max_retries=OPENAI_MAX_RETRIES,
+                    http_client=DefaultHttpxClient(
+                        limits=_limits(),
+                        timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+                        transport=replay.openai_transport(_limits())
+                    )
+                )
+                _client_pid = os.getpid()
+    return _client
+
+
+def chat(messages: List[Dict[str, Any]], model: str, timeout: Optional[float] = None, **kwargs):
+    """Run a chat completion on the shared client, bounded by the worker's concurrency limit."""
+    semaphore = _semaphore
+    if not semaphore.acquire(timeout=OPENAI_ACQUIRE_TIMEOUT):
+        logging.warning("All OpenAI completion slots busy; rejecting prompt")
+        raise LLMBusyError("Too many prompts in flight, please retry shortly")
+    try:
+        return get_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            timeout=timeout or OPENAI_TIMEOUT,
+            **kwargs
+        )
+    finally:
+        semaphore.release()
+
@@ -0,0 +1,106 @@
+"""
+Per-user LLM token accounting and budgets.
+
+Every completion's usage is added to per-user day and month counters in
+Redis, and promptToEvent checks them before calling the model. That way one
+user looping on the API runs out of budget instead of eating the worker's
+completion slots. A budget of 0 means unlimited, and both budgets default to
+0, so a deployment opts in by setting them. Without Redis the counters are
+per process.
+"""
+
+import datetime
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from redis_store import get_redis
+
+LLM_DAILY_TOKEN_BUDGET = int(os.getenv('LLM_DAILY_TOKEN_BUDGET', 0))
+LLM_MONTHLY_TOKEN_BUDGET = int(os.getenv('LLM_MONTHLY_TOKEN_BUDGET', 0))
+
+_USAGE_KEY = 'calgentic:llm-usage:{}:{}'
+
+_local: Dict[str, int] = {}
+_local_lock = threading.Lock()
+
+
+class BudgetExceededError(Exception):
+    """Raised when a user has used up their daily or monthly token budget."""
+
+
+def _periods(now: Optional[datetime.datetime] = None):
+    """(day key, ttl), (month key, ttl) for the current UTC day and month."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return (
+        (now.strftime('d%Y%m%d'), 2 * 86400),
+        (now.strftime('m%Y%m'), 32 * 86400),
+    )
+
+
+def add_usage(total: Dict[str, Any], response, model: str):
+    """Add one completion's response.usage to a running total dict (prompt/completion/total tokens)."""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return
+    for field in ('prompt_tokens', 'completion_tokens', 'total_tokens'):
+        total[field] = total.get(field, 0) + (getattr(usage, field, 0) or 0)
+    total.setdefault('models', [])
+    if model not in total['models']:
+        total['models'].append(model)
+
+
+def used(user: str) -> Dict[str, int]:
+    """Tokens this user has used today and this month."""
+    (day, _), (month, _) = _periods()
+    redis = get_redis()
+    if redis is None:
+        with _local_lock:
+            return {'day': _local.get(f"{user}:{day}", 0), 'month': _local.get(f"{user}:{month}", 0)}
+    values = redis.mget(_USAGE_KEY.format(user, day), _USAGE_KEY.format(user, month))
+    return {'day': int(values[0] or 0), 'month': int(values[1] or 0)}
+
+
+def check(user: Optional[str]):
+    """Raise BudgetExceededError if the user is over their daily or monthly budget."""
+    if not user:
+        return
+    try:
+        spent = used(user)
+    except Exception as e:
+        # Never block prompts because the counters are unavailable
+        logging.warning(f"Could not read token budget: {e}")
+        return
+    if LLM_DAILY_TOKEN_BUDGET and spent['day'] >= LLM_DAILY_TOKEN_BUDGET:
+        raise BudgetExceededError("Daily AI usage limit reached, please try again tomorrow")
+    if LLM_MONTHLY_TOKEN_BUDGET and spent['month'] >= LLM_MONTHLY_TOKEN_BUDGET:
+        raise BudgetExceededError("Monthly AI usage limit reached")
+
+
+def record(user: Optional[str], usage: Dict[str, Any]):
+    """Charge a prompt's total tokens to the user's day and month counters."""
+    tokens = usage.get('total_tokens') or 0
+    if not user or not tokens:
+        return
+    periods = _periods()
+    redis = get_redis()
+    if redis is None:
+        with _local_lock:
+            for period, _ in periods:
+                key = f"{user}:{period}"
+                _local[key] = _local.get(key, 0) + tokens
+            # Drop counters from earlier days and months
+            current = {period for period, _ in periods}
+            for key in [k for k in _local if k.rsplit(':', 1)[1] not in current]:
+                del _local[key]
+        return
+    try:
+        pipe = redis.pipeline(transaction=False)
+        for period, ttl in periods:
+            key = _USAGE_KEY.format(user, period)
+            pipe.incrby(key, tokens)
+            pipe.expire(key, ttl)
+        pipe.execute()
+    except Exception as e:
+        logging.warning(f"Could not record token usage: {e}")
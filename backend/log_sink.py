@@ -0,0 +1,273 @@
+"""
+Background writer for prompt logs.
+
+/prompt used to insert a 'processing' row and then update it once or twice,
+all synchronously on the request path. Those were two or three Supabase round
+trips before the user got an answer. Now the request only queues the insert
+and updates. A worker thread folds them into one row per prompt, and once the
+request has finished (or the row is older than LOG_SINK_MAX_ROW_AGE) it writes
+finished rows in bulk upserts. A flush happens when LOG_SINK_BATCH_SIZE rows
+are ready or every LOG_SINK_FLUSH_INTERVAL seconds.
+
+The in-memory queue is bounded. When it is full, operations spill to a Redis
+list, and the worker drains that list as it catches up. Rows from a failed
+flush go there too, so another worker can pick them up. If Redis is also
+unavailable, operations are dropped and counted, so logging never blocks a
+request.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from redis_store import get_redis
+
+LOG_SINK_ENABLED = os.getenv('LOG_SINK_ENABLED', 'true').lower() == 'true'
+LOG_SINK_MAX_PENDING = int(os.getenv('LOG_SINK_MAX_PENDING', 10000))
+LOG_SINK_BATCH_SIZE = int(os.getenv('LOG_SINK_BATCH_SIZE', 100))
+LOG_SINK_FLUSH_INTERVAL = float(os.getenv('LOG_SINK_FLUSH_INTERVAL', 2))
+# Rows whose request never reported completion are written after this long anyway
+LOG_SINK_MAX_ROW_AGE = float(os.getenv('LOG_SINK_MAX_ROW_AGE', 60))
+# How long a request waits for queue space before spilling to Redis
+LOG_SINK_ENQUEUE_TIMEOUT = float(os.getenv('LOG_SINK_ENQUEUE_TIMEOUT', 0.01))
+LOG_SINK_MAX_ATTEMPTS = 3
+
+_SPILL_KEY = 'calgentic:log-sink:spill'
+# Recently written rows, so a late update can re-upsert the whole row; older
+# ones get their late updates written as a plain update by id
+_FLUSHED_MAX = 2048
+
+
+class LogSink:
+    def __init__(self, table: str = 'prompts', client_factory=None):
+        self.table = table
+        # Returns the supabase client (or None); read lazily since app.py creates it
+        self._client_factory = client_factory
+        self._queue: 'queue.Queue[tuple]' = queue.Queue(maxsize=LOG_SINK_MAX_PENDING)
+        # id -> {'row': dict, 'first_seen': float, 'complete': bool, 'attempts': int, 'partial': bool}
+        self._rows: Dict[str, Dict[str, Any]] = {}
+        self._flushed: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._last_flush = time.monotonic()
+        self._thread_pid: Optional[int] = None
+        self._lock = threading.Lock()
+        # Held by the worker while it touches _rows, and by close() at exit
+        self._rows_lock = threading.Lock()
+        self.stats = {
+            'enqueued': 0, 'coalesced': 0, 'flushed_rows': 0, 'flush_batches': 0, 'flush_errors': 0,
+            'late_updates': 0, 'spilled': 0, 'drained': 0, 'dropped': 0
+        }
+
+    # --- request side -------------------------------------------------------
+
+    def insert(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        self._put(('insert', row['id'], row))
+        return row
+
+    def update(self, row_id: str, fields: Dict[str, Any]):
+        self._put(('update', row_id, fields))
+
+    def complete(self, row_id: str):
+        """The request that owns row_id is done; its row can be written."""
+        self._put(('complete', row_id, None))
+
+    def _put(self, op: tuple):
+        self._ensure_worker()
+        try:
+            self._queue.put(op, timeout=LOG_SINK_ENQUEUE_TIMEOUT)
+            self.stats['enqueued'] += 1
+            return
+        except queue.Full:
+            pass
+        if self._spill([op]):
+            return
+        self.stats['dropped'] += 1
+        logging.warning(f"Prompt log queue full; dropped {op[0]} for {op[1]}")
+
+    def _spill(self, ops: List[tuple]) -> bool:
+        redis = get_redis()
+        if redis is None:
+            return False
+        try:
+            redis.rpush(_SPILL_KEY, *[json.dumps(op, default=str) for op in ops])
+            self.stats['spilled'] += len(ops)
+            return True
+        except Exception as e:
+            logging.warning(f"Could not spill prompt logs to Redis: {e}")
+            return False
+
+    # --- worker side --------------------------------------------------------
+
+    def _ensure_worker(self):
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            threading.Thread(target=self._run, name='log-sink', daemon=True).start()
+
+    def _apply(self, op: tuple):
+        kind, row_id, payload = op
+        entry = self._rows.get(row_id)
+        if entry is None:
+            if kind == 'complete':
+                return
+            # An update after the row was written: merge into the written copy and upsert again,
+            # or, once that copy is forgotten, hold just the changed fields for an update by id
+            flushed = self._flushed.pop(row_id, None)
+            entry = self._rows[row_id] = {
+                'row': dict(flushed) if flushed else {'id': row_id}, 'first_seen': time.monotonic(),
+                'complete': False, 'attempts': 0, 'partial': flushed is None
+            }
+        else:
+            self.stats['coalesced'] += 1
+        if kind == 'insert':
+            entry['row'] = {**payload, **{k: v for k, v in entry['row'].items() if k != 'id'}}
+            entry['partial'] = False
+        elif kind == 'update':
+            entry['row'].update(payload)
+        elif kind == 'complete':
+            entry['complete'] = True
+
+    def _drain_spill(self, room: int):
+        redis = get_redis()
+        if redis is None or room <= 0:
+            return
+        try:
+            pipe = redis.pipeline()
+            pipe.lrange(_SPILL_KEY, 0, room - 1)
+            pipe.ltrim(_SPILL_KEY, room, -1)
+            raw, _ = pipe.execute()
+        except Exception as e:
+            logging.warning(f"Could not drain spilled prompt logs: {e}")
+            return
+        for item in raw:
+            self._apply(tuple(json.loads(item)))
+        self.stats['drained'] += len(raw)
+
+    def _ready(self, force: bool) -> List[str]:
+        now = time.monotonic()
+        return [row_id for row_id, entry in self._rows.items()
+                if force or entry['complete'] or now - entry['first_seen'] >= LOG_SINK_MAX_ROW_AGE]
+
+    def flush(self, force: bool = False):
+        """Write every finished row (every row with force=True) in bulk upserts, and late updates by id."""
+        client = self._client_factory() if self._client_factory else None
+        ready = self._ready(force)
+        self._last_flush = time.monotonic()
+        if not ready:
+            return
+        if client is None:
+            for row_id in ready:
+                del self._rows[row_id]
+            return
+        # Upserting a partial row would insert it when the full row never made it,
+        # so a late update only ever updates the row that is there
+        for row_id in [row_id for row_id in ready if self._rows[row_id].get('partial')]:
+            ready.remove(row_id)
+            self._write_update(client, row_id)
+        # A bulk upsert sends one column list, so rows are grouped by the columns they set
+        groups: Dict[frozenset, List[str]] = {}
+        for row_id in ready:
+            groups.setdefault(frozenset(self._rows[row_id]['row']), []).append(row_id)
+        batches = [ids[start:start + LOG_SINK_BATCH_SIZE]
+                   for ids in groups.values() for start in range(0, len(ids), LOG_SINK_BATCH_SIZE)]
+        for batch_ids in batches:
+            rows = [self._rows[row_id]['row'] for row_id in batch_ids]
+            try:
+                client.table(self.table).upsert(rows).execute()
+            except Exception as e:
+                self.stats['flush_errors'] += 1
+                logging.warning(f"Prompt log flush of {len(rows)} rows failed: {e}")
+                self._retry_later(batch_ids)
+                continue
+            self.stats['flush_batches'] += 1
+            self.stats['flushed_rows'] += len(rows)
+            for row_id in batch_ids:
+                self._flushed[row_id] = self._rows.pop(row_id)['row']
+                if len(self._flushed) > _FLUSHED_MAX:
+                    self._flushed.popitem(last=False)
+
+    def _write_update(self, client, row_id: str):
+        fields = {k: v for k, v in self._rows[row_id]['row'].items() if k != 'id'}
+        try:
+            client.table(self.table).update(fields).eq('id', row_id).execute()
+        except Exception as e:
+            self.stats['flush_errors'] += 1
+            logging.warning(f"Late prompt log update of {row_id} failed: {e}")
+            self._retry_later([row_id])
+            return
+        self.stats['late_updates'] += 1
+        del self._rows[row_id]
+
+    def _retry_later(self, row_ids: List[str]):
+        for row_id in row_ids:
+            entry = self._rows[row_id]
+            entry['attempts'] += 1
+            if entry['attempts'] < LOG_SINK_MAX_ATTEMPTS:
+                continue
+            # Give up locally; Redis keeps it for the next worker that drains
+            del self._rows[row_id]
+            if entry.get('partial'):
+                ops = [('update', row_id, {k: v for k, v in entry['row'].items() if k != 'id'})]
+            else:
+                ops = [('insert', row_id, entry['row']), ('complete', row_id, None)]
+            if not self._spill(ops):
+                self.stats['dropped'] += 1
+
+    def _run(self):
+        while True:
+            try:
+                timeout = max(0.0, LOG_SINK_FLUSH_INTERVAL - (time.monotonic() - self._last_flush))
+                try:
+                    first = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    first = None
+                with self._rows_lock:
+                    if first is not None:
+                        self._apply(first)
+                    try:
+                        while True:
+                            self._apply(self._queue.get_nowait())
+                    except queue.Empty:
+                        pass
+                    self._drain_spill(LOG_SINK_MAX_PENDING - self._queue.qsize() - len(self._rows))
+                    due = time.monotonic() - self._last_flush >= LOG_SINK_FLUSH_INTERVAL
+                    if due or len(self._ready(False)) >= LOG_SINK_BATCH_SIZE:
+                        self.flush()
+            except Exception as e:
+                logging.warning(f"Prompt log sink error: {e}")
+                time.sleep(1)
+
+    def close(self):
+        """Apply whatever is queued and write every row; called at exit."""
+        with self._rows_lock:
+            try:
+                while True:
+                    self._apply(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                self.flush(force=True)
+            except Exception as e:
+                logging.warning(f"Final prompt log flush failed: {e}")
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self.stats, 'queue_depth': self._queue.qsize(), 'pending_rows': len(self._rows)}
+
+
+sink: Optional[LogSink] = None
+
+
+def configure(client_factory) -> LogSink:
+    """Create the process-wide sink; client_factory returns the supabase client to write with."""
+    global sink
+    sink = LogSink(client_factory=client_factory)
+    atexit.register(sink.close)
+    return sink
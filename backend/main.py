@@ -1,60 +1,101 @@
 import logging
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 import os
 import datetime
 import pytz
-import socket
-from openai import OpenAI
 from dotenv import load_dotenv
 import json
-from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from contextlib import contextmanager
+
+import calendar_pool
+import event_schema
+import llm
+import llm_budget
+import model_router
+import prompt_cache
+import event_cache
+import fastpath
+import freebusy
+import token_refresh
+from calendar_paging import EVENTS_PAGE_SIZE, chunked, iter_events
+from retry_policy import calendar_policy, is_retryable, new_event_id
 
 load_dotenv()
 
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
 
+# Most events a view/delete lookup returns; None means no cap
+EVENTS_MAX_RESULTS = int(os.getenv('EVENTS_MAX_RESULTS', 100)) or None
+# Try the rule-based parser before asking the LLM
+FASTPATH_ENABLED = os.getenv('FASTPATH_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# How the event parser's output is constrained: "tools" (forced function call),
+# "json_schema" (response_format; needs a model that supports it) or "text" (prompt only)
+LLM_OUTPUT_MODE = os.getenv('LLM_OUTPUT_MODE', 'tools').lower()
+# Follow-up calls that hand invalid output back to the model for correction
+LLM_REPAIR_ATTEMPTS = int(os.getenv('LLM_REPAIR_ATTEMPTS', 1))
+
 
 def _calendar_auth(token_info: dict) -> Credentials:
     if not token_info or 'access_token' not in token_info:
         raise ValueError("Missing tokens; user not authenticated")
 
+    # Refreshes at most once per user across requests and workers, and
+    # updates token_info in place so the caller can re-save it
+    token_refresh.ensure_fresh(token_info)
+
+    client_id, client_secret = token_refresh.client_credentials()
     creds = Credentials(
         token=token_info['access_token'],
         refresh_token=token_info.get('refresh_token'),
         token_uri="https://oauth2.googleapis.com/token",
-        client_id=os.getenv('GOOGLE_CLIENT_ID'),
-        client_secret=os.getenv('GOOGLE_CLIENT_SECRET'),
-        scopes=SCOPES
+        client_id=client_id,
+        client_secret=client_secret,
+        scopes=SCOPES,
+        expiry=token_refresh.credentials_expiry(token_info)
     )
 
-    if creds.expired and creds.refresh_token:
-        creds.refresh(Request())
-        # update the token_info dict in place so caller can re-save it
-        token_info['access_token'] = creds.token
-        token_info['expires_at']   = creds.expiry.timestamp() if creds.expiry else None
-
     return creds
 
+@contextmanager
 def _build_service(token_info: dict):
+    """Lease a pooled Calendar service for the user that owns token_info."""
     creds = _calendar_auth(token_info)
-    return build('calendar', 'v3', credentials=creds)
+    with calendar_pool.pool.lease(calendar_pool.user_key(token_info), creds) as service:
+        yield service
+
+def _invalidate_caches(token_info: dict, calendar_id: str):
+    """Drop locally cached calendar state after we change a user's calendar."""
+    key = calendar_pool.user_key(token_info)
+    event_cache.cache.invalidate(key, calendar_id)
+    freebusy.cache.invalidate(key)
+
+def _insert_event(service, calendar_id: str, body: dict) -> dict:
+    """
+    events.insert with a client-generated event id, so a retry after a timeout
+    or 5xx can't create a second copy: if an earlier attempt went through, the
+    retry gets 409 and the event is read back instead.
+    """
+    body = dict(body)
+    body.setdefault('id', new_event_id())
+    try:
+        return calendar_policy.execute(service.events().insert(calendarId=calendar_id, body=body), name='events.insert')
+    except HttpError as e:
+        if e.resp is None or e.resp.status != 409:
+            raise
+        return calendar_policy.execute(service.events().get(calendarId=calendar_id, eventId=body['id']), name='events.get')
 
 def create_event(token_info: dict, event_body: dict) -> dict:
-    service = _build_service(token_info)
-    return service.events().insert(
-        calendarId='primary',
-        body=event_body
-    ).execute()
+    with _build_service(token_info) as service:
+        return _insert_event(service, 'primary', event_body)
 
 def list_events(token_info: dict, **kwargs) -> dict:
-    service = _build_service(token_info)
-    return service.events().list(
-        calendarId='primary',
-        **kwargs
-    ).execute()
+    with _build_service(token_info) as service:
+        return calendar_policy.execute(service.events().list(
+            calendarId='primary',
+            **kwargs
+        ), name='events.list')
 
 
 def calendarAuth(session):
@@ -66,20 +107,9 @@ def calendarAuth(session):
     if not tokens or 'access_token' not in tokens:
         raise Exception("Authentication required. Please log in through the web interface.")
 
-    creds = Credentials(
-        token=tokens['access_token'],
-        refresh_token=tokens.get('refresh_token'),
-        token_uri="https://oauth2.googleapis.com/token",
-        client_id=os.getenv('GOOGLE_CLIENT_ID'),
-        client_secret=os.getenv('GOOGLE_CLIENT_SECRET'),
-        scopes=SCOPES
-    )
-
-    # Refresh if needed
-    if creds.expired and creds.refresh_token:
-        creds.refresh(Request())
-        session['tokens']['access_token'] = creds.token
-        session['tokens']['expires_at'] = creds.expiry.timestamp() if creds.expiry else None
+    # Refresh if needed; tokens is session['tokens'], updated in place
+    creds = _calendar_auth(tokens)
+    session.modified = True
 
     return creds
 
@@ -89,9 +119,6 @@ def createEvent(token_info: Dict[str, Any], summary: str, description: str, star
     Create a Google Calendar event using exactly the user's IANA timezone (user_tz).
     Returns (created_event_dict or False, updated_token_info).
     """
-    creds = _calendar_auth(token_info)
-    service = build("calendar", "v3", credentials=creds)
-
     if not summary or not start_iso:
         logging.error("Missing required parameters for createEvent")
         return False, token_info
@@ -119,64 +146,43 @@ def createEvent(token_info: Dict[str, Any], summary: str, description: str, star
 
     logging.debug(f"Event object being sent to Google: {event_body}")
 
-    original_timeout = socket.getdefaulttimeout()
-    socket.setdefaulttimeout(30)
-    max_retries = 3
-    retry_count = 0
-
-    while retry_count < max_retries:
-        try:
-            created = service.events().insert(calendarId=calendar_id, body=event_body).execute()
-            logging.info(f"Event created: {created.get('htmlLink')}")
-            socket.setdefaulttimeout(original_timeout)
-            return created, token_info
-        except socket.timeout:
-            retry_count += 1
-            logging.warning(f"Request timed out. Retry attempt {retry_count} of {max_retries}")
-            if retry_count >= max_retries:
-                logging.error("Max retries reached. Could not create event.")
-                socket.setdefaulttimeout(original_timeout)
-                return False, token_info
-        except HttpError as error:
-            logging.error(f"HTTP error occurred: {error}")
-            socket.setdefaulttimeout(original_timeout)
-            return False, token_info
-        except Exception as e:
-            logging.error(f"Unexpected error in createEvent: {e}")
-            socket.setdefaulttimeout(original_timeout)
-            return False, token_info
-
-    socket.setdefaulttimeout(original_timeout)
-    return False, token_info
+    try:
+        with _build_service(token_info) as service:
+            created = _insert_event(service, calendar_id, event_body)
+        _invalidate_caches(token_info, calendar_id)
+        logging.info(f"Event created: {created.get('htmlLink')}")
+        return created, token_info
+    except HttpError as error:
+        logging.error(f"HTTP error occurred: {error}")
+        return False, token_info
+    except Exception as e:
+        logging.error(f"Unexpected error in createEvent: {e}")
+        return False, token_info
 
 
-def getEvents(token_info, calendarId='primary', day=None):
-    """Get calendar events"""
+def getEvents(token_info, calendarId='primary', day=None, max_results=EVENTS_MAX_RESULTS, page_size=EVENTS_PAGE_SIZE):
+    """Get calendar events starting from `day`, following pages up to max_results"""
     if day is None:
         day = datetime.datetime.now(datetime.timezone.utc).isoformat()
     
-    creds = _calendar_auth(token_info)
-    service = build("calendar", "v3", credentials=creds)
-    
-    events_result = service.events().list(
-        calendarId=calendarId,
-        timeMin=day,
-        maxResults=10,
-        singleEvents=True,
-        orderBy="startTime",
-    ).execute()
-    
-    return events_result.get('items', [])
+    with _build_service(token_info) as service:
+        return list(iter_events(
+            service,
+            max_results=max_results,
+            page_size=page_size,
+            calendarId=calendarId,
+            timeMin=day,
+            singleEvents=True,
+            orderBy="startTime",
+        ))
 
 def validateCalendarId(token_info: Dict[str, Any], calId: str) -> Tuple[str, Dict[str, Any]]:
     """
     Validate if a calendar ID exists for the user.
     Returns (calId, updated_token_info) or raises ValueError.
     """
-    creds = _calendar_auth(token_info)
-    service = build("calendar", "v3", credentials=creds)
-
-    calendar_list = service.calendarList().list().execute()
+    with _build_service(token_info) as service:
+        calendar_list = calendar_policy.execute(service.calendarList().list(), name='calendarList.list')
     for calendar in calendar_list.get('items', []):
         if calendar.get('id') == calId:
             return calId, token_info
@@ -190,9 +196,9 @@ def deleteEvent(token_info: Dict[str, Any], eventId: str, calendarId: str = 'pri
     Returns (response_dict, updated_token_info).
     """
     try:
-        creds = _calendar_auth(token_info)
-        service = build('calendar', 'v3', credentials=creds)
-        service.events().delete(calendarId=calendarId, eventId=eventId).execute()
+        with _build_service(token_info) as service:
+            calendar_policy.execute(service.events().delete(calendarId=calendarId, eventId=eventId), name='events.delete')
+        _invalidate_caches(token_info, calendarId)
         return ({
             "success": True,
             "message": "Event deleted successfully"
@@ -218,127 +224,227 @@ def deleteEvent(token_info: Dict[str, Any], eventId: str, calendarId: str = 'pri
         }, token_info)
 
 
-def promptToEvent(prompt, user_tz):
-    """Convert natural language prompt to event parameters using OpenAI"""
-    try:
-        client = OpenAI(
-            api_key=os.getenv('openai_key_v3'),
-            base_url="https://api.openai.com/v1"
-        )
-        
-        # Get current date and timezone for reference
-        zone = pytz.timezone(user_tz)
-        now_local = datetime.datetime.now(zone)
-        today_str = now_local.strftime("%Y-%m-%d")
-        time_str = now_local.strftime("%H:%M:%S")
-        tz_offset = now_local.strftime("%z")
-        # Insert the colon so GPT sees "-07:00"
-        tz_offset = f"{tz_offset[:3]}:{tz_offset[3:]}"
-        
-        print(f"Local timezone offset: {tz_offset}")
-        
-        modified_prompt = f"""
-        You are a calendar assistant. Given the user's input, determine if they want to create a new event or view existing events.
-        
-        Today's date is {today_str} in the timezone {time_str} in the time zone {tz_offset} which is the users time zone as {user_tz}
-        When interpreting "tomorrow at 5pm", interpret "5pm" in exactly {user_tz} (including DST).  
-        If they want to create an event, return raw JSON only:
-        
-        When interpreting dates and times:
-        - For relative dates like "tomorrow", "next week", etc., calculate the actual date based on today's date.
-        - Always use the current year ({now_local.year}) for dates unless a specific year is mentioned.
-        - Never schedule events in the past.
-        - When a user specifies a time (like 9 AM), use that EXACT time. Do not adjust for any timezone differences.
-        - Use the user's local timezone offset of {tz_offset} in the output.
-        
-        - If they want to create an event, return the following JSON structure:
-        - factor in the timezone offset in the output, including daylight savings time, so if a user says 6 pm before DST, it should still schedule it for 6pm not for 7pm
-          
-          {{
-            "action_type": "create",
-            "eventParams": [
-              {{
-                "summary": "Event title",
-                "description": "Event details",
-                "start": "YYYY-MM-DDTHH:MM:SS{tz_offset}",
-                "end": "YYYY-MM-DDTHH:MM:SS{tz_offset}",
-                "calendarId": "primary"
-              }}
-            ],
-            "eventCompletion" : "A little summary about the event, that acts as a confirmation"
-          }}
-          
-        
-        - If they want to view an event, return:
-            - At least one of the following fields must be included: `date`, `title`, `start`, `end`, `calendarId`.
-          {{
-            "action_type": "view",
-            "query_details": {{
-                "date" : "date of the event they want to view",
-                "title" : "title of the event they want to view",
-                "start": "YYYY-MM-DDTHH:MM:SS{tz_offset}",
-                "end": "YYYY-MM-DDTHH:MM:SS{tz_offset}",
-                "calendarId": "primary"
-            }}
-          }}
-          - If they want to delete an event
-            - atleast one of the following fields must be included: `date`, `title`, `start`, `end`
-            - if calendarID is provided, then change the calendarID to the one provided, else assume it is primary
-            -if only calendarID is provided, then don't do anything. 
-            return the following JSON structure:
-          {{
-            "action_type": "delete",
-            "query_details": {{
-                "date" : "date of the event they want to view",
-                "title" : "title of the event they want to view",
-                "start": "YYYY-MM-DDTHH:MM:SS{tz_offset}",
-                "end": "YYYY-MM-DDTHH:MM:SS{tz_offset}",
-                "calendarId": "primary"
-            }}
-          }}
-        
-        Ensure the response is **valid JSON format**. Do not include markdown formatting like ```json at the beginning or ``` at the end. Just return the raw JSON.
-        
-        IMPORTANT: When the user specifies a time like "9 AM", make sure to use exactly 09:00:00 in the output, not 08:00:00 or any other time. Do not adjust the time in any way.
-        
-        User input: {prompt}
-        """
-        
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": modified_prompt}]
-        )
-        
-        if not response or not response.choices or not response.choices[0]:
-            print("Invalid response from OpenAI API")
-            return {
-                "error": "Invalid response from AI service",
-                "message": "The AI service returned an invalid response. Please try again."
-            }
-        
-        content = response.choices[0].message.content
-        print(f"data from chatgpt {content}")
-        
-        # Strip markdown code block formatting if present
-        if "```" in content:
-            content = content.replace("```json", "").replace("```", "").strip()
-        
-        # Add error handling for JSON parsing
-        try:
-            return json.loads(content)
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {e}")
-            print(f"Raw response after stripping: {content}")
-            return {
-                "error": "Invalid JSON response from ChatGPT",
-                "raw_response": content
+# Invariant instructions for the event parser. Kept byte-for-byte identical across
+# requests (nothing per-user or per-day in here) so the provider can cache the prefix;
+# everything that changes goes in the short context message built by _prompt_context().
+EVENT_PARSER_SYSTEM_PROMPT = """You are a calendar assistant. Given the user's input, determine if they want to create a new event, view existing events, or delete an event.
+
+Each request starts with a context block giving today's date, the current local time, the user's IANA time zone and its current UTC offset (e.g. -07:00). Write every datetime as YYYY-MM-DDTHH:MM:SS followed by that offset.
+
+When interpreting dates and times:
+- For relative dates like "tomorrow", "next week", etc., calculate the actual date based on today's date.
+- Always use the current year for dates unless a specific year is mentioned.
+- Never schedule events in the past.
+- Interpret times in exactly the user's time zone, including DST. When a user specifies a time (like 9 AM or 5pm), use that EXACT time: "9 AM" is 09:00:00, never 08:00:00 or any other time. Do not adjust for any timezone differences.
+- Factor in the timezone offset in the output, including daylight savings time, so if a user says 6 pm before DST, it should still schedule it for 6pm not for 7pm.
+
+If they want to create an event, return:
+{
+  "action_type": "create",
+  "eventParams": [
+    {
+      "summary": "Event title",
+      "description": "Event details",
+      "start": "YYYY-MM-DDTHH:MM:SS+HH:MM",
+      "end": "YYYY-MM-DDTHH:MM:SS+HH:MM",
+      "calendarId": "primary"
+    }
+  ],
+  "eventCompletion": "A little summary about the event, that acts as a confirmation"
+}
+
+If they want to view an event, return the structure below. At least one of `date`, `title`, `start`, `end`, `calendarId` must be included.
+{
+  "action_type": "view",
+  "query_details": {
+    "date": "date of the event they want to view",
+    "title": "title of the event they want to view",
+    "start": "YYYY-MM-DDTHH:MM:SS+HH:MM",
+    "end": "YYYY-MM-DDTHH:MM:SS+HH:MM",
+    "calendarId": "primary"
+  }
+}
+
+If they want to delete an event, return the structure below.
+- At least one of `date`, `title`, `start`, `end` must be included.
+- If a calendarId is provided, use it; otherwise assume "primary".
+- If only a calendarId is provided, don't do anything.
+{
+  "action_type": "delete",
+  "query_details": {
+    "date": "date of the event they want to delete",
+    "title": "title of the event they want to delete",
+    "start": "YYYY-MM-DDTHH:MM:SS+HH:MM",
+    "end": "YYYY-MM-DDTHH:MM:SS+HH:MM",
+    "calendarId": "primary"
+  }
+}
+
+Ensure the response is valid JSON. Do not include markdown formatting like ```json at the beginning or ``` at the end. Just return the raw JSON."""
+
+
+def _prompt_context(user_tz: str) -> Tuple[str, str]:
+    """Per-request context block for the parser, plus the user's UTC offset (e.g. "-07:00")."""
+    zone = pytz.timezone(user_tz)
+    now_local = datetime.datetime.now(zone)
+    tz_offset = now_local.strftime("%z")
+    # Insert the colon so GPT sees "-07:00"
+    tz_offset = f"{tz_offset[:3]}:{tz_offset[3:]}"
+    context = (
+        f"Today: {now_local.strftime('%Y-%m-%d')} ({now_local.strftime('%A')})\n"
+        f"Local time: {now_local.strftime('%H:%M:%S')}\n"
+        f"Time zone: {user_tz} (UTC offset {tz_offset})"
+    )
+    return context, tz_offset
+
+
+def _output_mode_kwargs() -> Dict[str, Any]:
+    """Extra chat() arguments that constrain the parser's output for LLM_OUTPUT_MODE."""
+    if LLM_OUTPUT_MODE == "tools":
+        return {
+            "tools": [event_schema.EVENT_PARSER_TOOL],
+            "tool_choice": {"type": "function", "function": {"name": "calendar_request"}}
+        }
+    if LLM_OUTPUT_MODE == "json_schema":
+        return {
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {"name": "calendar_request", "schema": event_schema.EVENT_PARSER_SCHEMA}
             }
-    except Exception as e:
-        print(f"Error in promptToEvent: {str(e)}")
+        }
+    return {}
+
+
+def _completion_content(message) -> str:
+    """The JSON text of a completion: the forced tool call's arguments, or the message body."""
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        return tool_calls[0].function.arguments or ""
+    content = message.content or ""
+    # Strip markdown code block formatting if present
+    if "```" in content:
+        content = content.replace("```json", "").replace("```", "").strip()
+    return content
+
+
+class _InvalidCompletion(Exception):
+    """The API answered without any choices."""
+
+
+def _read_completion(response, model, usage):
+    """(parsed, validation errors, raw content) for one completion."""
+    if not response or not response.choices or not response.choices[0]:
+        raise _InvalidCompletion()
+    llm_budget.add_usage(usage, response, model)
+
+    content = _completion_content(response.choices[0].message)
+    print(f"data from chatgpt {content}")
+    try:
+        parsed = json.loads(content)
+        errors = event_schema.validate(parsed)
+    except json.JSONDecodeError as e:
+        print(f"JSON parsing error: {e}")
+        parsed, errors = None, [f"not valid JSON: {e}"]
+    if errors:
+        print(f"Event parser output failed validation ({model}): {errors}")
+    return parsed, errors, content
+
+
+def _repair_messages(messages, content, errors):
+    # Show the model its own answer and what's wrong with it, rather
+    # than making the user send the whole prompt again
+    return messages + [
+        {"role": "assistant", "content": content},
+        {"role": "user", "content": "That response is invalid: " + "; ".join(errors)
+                                    + ". Reply again with the corrected JSON only."}
+    ]
+
+
+def _invalid_output(content, errors):
+    return {
+        "error": "Invalid JSON response from ChatGPT",
+        "raw_response": content,
+        "validation_errors": errors
+    }
+
+
+def _prompt_error(e: Exception) -> Dict[str, Any]:
+    print(f"Error in promptToEvent: {str(e)}")
+    if isinstance(e, _InvalidCompletion):
+        return {
+            "error": "Invalid response from AI service",
+            "message": "The AI service returned an invalid response. Please try again."
+        }
+    if isinstance(e, llm_budget.BudgetExceededError):
         return {
-            "error": "Error processing prompt",
-            "message": "An error occurred while processing the prompt"
+            "error": "Token budget exceeded",
+            "message": str(e),
+            "budget_exceeded": True
         }
+    if isinstance(e, llm.LLMBusyError):
+        return {
+            "error": "AI service busy",
+            "message": str(e)
+        }
+    return {
+        "error": "Error processing prompt",
+        "message": "An error occurred while processing the prompt"
+    }
+
+
+def promptToEvent(prompt, user_tz, user_id=None, usage=None):
+    """
+    Convert natural language prompt to event parameters using OpenAI.
+    user_id is charged for the tokens used and checked against its budget first;
+    token usage across all completions is added to the `usage` dict if one is passed.
+    """
+    usage = {} if usage is None else usage
+    try:
+        return _parse_prompt(prompt, user_tz, user_id, usage)
+    except Exception as e:
+        return _prompt_error(e)
+    finally:
+        if usage:
+            llm_budget.record(user_id, usage)
+
+
+def _parse_prompt(prompt, user_tz, user_id, usage):
+    """Fast path, cache, budget check, then the model with repair attempts."""
+    if FASTPATH_ENABLED:
+        parsed = fastpath.parse(prompt, user_tz)
+        if parsed is not None:
+            print(f"fast path parsed prompt: {parsed}")
+            return parsed
+
+    if prompt_cache.PROMPT_CACHE_ENABLED:
+        cached = prompt_cache.cache.get(prompt, user_tz, user_id)
+        if cached is not None:
+            print(f"prompt cache hit: {cached}")
+            return cached
+
+    # Only model calls cost tokens, so the fast path and cache stay open over budget
+    llm_budget.check(user_id)
+
+    context, tz_offset = _prompt_context(user_tz)
+    print(f"Local timezone offset: {tz_offset}")
+
+    messages = [
+        {"role": "system", "content": EVENT_PARSER_SYSTEM_PROMPT},
+        {"role": "user", "content": f"{context}\n\nUser input: {prompt}"}
+    ]
+    # Cheap model first for simple prompts; see model_router
+    chain = model_router.plan(prompt)
+    for attempt in range(LLM_REPAIR_ATTEMPTS + 1):
+        response, used = model_router.chat(chain, messages, **_output_mode_kwargs())
+        parsed, errors, content = _read_completion(response, chain[used], usage)
+        if not errors:
+            parsed = event_schema.apply_defaults(parsed)
+            if prompt_cache.PROMPT_CACHE_ENABLED:
+                prompt_cache.cache.put(prompt, user_tz, parsed, user_id)
+            return parsed
+        chain = model_router.escalate(chain, used)
+        messages = _repair_messages(messages, content, errors)
+    return _invalid_output(content, errors)
 
 
 def formatEvent(token_info: Dict[str, Any], event: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
@@ -355,10 +461,6 @@ def formatEvent(token_info: Dict[str, Any], event: Dict[str, Any]) -> Tuple[Dict
                 "error": f"Event data is missing '{key}'"
             }, token_info)
 
-    # Build calendar service
-    creds = _calendar_auth(token_info)
-    service = build('calendar', 'v3', credentials=creds)
-
     body = {
         'summary':     event['summary'],
         'description': event['description'],
@@ -367,7 +469,9 @@ def formatEvent(token_info: Dict[str, Any], event: Dict[str, Any]) -> Tuple[Dict
     }
 
     try:
-        created = service.events().insert(calendarId=event.get('calendarId','primary'), body=body).execute()
+        with _build_service(token_info) as service:
+            created = _insert_event(service, event.get('calendarId','primary'), body)
+        _invalidate_caches(token_info, event.get('calendarId','primary'))
         response = {
             "success": True,
             "message": "Event created successfully",
@@ -397,103 +501,285 @@ def formatEvent(token_info: Dict[str, Any], event: Dict[str, Any]) -> Tuple[Dict
         }, token_info)
 
 
+# Google caps a Calendar batch request at 50 calls
+BATCH_MAX_EVENTS = 50
 
-def findEvent(token_info: Dict[str, Any], query_details: dict, user_tz: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+def formatEvents(token_info: Dict[str, Any], events: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
     """
-    Finds events based on provided criteria in the user's timezone.
-    - query_details may include:
-        - date:       "YYYY-MM-DD"
-        - title:      string
-        - start:      full ISO-8601 string with offset (e.g. "2025-06-02T17:00:00+02:00")
-        - end:        full ISO-8601 string with offset
-        - calendarId: string (defaults to "primary")
-    - user_tz is the user's IANA timezone (e.g. "America/Los_Angeles").
-    Returns (result_dict, updated_token_info)
+    Create several Google Calendar events with one batch HTTP request.
+    Each item in response_dict["results"] has the same shape as a formatEvent response,
+    in the same order as `events`. `success` is True only if every event was created;
+    `partial` is True if some, but not all, were.
+    Returns (response_dict, updated_token_info).
     """
-    try:
-        creds = _calendar_auth(token_info)
-        service = build("calendar", "v3", credentials=creds)
-
-        # Safely pull out fields
-        date_str = query_details.get("date", None)
-        title = query_details.get("title", None)
-        start_iso = query_details.get("start", None)
-        end_iso = query_details.get("end", None)
-        cal_id = query_details.get("calendarId", "primary")
-
-        tz = pytz.timezone(user_tz)
-        timeMin = None
-        timeMax = None
-
-        # 1) If full ISO start is provided, convert from that zone to UTC
-        if start_iso:
-            start_dt_utc = datetime.datetime.fromisoformat(start_iso).astimezone(datetime.timezone.utc)
-            timeMin = start_dt_utc.isoformat()
-
-            if end_iso:
-                end_dt_utc = datetime.datetime.fromisoformat(end_iso).astimezone(datetime.timezone.utc)
-                timeMax = end_dt_utc.isoformat()
-            elif date_str:
-                date_local = datetime.datetime.fromisoformat(date_str).date()
-                start_of_day_local = tz.localize(datetime.datetime.combine(date_local, datetime.time.min))
-                end_of_day_local = tz.localize(datetime.datetime.combine(date_local, datetime.time.max))
-                timeMax = end_of_day_local.astimezone(datetime.timezone.utc).isoformat()
+    results: List[Any] = [None] * len(events)
+    pending = []
+
+    for index, event in enumerate(events):
+        missing = next((key for key in ('summary', 'description', 'start', 'end') if key not in event), None)
+        if missing:
+            results[index] = {
+                "success": False,
+                "message": f"Missing required key: {missing}",
+                "error": f"Event data is missing '{missing}'"
+            }
+        else:
+            pending.append(index)
+
+    def _callback(request_id, created, exception):
+        index = int(request_id)
+        event = events[index]
+        if exception is not None:
+            if isinstance(exception, HttpError):
+                err = exception.error_details if hasattr(exception, 'error_details') else str(exception)
             else:
-                local_date = start_dt_utc.astimezone(tz).date()
-                end_of_day_local = tz.localize(datetime.datetime.combine(local_date, datetime.time.max))
-                timeMax = end_of_day_local.astimezone(datetime.timezone.utc).isoformat()
+                err = str(exception)
+            results[index] = {
+                "success": False,
+                "message": "Failed to create event",
+                "error": err
+            }
+            return
+        results[index] = {
+            "success": True,
+            "message": "Event created successfully",
+            "event": {
+                "summary": event['summary'],
+                "description": event['description'],
+                "start": event['start'],
+                "end": event['end'],
+                "calendarId": event.get('calendarId', 'primary'),
+                "link": created.get('htmlLink', '')
+            }
+        }
+
+    # Each event gets its id up front, so a sub-request retried on its own can't duplicate one the batch created
+    bodies = {}
+    for index in pending:
+        event = events[index]
+        bodies[index] = {
+            'id':          new_event_id(),
+            'summary':     event['summary'],
+            'description': event['description'],
+            'start':       {'dateTime': event['start'], 'timeZone': event.get('timeZone', 'UTC')},
+            'end':         {'dateTime': event['end'],   'timeZone': event.get('timeZone', 'UTC')}
+        }
+    retry = []
+
+    def _batch_callback(request_id, created, exception):
+        if exception is not None and is_retryable(exception):
+            retry.append(int(request_id))
+            return
+        _callback(request_id, created, exception)
 
-        # 2) If only date (no start) is provided, interpret midnight→23:59:59 in user_tz
+    try:
+        if pending:
+            with _build_service(token_info) as service:
+                for offset in range(0, len(pending), BATCH_MAX_EVENTS):
+                    chunk = pending[offset:offset + BATCH_MAX_EVENTS]
+                    batch = service.new_batch_http_request(callback=_batch_callback)
+                    for index in chunk:
+                        batch.add(
+                            service.events().insert(calendarId=events[index].get('calendarId', 'primary'), body=bodies[index]),
+                            request_id=str(index)
+                        )
+                    try:
+                        # A batch that ran is never re-run; only its failed sub-requests are retried below
+                        calendar_policy.execute(batch, name='batch.insert', idempotent=False)
+                    except Exception as e:
+                        if not is_retryable(e):
+                            raise
+                        # Some sub-requests may have gone through before the batch failed
+                        retry.extend(index for index in chunk if results[index] is None and index not in retry)
+
+                for index in retry:
+                    try:
+                        created = _insert_event(service, events[index].get('calendarId', 'primary'), bodies[index])
+                    except Exception as e:
+                        _callback(str(index), None, e)
+                    else:
+                        _callback(str(index), created, None)
+            for calendar_id in {events[index].get('calendarId', 'primary') for index in pending}:
+                _invalidate_caches(token_info, calendar_id)
+    except Exception as e:
+        # Whatever the batch did not report on is a failure
+        for index in pending:
+            if results[index] is None:
+                results[index] = {
+                    "success": False,
+                    "message": "Error formatting event",
+                    "error": str(e)
+                }
+
+    created_count = sum(1 for result in results if result and result.get("success"))
+    failed_count = len(results) - created_count
+    return ({
+        "success": failed_count == 0 and created_count > 0,
+        "partial": created_count > 0 and failed_count > 0,
+        "message": f"Created {created_count} of {len(results)} events",
+        "created": created_count,
+        "failed": failed_count,
+        "results": results
+    }, token_info)
+
+
+def checkConflicts(token_info: Dict[str, Any], events: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Check events (as in eventParams: summary, start, end) against the user's busy time
+    on all of their calendars, using one free/busy query.
+    Returns (response_dict, updated_token_info); response_dict["conflicts"] lists each
+    conflicting event with the busy blocks it overlaps.
+    """
+    try:
+        with _build_service(token_info) as service:
+            conflicts = freebusy.find_conflicts(service, calendar_pool.user_key(token_info), events)
+        return ({
+            "success": True,
+            "message": f"{len(conflicts)} of {len(events)} events conflict with existing commitments" if conflicts else "No conflicts found",
+            "conflicts": conflicts
+        }, token_info)
+    except HttpError as error:
+        print(f"An error occurred: {error}")
+        return ({
+            "success": False,
+            "message": "Failed to check for conflicts",
+            "error": str(error),
+            "conflicts": []
+        }, token_info)
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        return ({
+            "success": False,
+            "message": "Failed to check for conflicts",
+            "error": str(e),
+            "conflicts": []
+        }, token_info)
+
+
+def _query_window(query_details: dict, user_tz: str) -> Tuple[str, str]:
+    """
+    Turn query_details (date / start / end) into a UTC (timeMin, timeMax) pair of ISO strings,
+    interpreting bare dates and the default "today" in user_tz.
+    """
+    date_str = query_details.get("date", None)
+    start_iso = query_details.get("start", None)
+    end_iso = query_details.get("end", None)
+
+    tz = pytz.timezone(user_tz)
+    timeMin = None
+    timeMax = None
+
+    # 1) If full ISO start is provided, convert from that zone to UTC
+    if start_iso:
+        start_dt_utc = datetime.datetime.fromisoformat(start_iso).astimezone(datetime.timezone.utc)
+        timeMin = start_dt_utc.isoformat()
+
+        if end_iso:
+            end_dt_utc = datetime.datetime.fromisoformat(end_iso).astimezone(datetime.timezone.utc)
+            timeMax = end_dt_utc.isoformat()
         elif date_str:
             date_local = datetime.datetime.fromisoformat(date_str).date()
-            start_of_day_local = tz.localize(datetime.datetime.combine(date_local, datetime.time.min))
             end_of_day_local = tz.localize(datetime.datetime.combine(date_local, datetime.time.max))
-            timeMin = start_of_day_local.astimezone(datetime.timezone.utc).isoformat()
             timeMax = end_of_day_local.astimezone(datetime.timezone.utc).isoformat()
-
-        # 3) If neither start nor date is provided, default to "today" in user_tz
         else:
-            now_local = datetime.datetime.now(tz)
-            today_local = now_local.date()
-            start_of_day_local = tz.localize(datetime.datetime.combine(today_local, datetime.time.min))
-            end_of_day_local = tz.localize(datetime.datetime.combine(today_local, datetime.time.max))
-            timeMin = start_of_day_local.astimezone(datetime.timezone.utc).isoformat()
+            local_date = start_dt_utc.astimezone(tz).date()
+            end_of_day_local = tz.localize(datetime.datetime.combine(local_date, datetime.time.max))
             timeMax = end_of_day_local.astimezone(datetime.timezone.utc).isoformat()
 
-        # Build the query parameters for Google Calendar
-        params = {
-            "calendarId": cal_id,
-            "timeMin": timeMin,
-            "timeMax": timeMax,
-            "singleEvents": True,
-            "orderBy": "startTime",
-            "maxResults": 10,
-        }
+    # 2) If only date (no start) is provided, interpret midnight→23:59:59 in user_tz
+    elif date_str:
+        date_local = datetime.datetime.fromisoformat(date_str).date()
+        start_of_day_local = tz.localize(datetime.datetime.combine(date_local, datetime.time.min))
+        end_of_day_local = tz.localize(datetime.datetime.combine(date_local, datetime.time.max))
+        timeMin = start_of_day_local.astimezone(datetime.timezone.utc).isoformat()
+        timeMax = end_of_day_local.astimezone(datetime.timezone.utc).isoformat()
+
+    # 3) If neither start nor date is provided, default to "today" in user_tz
+    else:
+        now_local = datetime.datetime.now(tz)
+        today_local = now_local.date()
+        start_of_day_local = tz.localize(datetime.datetime.combine(today_local, datetime.time.min))
+        end_of_day_local = tz.localize(datetime.datetime.combine(today_local, datetime.time.max))
+        timeMin = start_of_day_local.astimezone(datetime.timezone.utc).isoformat()
+        timeMax = end_of_day_local.astimezone(datetime.timezone.utc).isoformat()
+
+    return timeMin, timeMax
+
+
+def _format_event(ev: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": ev.get("id"),  # Include event ID for deletion
+        "summary": ev.get("summary", "No title"),
+        "description": ev.get("description", "No description"),
+        "start": ev.get("start", {}).get("dateTime", ev.get("start", {}).get("date", "No start time")),
+        "end": ev.get("end", {}).get("dateTime", ev.get("end", {}).get("date", "No end time")),
+        "link": ev.get("htmlLink", "No link available")
+    }
+
+
+def _iter_matching_events(service, token_info: Dict[str, Any], query_details: dict, user_tz: str,
+                          max_results: Optional[int], page_size: int) -> Iterator[Dict[str, Any]]:
+    """Yield raw events matching query_details, from the local cache when possible, else the API."""
+    title = query_details.get("title", None)
+    cal_id = query_details.get("calendarId", "primary")
+    timeMin, timeMax = _query_window(query_details, user_tz)
+
+    # Answer from the synced local store when it covers this window
+    events = event_cache.cache.query(
+        service,
+        calendar_pool.user_key(token_info),
+        cal_id,
+        datetime.datetime.fromisoformat(timeMin),
+        datetime.datetime.fromisoformat(timeMax),
+        title=title,
+        limit=max_results
+    )
+    if events is not None:
+        yield from events
+        return
+
+    params = {
+        "calendarId": cal_id,
+        "timeMin": timeMin,
+        "timeMax": timeMax,
+        "singleEvents": True,
+        "orderBy": "startTime",
+    }
+    if title:
+        params["q"] = title
+    yield from iter_events(service, max_results=max_results, page_size=page_size, **params)
 
-        if title:
-            params["q"] = title
 
-        events_result = service.events().list(**params).execute()
-        events = events_result.get("items", [])
+def findEvent(token_info: Dict[str, Any], query_details: dict, user_tz: str,
+              max_results: Optional[int] = EVENTS_MAX_RESULTS,
+              page_size: int = EVENTS_PAGE_SIZE) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Finds events based on provided criteria in the user's timezone.
+    - query_details may include:
+        - date:       "YYYY-MM-DD"
+        - title:      string
+        - start:      full ISO-8601 string with offset (e.g. "2025-06-02T17:00:00+02:00")
+        - end:        full ISO-8601 string with offset
+        - calendarId: string (defaults to "primary")
+    - user_tz is the user's IANA timezone (e.g. "America/Los_Angeles").
+    - max_results caps how many events are returned (None for every match); results
+      are fetched page_size at a time.
+    Returns (result_dict, updated_token_info)
+    """
+    try:
+        with _build_service(token_info) as service:
+            formatted_events = [
+                _format_event(ev)
+                for ev in _iter_matching_events(service, token_info, query_details, user_tz, max_results, page_size)
+            ]
 
-        if not events:
+        if not formatted_events:
             return ({
                 "success": True,
                 "message": "No events found for the specified criteria.",
                 "events": []
             }, token_info)
 
-        formatted_events = []
-        for ev in events:
-            formatted_events.append({
-                "id": ev.get("id"),  # Include event ID for deletion
-                "summary": ev.get("summary", "No title"),
-                "description": ev.get("description", "No description"),
-                "start": ev.get("start", {}).get("dateTime", ev.get("start", {}).get("date", "No start time")),
-                "end": ev.get("end", {}).get("dateTime", ev.get("end", {}).get("date", "No end time")),
-                "link": ev.get("htmlLink", "No link available")
-            })
-
         return ({
             "success": True,
             "message": f"Found {len(formatted_events)} events.",
@@ -514,4 +800,17 @@ def findEvent(token_info: Dict[str, Any], query_details: dict, user_tz: str) ->
             "message": "Failed to retrieve events",
             "error": str(e)
         }, token_info)
-    
\ No newline at end of file
+
+
+def streamEvents(token_info: Dict[str, Any], query_details: dict, user_tz: str,
+                 max_results: Optional[int] = EVENTS_MAX_RESULTS,
+                 page_size: int = EVENTS_PAGE_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Like findEvent, but lazily yields lists of formatted events, one per page,
+    so callers can send results before the whole window has been fetched.
+    Google errors are raised to the caller.
+    """
+    with _build_service(token_info) as service:
+        events = _iter_matching_events(service, token_info, query_details, user_tz, max_results, page_size)
+        for chunk in chunked(events, page_size):
+            yield [_format_event(ev) for ev in chunk]
@@ -0,0 +1,144 @@
+"""
+Tiered model routing for the event parser.
+
+A local classifier (no API call) sorts prompts into simple and complex. Simple
+prompts (one event, one clear action) start on the cheap model. Complex ones
+(several events, recurrence, vague timing, long prompts) go straight to the
+large one. A cheap answer that fails validation escalates to the next tier,
+and a timeout, connection error, rate limit or 5xx on one model falls back to
+the next in the chain. Latency, token usage and an estimated cost are
+recorded per model.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+import openai
+
+import llm
+
+LLM_SMALL_MODEL = os.getenv('LLM_SMALL_MODEL', 'gpt-4o-mini')
+LLM_LARGE_MODEL = os.getenv('LLM_LARGE_MODEL', 'gpt-4')
+# Tried in order after the large model when it times out or errors
+LLM_FALLBACK_MODELS = [m.strip() for m in os.getenv('LLM_FALLBACK_MODELS', 'gpt-4o').split(',') if m.strip()]
+# The small model gets a shorter timeout so a slow answer falls back quickly
+LLM_SMALL_TIMEOUT = float(os.getenv('LLM_SMALL_TIMEOUT', 8))
+# Prompts longer than this many words skip the small model
+ROUTER_MAX_SIMPLE_WORDS = int(os.getenv('ROUTER_MAX_SIMPLE_WORDS', 25))
+
+# USD per million (prompt, completion) tokens, for the cost estimate only
+_DEFAULT_PRICES = {
+    'gpt-4': (30.0, 60.0),
+    'gpt-4o': (2.5, 10.0),
+    'gpt-4o-mini': (0.15, 0.6),
+    'gpt-3.5-turbo': (0.5, 1.5),
+}
+MODEL_PRICES = {**_DEFAULT_PRICES, **{k: tuple(v) for k, v in json.loads(os.getenv('LLM_MODEL_PRICES', '{}')).items()}}
+
+# Errors worth trying another model for; anything else is a bug or a bad request
+_FALLBACK_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+# Signs of more than one event, recurrence, or timing the small model tends to get wrong
+_COMPLEX = re.compile(
+    r'\b(?:and|then|also|plus|every|each|daily|weekly|monthly|yearly|biweekly|recurring|repeat\w*'
+    r'|except|unless|until|between|before|after|sometime|whenever|next (?:week|month)|weekend|'
+    r'first|last|other)\b|[,;&+\n]'
+)
+_TIMES = re.compile(r'\b\d{1,2}(?::\d{2})?\s?(?:am|pm)\b|\bnoon\b|\bmidnight\b|\b\d{1,2}:\d{2}\b')
+
+
+def classify(prompt: str) -> str:
+    """'simple' when the cheap model can be trusted with the prompt, else 'complex'."""
+    text = prompt.lower()
+    if len(text.split()) > ROUTER_MAX_SIMPLE_WORDS or _COMPLEX.search(text):
+        return 'complex'
+    # "from 3pm to 4pm" is one event; more times than that usually means several
+    if len(_TIMES.findall(text)) > 2:
+        return 'complex'
+    return 'simple'
+
+
+def plan(prompt: str) -> List[str]:
+    """Models to try for this prompt, cheapest first."""
+    chain = [LLM_LARGE_MODEL] + [m for m in LLM_FALLBACK_MODELS if m != LLM_LARGE_MODEL]
+    if LLM_SMALL_MODEL and LLM_SMALL_MODEL not in chain and classify(prompt) == 'simple':
+        chain.insert(0, LLM_SMALL_MODEL)
+    _count(chain[0], 'routed')
+    return chain
+
+
+_lock = threading.Lock()
+_metrics: Dict[str, Dict[str, float]] = {}
+
+
+def _count(model: str, field: str, amount: float = 1):
+    with _lock:
+        entry = _metrics.setdefault(model, {
+            'routed': 0, 'calls': 0, 'fallbacks': 0, 'escalations': 0, 'latency_ms': 0.0,
+            'prompt_tokens': 0, 'completion_tokens': 0, 'cost_usd': 0.0
+        })
+        entry[field] += amount
+
+
+def _record_usage(model: str, response, elapsed: float):
+    _count(model, 'calls')
+    _count(model, 'latency_ms', elapsed * 1000)
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+    completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+    _count(model, 'prompt_tokens', prompt_tokens)
+    _count(model, 'completion_tokens', completion_tokens)
+    prices = MODEL_PRICES.get(model)
+    if prices:
+        _count(model, 'cost_usd', (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000)
+
+
+def chat(chain: List[str], messages: List[Dict[str, Any]], **kwargs) -> Tuple[Any, int]:
+    """
+    Run the completion on the first model in `chain` that answers. Returns
+    (response, index of the model used). The last model's error is raised.
+    """
+    for index, model in enumerate(chain):
+        started = time.monotonic()
+        try:
+            timeout = LLM_SMALL_TIMEOUT if model == LLM_SMALL_MODEL and index < len(chain) - 1 else None
+            response = llm.chat(messages=messages, model=model, timeout=timeout, **kwargs)
+        except _FALLBACK_ERRORS as e:
+            if index == len(chain) - 1:
+                raise
+            logging.warning(f"{model} failed ({type(e).__name__}); falling back to {chain[index + 1]}")
+            _count(model, 'fallbacks')
+            continue
+        _record_usage(model, response, time.monotonic() - started)
+        return response, index
+    raise ValueError("No models to route to")
+
+
+def escalate(chain: List[str], used: int) -> List[str]:
+    """The chain to retry with after the model at `used` gave an invalid answer."""
+    if used + 1 < len(chain):
+        _count(chain[used], 'escalations')
+        return chain[used + 1:]
+    return chain[used:]
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    """Per-model counters, with average latency."""
+    with _lock:
+        snapshot = {model: dict(entry) for model, entry in _metrics.items()}
+    for entry in snapshot.values():
+        entry['avg_latency_ms'] = round(entry['latency_ms'] / entry['calls'], 1) if entry['calls'] else 0.0
+        entry['cost_usd'] = round(entry['cost_usd'], 6)
+    return snapshot
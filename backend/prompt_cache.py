@@ -0,0 +1,189 @@
+"""
+Cache of parsed LLM results for repeated prompts.
+
+Retries, double clicks and the same "what's on today" several times a day all
+used to be fresh GPT-4 calls. Results are keyed by the user, the normalized
+prompt text, the user's timezone and their local date, because relative dates
+("tomorrow") resolve differently on another day or in another zone. Entries
+expire at the user's local midnight, and a cached create whose start has
+already passed ("today at 5pm", asked again at 6pm) counts as a miss. The
+number of entries is bounded: an index sorted by insertion time lets the
+oldest ones be evicted first. Without Redis the cache is a per-process LRU.
+"""
+
+import collections
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import pytz
+
+from redis_store import get_redis
+
+PROMPT_CACHE_ENABLED = os.getenv('PROMPT_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+PROMPT_CACHE_MAX_ENTRIES = int(os.getenv('PROMPT_CACHE_MAX_ENTRIES', 10000))
+
+_ENTRY_KEY = 'calgentic:prompt-cache:{}'
+_INDEX_KEY = 'calgentic:prompt-cache:index'
+_STATS_KEY = 'calgentic:prompt-cache:stats'
+
+
+def normalize(prompt: str) -> str:
+    """Lower-case, collapse whitespace and drop trailing punctuation."""
+    text = re.sub(r'\s+', ' ', prompt.strip().lower().replace('’', "'"))
+    return text.rstrip('?.! ')
+
+
+def _seconds_to_midnight(now_local: datetime.datetime) -> int:
+    tomorrow = now_local.date() + datetime.timedelta(days=1)
+    midnight = now_local.tzinfo.localize(datetime.datetime.combine(tomorrow, datetime.time.min))
+    return max(1, int((midnight - now_local).total_seconds()))
+
+
+def _starts_in_past(result: Dict[str, Any]) -> bool:
+    """True for a create whose events (any of them) start before now."""
+    if result.get('action_type') != 'create':
+        return False
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for params in result.get('eventParams') or []:
+        try:
+            start = datetime.datetime.fromisoformat(params['start'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if start.tzinfo is not None and start < now:
+            return True
+    return False
+
+
+class PromptCache:
+    def __init__(self, max_entries: int = PROMPT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        # key -> (expires_at, result), oldest first
+        self._local: 'collections.OrderedDict[str, tuple]' = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    def _key(self, prompt: str, user_tz: str, user_id: Optional[str]) -> Optional[tuple]:
+        """(cache key, seconds until local midnight), or None for prompts that can't be cached."""
+        text = normalize(prompt)
+        if not text:
+            return None
+        now_local = datetime.datetime.now(pytz.timezone(user_tz))
+        raw = f"{user_id or ''}\x00{text}\x00{user_tz}\x00{now_local.date().isoformat()}"
+        return hashlib.sha256(raw.encode()).hexdigest(), _seconds_to_midnight(now_local)
+
+    def _count(self, field: str, redis=None):
+        with self._lock:
+            self._stats[field] += 1
+        if redis is not None:
+            try:
+                redis.hincrby(_STATS_KEY, field, 1)
+            except Exception:
+                pass
+
+    def get(self, prompt: str, user_tz: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        try:
+            key = self._key(prompt, user_tz, user_id)
+        except pytz.UnknownTimeZoneError:
+            return None
+        if key is None:
+            return None
+        key = key[0]
+
+        redis = get_redis()
+        if redis is not None:
+            try:
+                raw = redis.get(_ENTRY_KEY.format(key))
+            except Exception as e:
+                logging.warning(f"Prompt cache read failed: {e}")
+                raw = None
+            result = json.loads(raw) if raw else None
+            if result is not None and not _starts_in_past(result):
+                self._count('hits', redis)
+                return result
+            self._count('misses', redis)
+            return None
+
+        with self._lock:
+            entry = self._local.get(key)
+            if entry and entry[0] > time.time():
+                result = json.loads(entry[1])
+                if not _starts_in_past(result):
+                    self._local.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return result
+            if entry:
+                del self._local[key]
+            self._stats['misses'] += 1
+        return None
+
+    def put(self, prompt: str, user_tz: str, result: Dict[str, Any], user_id: Optional[str] = None):
+        """Cache a successful parse until the user's local midnight. Error results are never cached."""
+        if not isinstance(result, dict) or 'error' in result:
+            return
+        try:
+            key = self._key(prompt, user_tz, user_id)
+        except pytz.UnknownTimeZoneError:
+            return
+        if key is None:
+            return
+        key, ttl = key
+        payload = json.dumps(result)
+
+        redis = get_redis()
+        if redis is not None:
+            try:
+                now = time.time()
+                pipe = redis.pipeline(transaction=False)
+                pipe.set(_ENTRY_KEY.format(key), payload, ex=ttl)
+                pipe.zadd(_INDEX_KEY, {key: now})
+                # Index members whose entry has certainly expired (a local day is at most 25h)
+                pipe.zremrangebyscore(_INDEX_KEY, '-inf', now - 25 * 3600)
+                pipe.zcard(_INDEX_KEY)
+                size = pipe.execute()[-1]
+                self._count('stores', redis)
+                if size > self.max_entries:
+                    oldest = redis.zpopmin(_INDEX_KEY, size - self.max_entries)
+                    if oldest:
+                        redis.delete(*[_ENTRY_KEY.format(member.decode()) for member, _ in oldest])
+                        redis.hincrby(_STATS_KEY, 'evictions', len(oldest))
+                        with self._lock:
+                            self._stats['evictions'] += len(oldest)
+            except Exception as e:
+                logging.warning(f"Prompt cache write failed: {e}")
+            return
+
+        with self._lock:
+            self._local[key] = (time.time() + ttl, payload)
+            self._local.move_to_end(key)
+            self._stats['stores'] += 1
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters, shared across workers when Redis is configured."""
+        with self._lock:
+            counts = dict(self._stats)
+        redis = get_redis()
+        if redis is not None:
+            try:
+                shared = redis.hgetall(_STATS_KEY)
+                counts = {field: int(shared.get(field.encode(), 0)) for field in counts}
+                counts['entries'] = redis.zcard(_INDEX_KEY)
+            except Exception as e:
+                logging.warning(f"Prompt cache stats unavailable: {e}")
+        else:
+            counts['entries'] = len(self._local)
+        lookups = counts['hits'] + counts['misses']
+        counts['hit_rate'] = round(counts['hits'] / lookups, 4) if lookups else 0.0
+        return counts
+
+
+cache = PromptCache()
@@ -0,0 +1,125 @@
+"""
+Request-scoped prompt logs.
+
+/prompt used to insert a 'processing' row and then update it once or twice.
+Now the request keeps its row in memory, and every stage merges its fields
+into it. The row is persisted once, as a single upsert, when the request
+ends.
+
+A request that runs longer than PROMPT_LOG_WRITE_AHEAD_AFTER seconds (usually
+a slow model call or a long calendar batch) gets a write-ahead copy of its row
+as it stands then, normally still 'processing', so a worker that dies
+mid-request still leaves a trace. Only those requests pay for the second
+write. The final upsert replaces the write-ahead copy.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+# 0 disables the write-ahead record
+PROMPT_LOG_WRITE_AHEAD_AFTER = float(os.getenv('PROMPT_LOG_WRITE_AHEAD_AFTER', 10))
+_WATCH_INTERVAL = 1.0
+
+stats = {'opened': 0, 'saved': 0, 'written_ahead': 0, 'errors': 0}
+
+
+class PromptLog:
+    """One request's prompts row, written when the request finishes."""
+
+    def __init__(self, row: Dict[str, Any]):
+        self.row = row
+        self.started = time.monotonic()
+        self.written_ahead = False
+        self.closed = False
+        # Held while the row is written, so the final write never races the write-ahead one
+        self.lock = threading.Lock()
+
+    @property
+    def id(self) -> str:
+        return self.row['id']
+
+    def update(self, fields: Dict[str, Any]):
+        with self.lock:
+            self.row.update(fields)
+
+
+# Set by configure(); each takes the full row
+_write_ahead: Optional[Callable[[Dict[str, Any]], None]] = None
+_save: Optional[Callable[[Dict[str, Any]], None]] = None
+
+_live: Dict[str, PromptLog] = {}
+_live_lock = threading.Lock()
+_watcher_pid: Optional[int] = None
+
+
+def configure(save: Callable[[Dict[str, Any]], None], write_ahead: Callable[[Dict[str, Any]], None]):
+    """save persists a finished row; write_ahead writes the copy of a long-running one."""
+    global _save, _write_ahead
+    _save, _write_ahead = save, write_ahead
+
+
+def open_log(row: Dict[str, Any]) -> PromptLog:
+    log = PromptLog(row)
+    stats['opened'] += 1
+    if PROMPT_LOG_WRITE_AHEAD_AFTER > 0 and _write_ahead is not None:
+        with _live_lock:
+            _live[log.id] = log
+        _ensure_watcher()
+    return log
+
+
+def close_log(log: PromptLog):
+    """Persist the request's row; called once, when the request ends."""
+    with _live_lock:
+        _live.pop(log.id, None)
+    with log.lock:
+        if log.closed:
+            return
+        log.closed = True
+        if _save is None:
+            return
+        try:
+            _save(dict(log.row))
+            stats['saved'] += 1
+        except Exception as e:
+            stats['errors'] += 1
+            logging.warning(f"Could not save prompt log {log.id}: {e}")
+
+
+def _ensure_watcher():
+    global _watcher_pid
+    if _watcher_pid == os.getpid():
+        return
+    with _live_lock:
+        if _watcher_pid == os.getpid():
+            return
+        _watcher_pid = os.getpid()
+        threading.Thread(target=_watch, name='prompt-log-write-ahead', daemon=True).start()
+
+
+def _due():
+    cutoff = time.monotonic() - PROMPT_LOG_WRITE_AHEAD_AFTER
+    with _live_lock:
+        due = [log for log in _live.values() if log.started <= cutoff]
+        for log in due:
+            del _live[log.id]
+    return due
+
+
+def _watch():
+    while True:
+        time.sleep(_WATCH_INTERVAL)
+        for log in _due():
+            with log.lock:
+                if log.closed:
+                    continue
+                try:
+                    _write_ahead(dict(log.row))
+                    log.written_ahead = True
+                    stats['written_ahead'] += 1
+                except Exception as e:
+                    stats['errors'] += 1
+                    logging.warning(f"Could not write ahead prompt log {log.id}: {e}")
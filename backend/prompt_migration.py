@@ -0,0 +1,80 @@
+"""
+Lazy rewrite of stored prompt text.
+
+Prompts used to be stored as base64 of a Fernet token, which is already
+base64, so the column was a third larger than it needed to be. New rows hold
+the compact token (see sec.Keyring.encrypt_text). Old rows are rewritten
+when they are read. A history page hands its stale rows here, and a single
+background thread re-encrypts each one and writes it back, re-keying rows
+from a retired key at the same time. The update is conditional on the old
+value, so a concurrent rewrite of the same row is harmless.
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Optional
+
+import sec
+
+PROMPT_MIGRATION_ENABLED = os.getenv('PROMPT_MIGRATION_ENABLED', 'true').lower() == 'true'
+# Rows queued or being rewritten, so a page read twice doesn't queue them twice
+_MAX_IN_FLIGHT = 1000
+
+_client_factory = None
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_in_flight = set()
+_lock = threading.Lock()
+
+stats = {'rewritten': 0, 'skipped': 0, 'errors': 0}
+
+
+def configure(client_factory):
+    """client_factory returns the supabase client to write with."""
+    global _client_factory
+    _client_factory = client_factory
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prompt-migration')
+        _executor_pid = os.getpid()
+        _in_flight.clear()
+    return _executor
+
+
+def schedule(rows: Iterable[Dict[str, Any]]):
+    """Queue a rewrite of every row whose prompt_text is stale; rows need 'id' and the stored 'prompt_text'."""
+    if not PROMPT_MIGRATION_ENABLED or _client_factory is None:
+        return
+    keyring = sec.get_keyring()
+    with _lock:
+        executor = _get_executor()
+        for row in rows:
+            stored = row.get('prompt_text')
+            if not stored or row['id'] in _in_flight or not keyring.is_stale(stored):
+                continue
+            if len(_in_flight) >= _MAX_IN_FLIGHT:
+                stats['skipped'] += 1
+                continue
+            _in_flight.add(row['id'])
+            executor.submit(_rewrite, row['id'], stored)
+
+
+def _rewrite(row_id: str, stored: str):
+    try:
+        keyring = sec.get_keyring()
+        compact = keyring.encrypt_text(keyring.decrypt_text(stored))
+        client = _client_factory()
+        if client is not None:
+            client.table('prompts').update({'prompt_text': compact}).eq('id', row_id).eq('prompt_text', stored).execute()
+            stats['rewritten'] += 1
+    except Exception as e:
+        stats['errors'] += 1
+        logging.warning(f"Could not rewrite prompt {row_id}: {e}")
+    finally:
+        with _lock:
+            _in_flight.discard(row_id)
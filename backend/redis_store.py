@@ -0,0 +1,35 @@
+"""
+Shared Redis connection for the backend.
+
+The same client backs Flask-Session and every cross-worker feature (token
+refresh coordination, caches, counters), so all of them share one connection
+pool per process. redis-py resets its pool after a fork, so this is safe to
+create before gunicorn forks workers.
+"""
+
+import logging
+import os
+import threading
+from typing import Optional
+
+from redis import Redis
+
+_client: Optional[Redis] = None
+_lock = threading.Lock()
+_warned = False
+
+
+def get_redis() -> Optional[Redis]:
+    """The process-wide Redis client, or None when REDIS_URL isn't configured."""
+    global _client, _warned
+    if _client is None:
+        with _lock:
+            if _client is None:
+                url = os.environ.get('REDIS_URL')
+                if not url:
+                    if not _warned:
+                        logging.warning("REDIS_URL not set; cross-worker features fall back to per-process state")
+                        _warned = True
+                    return None
+                _client = Redis.from_url(url)
+    return _client
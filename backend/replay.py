@@ -0,0 +1,624 @@
+"""
+Record/replay stand-ins for OpenAI, Google Calendar and Supabase.
+
+SERVICE_BACKEND picks how the backend talks to the outside world:
+    live    (default) the real services
+    record  the real services, with every OpenAI and Calendar exchange
+            appended to REPLAY_FILE
+    replay  no network at all: recorded responses are served back, and
+            anything not in the recording is answered by in-process fakes
+
+The stand-ins plug in at the transport layer, so everything above them still
+runs: the OpenAI SDK, googleapiclient (batching, paging, retries),
+supabase-py's query calls, and every app.py/main.py code path.
+- OpenAI: an httpx transport. Requests with no recording get a synthetic
+  completion, built by the fast-path parser when it understands the prompt and
+  a view of today otherwise.
+- Calendar: an httplib2-compatible transport backed by an in-memory calendar.
+  It handles events list/insert/get/delete, syncToken, freebusy,
+  calendarList and batch requests.
+- Supabase: an in-memory stand-in for the client's table()...execute() calls.
+
+Each replayed call sleeps for a latency sampled from a log-normal
+distribution set per service in REPLAY_LATENCY, e.g.
+    {"openai": {"median_ms": 1200, "p99_ms": 4000}, "calendar": {"median_ms": 150, "p99_ms": 600}}
+
+Run `SERVICE_BACKEND=replay python replay.py` to load-test /prompt offline.
+"""
+
+import copy
+import datetime
+import email.parser
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import httplib2
+import httpx
+
+SERVICE_BACKEND = os.getenv('SERVICE_BACKEND', 'live').lower()
+REPLAY_FILE = os.getenv('REPLAY_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'replay', 'recording.jsonl'))
+
+_DEFAULT_LATENCY = {
+    'openai': {'median_ms': 1200, 'p99_ms': 4000},
+    'calendar': {'median_ms': 150, 'p99_ms': 600},
+    'supabase': {'median_ms': 60, 'p99_ms': 250},
+}
+REPLAY_LATENCY = {**_DEFAULT_LATENCY, **json.loads(os.getenv('REPLAY_LATENCY', '{}'))}
+
+
+def recording() -> bool:
+    return SERVICE_BACKEND == 'record'
+
+
+def replaying() -> bool:
+    return SERVICE_BACKEND == 'replay'
+
+
+def latency(service: str) -> float:
+    """A latency in seconds for one call to `service`, log-normal between median and p99."""
+    spec = REPLAY_LATENCY.get(service) or {}
+    median = spec.get('median_ms', 0) / 1000
+    if median <= 0:
+        return 0.0
+    p99 = max(spec.get('p99_ms', median * 1000) / 1000, median)
+    # 2.326 is the z-score of the 99th percentile
+    sigma = math.log(p99 / median) / 2.326
+    return random.lognormvariate(math.log(median), sigma)
+
+
+# --- Recording file ----------------------------------------------------------
+
+def _request_key(service: str, method: str, url: str, body: Optional[bytes]) -> str:
+    """What identifies a request for replay: service, method, path and query, and a hash of the body."""
+    parsed = urllib.parse.urlsplit(url)
+    # Sync and page tokens differ between runs; match on everything else
+    query = sorted((k, v) for k, v in urllib.parse.parse_qsl(parsed.query) if k not in ('syncToken', 'pageToken'))
+    digest = hashlib.sha256(body or b'').hexdigest()[:16]
+    return f"{service} {method.upper()} {parsed.path}?{urllib.parse.urlencode(query)} {digest}"
+
+
+class Recording:
+    """Recorded responses by request key; repeated keys are served round-robin."""
+
+    def __init__(self, path: str = REPLAY_FILE):
+        self.path = path
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursors: Dict[str, itertools.cycle] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry['key'], []).append(entry)
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            if key not in self._cursors:
+                self._cursors[key] = itertools.cycle(self._entries[key])
+            return next(self._cursors[key])
+
+    def save(self, key: str, status: int, headers: Dict[str, str], body: bytes):
+        entry = {'key': key, 'status': status, 'headers': headers, 'body': body.decode('utf-8', 'replace')}
+        with self._lock:
+            self._entries.setdefault(key, []).append(entry)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+
+
+_recording: Optional[Recording] = None
+_recording_lock = threading.Lock()
+
+
+def get_recording() -> Recording:
+    global _recording
+    if _recording is None:
+        with _recording_lock:
+            if _recording is None:
+                _recording = Recording()
+    return _recording
+
+
+# --- OpenAI ------------------------------------------------------------------
+
+def _synthetic_completion(request_body: Dict[str, Any]) -> Dict[str, Any]:
+    """A chat completion answering the event-parser request without a model."""
+    import fastpath  # imported late: fastpath is only needed when replaying
+
+    user_message = next((m['content'] for m in reversed(request_body.get('messages', []))
+                         if m.get('role') == 'user' and 'User input:' in (m.get('content') or '')), '')
+    prompt = user_message.split('User input:', 1)[-1].strip()
+    tz_match = re.search(r'Time zone: (\S+)', user_message)
+    user_tz = tz_match.group(1) if tz_match else 'UTC'
+    try:
+        parsed = fastpath.parse(prompt, user_tz)
+    except Exception:
+        parsed = None
+    if parsed is None:
+        today = re.search(r'Today: (\d{4}-\d{2}-\d{2})', user_message)
+        parsed = {
+            "action_type": "view",
+            "query_details": {"date": today.group(1) if today else datetime.date.today().isoformat(),
+                              "calendarId": "primary"}
+        }
+    arguments = json.dumps(parsed)
+    prompt_tokens = sum(len((m.get('content') or '').split()) for m in request_body.get('messages', [])) * 4 // 3
+    completion_tokens = len(arguments.split()) * 4 // 3
+
+    message: Dict[str, Any] = {"role": "assistant", "content": arguments}
+    finish_reason = "stop"
+    if request_body.get('tools'):
+        name = request_body['tools'][0]['function']['name']
+        message = {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{
+                "id": f"call_{uuid.uuid4().hex[:24]}",
+                "type": "function",
+                "function": {"name": name, "arguments": arguments}
+            }]
+        }
+        finish_reason = "tool_calls"
+    return {
+        "id": f"chatcmpl-replay-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request_body.get('model', 'replay'),
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens}
+    }
+
+
+def _openai_replay(request: httpx.Request) -> httpx.Response:
+    key = _request_key('openai', request.method, str(request.url), request.content)
+    entry = get_recording().lookup(key)
+    if entry is not None:
+        return httpx.Response(entry['status'], headers={'content-type': 'application/json'},
+                              content=entry['body'].encode())
+    if request.url.path.endswith('/chat/completions'):
+        return httpx.Response(200, json=_synthetic_completion(json.loads(request.content or b'{}')))
+    return httpx.Response(404, json={"error": {"message": f"No replay for {request.url.path}"}})
+
+
+def _record_httpx(service: str, request: httpx.Request, response: httpx.Response):
+    get_recording().save(
+        _request_key(service, request.method, str(request.url), request.content),
+        response.status_code, {'content-type': response.headers.get('content-type', '')}, response.content
+    )
+
+
+class OpenAITransport(httpx.BaseTransport):
+    def __init__(self, **kwargs):
+        self._live = httpx.HTTPTransport(**kwargs) if recording() else None
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self._live is not None:
+            response = self._live.handle_request(request)
+            response.read()
+            _record_httpx('openai', request, response)
+            return response
+        time.sleep(latency('openai'))
+        return _openai_replay(request)
+
+    def close(self):
+        if self._live is not None:
+            self._live.close()
+
+
+def openai_transport(limits: httpx.Limits) -> Optional[httpx.BaseTransport]:
+    """Transport for llm.get_client(), or None to use the default network transport."""
+    if recording() or replaying():
+        return OpenAITransport(limits=limits)
+    return None
+
+
+# --- Google Calendar ---------------------------------------------------------
+
+def _parse_time(value: Dict[str, Any]) -> datetime.datetime:
+    if 'dateTime' in value:
+        return datetime.datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00'))
+    return datetime.datetime.fromisoformat(value['date']).replace(tzinfo=datetime.timezone.utc)
+
+
+def _parse_param(value: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+class FakeCalendar:
+    """In-memory Calendar v3: enough of the API for every call main.py makes."""
+
+    def __init__(self, seed_days: int = 7):
+        self._lock = threading.Lock()
+        self._version = 0
+        # calendar id -> event id -> (version, event)
+        self._events: Dict[str, Dict[str, Tuple[int, Dict[str, Any]]]] = {'primary': {}}
+        today = datetime.datetime.now(datetime.timezone.utc).replace(hour=16, minute=30, second=0, microsecond=0)
+        for offset in range(-seed_days, seed_days + 1):
+            start = today + datetime.timedelta(days=offset)
+            self._insert('primary', {
+                'summary': 'Standup',
+                'start': {'dateTime': start.isoformat()},
+                'end': {'dateTime': (start + datetime.timedelta(minutes=15)).isoformat()}
+            })
+
+    def _insert(self, calendar_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        self._version += 1
+        event = copy.deepcopy(body)
+        event.setdefault('id', uuid.uuid4().hex)
+        event['status'] = 'confirmed'
+        event['htmlLink'] = f"https://calendar.google.com/calendar/event?eid={event['id']}"
+        event['updated'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self._events.setdefault(calendar_id, {})[event['id']] = (self._version, event)
+        return event
+
+    def handle(self, method: str, uri: str, body: Optional[bytes]) -> Tuple[int, Dict[str, Any]]:
+        parsed = urllib.parse.urlsplit(uri)
+        params = dict(urllib.parse.parse_qsl(parsed.query))
+        path = urllib.parse.unquote(parsed.path)
+        payload = json.loads(body) if body else {}
+        with self._lock:
+            if path.endswith('/users/me/calendarList'):
+                return 200, {'items': [{'id': calendar_id} for calendar_id in self._events]}
+            if path.endswith('/freeBusy') and method == 'POST':
+                return 200, self._freebusy(payload)
+            match = re.search(r'/calendars/([^/]+)/events(?:/([^/]+))?$', path)
+            if not match:
+                return 404, {'error': {'code': 404, 'message': f'Not found: {path}'}}
+            calendar_id, event_id = match.groups()
+            events = self._events.setdefault(calendar_id, {})
+            if event_id is None and method == 'POST':
+                if payload.get('id') in events:
+                    return 409, {'error': {'code': 409, 'message': 'The requested identifier already exists.'}}
+                return 200, self._insert(calendar_id, payload)
+            if event_id is None and method == 'GET':
+                return 200, self._list(events, params)
+            if event_id not in events or events[event_id][1]['status'] == 'cancelled':
+                return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+            if method == 'DELETE':
+                self._version += 1
+                event = dict(events[event_id][1], status='cancelled')
+                events[event_id] = (self._version, event)
+                return 204, {}
+            return 200, events[event_id][1]
+
+    def _list(self, events, params) -> Dict[str, Any]:
+        if params.get('syncToken'):
+            since = int(params['syncToken'])
+            items = [event for version, event in events.values() if version > since]
+        else:
+            time_min = _parse_param(params['timeMin']) if params.get('timeMin') else None
+            time_max = _parse_param(params['timeMax']) if params.get('timeMax') else None
+            query = (params.get('q') or '').lower()
+            items = []
+            for _, event in events.values():
+                if event['status'] == 'cancelled':
+                    continue
+                if time_min and _parse_time(event['end']) <= time_min:
+                    continue
+                if time_max and _parse_time(event['start']) >= time_max:
+                    continue
+                if query and query not in (event.get('summary') or '').lower():
+                    continue
+                items.append(event)
+            items.sort(key=lambda event: _parse_time(event['start']))
+
+        offset = int(params.get('pageToken') or 0)
+        page_size = int(params.get('maxResults') or 250)
+        page = items[offset:offset + page_size]
+        result: Dict[str, Any] = {'kind': 'calendar#events', 'items': copy.deepcopy(page)}
+        if offset + page_size < len(items):
+            result['nextPageToken'] = str(offset + page_size)
+        else:
+            result['nextSyncToken'] = str(self._version)
+        return result
+
+    def _freebusy(self, payload) -> Dict[str, Any]:
+        time_min, time_max = _parse_param(payload['timeMin']), _parse_param(payload['timeMax'])
+        calendars = {}
+        for item in payload.get('items', []):
+            busy = []
+            for _, event in self._events.get(item['id'], {}).values():
+                start, end = _parse_time(event['start']), _parse_time(event['end'])
+                if event['status'] != 'cancelled' and start < time_max and end > time_min:
+                    busy.append({'start': start.isoformat(), 'end': end.isoformat()})
+            calendars[item['id']] = {'busy': busy}
+        return {'kind': 'calendar#freeBusy', 'calendars': calendars}
+
+    def handle_batch(self, content_type: str, body: bytes) -> Tuple[int, Dict[str, str], bytes]:
+        """Answer a multipart/mixed batch the way googleapiclient's BatchHttpRequest expects."""
+        message = email.parser.BytesParser().parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        boundary = f"batch_{uuid.uuid4().hex}"
+        parts = []
+        for part in message.get_payload():
+            raw = part.get_payload(decode=True) or part.get_payload().encode()
+            # googleapiclient separates headers with bare \n; accept either
+            head, part_body = (re.split(rb'\r?\n\r?\n', raw, maxsplit=1) + [b''])[:2]
+            request_line = head.splitlines()[0].decode()
+            part_body = part_body.strip()
+            method, path, _ = request_line.split(' ', 2)
+            status, result = self.handle(method, f"https://www.googleapis.com{path}", part_body or None)
+            content_id = part['Content-ID'][1:-1]
+            body_text = json.dumps(result) if status != 204 else ''
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status < 300 else 'Error'}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n\r\n{body_text}\r\n"
+            )
+        content = (''.join(parts) + f"--{boundary}--\r\n").encode()
+        return 200, {'content-type': f'multipart/mixed; boundary={boundary}'}, content
+
+
+_calendar: Optional[FakeCalendar] = None
+
+
+def get_fake_calendar() -> FakeCalendar:
+    global _calendar
+    with _recording_lock:
+        if _calendar is None:
+            _calendar = FakeCalendar()
+    return _calendar
+
+
+class CalendarHttp:
+    """httplib2.Http stand-in that replays or records Calendar traffic."""
+
+    follow_redirects = True
+    redirect_codes = httplib2.Http().redirect_codes
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.timeout = timeout
+        self.connections: Dict[str, Any] = {}
+        self._live = httplib2.Http(timeout=timeout) if recording() else None
+
+    def close(self):
+        if self._live is not None:
+            self._live.close()
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, connection_type=None):
+        if isinstance(body, str):
+            body = body.encode()
+        key = _request_key('calendar', method, uri, body)
+        if self._live is not None:
+            response, content = self._live.request(uri, method, body=body, headers=headers,
+                                                   redirections=redirections, connection_type=connection_type)
+            get_recording().save(key, response.status, {'content-type': response.get('content-type', '')}, content)
+            return response, content
+
+        time.sleep(latency('calendar'))
+        if '/batch/' in uri:
+            # Batch bodies carry random boundaries, so they are never matched against the recording
+            status, response_headers, content = get_fake_calendar().handle_batch(
+                (headers or {}).get('content-type', ''), body or b'')
+        else:
+            entry = get_recording().lookup(key)
+            if entry is not None:
+                status, response_headers, content = entry['status'], entry['headers'], entry['body'].encode()
+            else:
+                status, result = get_fake_calendar().handle(method, uri, body)
+                response_headers = {'content-type': 'application/json; charset=UTF-8'}
+                content = json.dumps(result).encode() if status != 204 else b''
+        return httplib2.Response({'status': status, **response_headers}), content
+
+
+def calendar_http(timeout: Optional[float]):
+    """Transport for calendar_pool services, or None to use a real httplib2.Http."""
+    if recording() or replaying():
+        return CalendarHttp(timeout=timeout)
+    return None
+
+
+# --- Supabase ----------------------------------------------------------------
+
+class _Result:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class _Query:
+    """The subset of supabase-py's query builder app.py uses."""
+
+    def __init__(self, store: 'FakeSupabase', table: str):
+        self._store = store
+        self._table = table
+        self._op = 'select'
+        self._columns = '*'
+        self._count = None
+        self._payload: Any = None
+        self._filters: List[Tuple[str, Any]] = []
+        self._order: Optional[Tuple[str, bool]] = None
+        self._limit: Optional[int] = None
+        self._offset = 0
+
+    def select(self, columns='*', count=None):
+        self._columns, self._count = columns, count
+        return self
+
+    def insert(self, payload):
+        self._op, self._payload = 'insert', payload
+        return self
+
+    def update(self, payload):
+        self._op, self._payload = 'update', payload
+        return self
+
+    def upsert(self, payload):
+        self._op, self._payload = 'upsert', payload
+        return self
+
+    def eq(self, column, value):
+        self._filters.append((column, value))
+        return self
+
+    def order(self, column, desc=False):
+        self._order = (column, desc)
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def offset(self, count):
+        self._offset = count
+        return self
+
+    def range(self, start, end):
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    def execute(self):
+        time.sleep(latency('supabase'))
+        return self._store.run(self)
+
+
+class FakeSupabase:
+    """In-memory stand-in for the supabase client's table()...execute() calls."""
+
+    def __init__(self):
+        self._tables: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def insert(self, table: str, rows):
+        rows = rows if isinstance(rows, list) else [rows]
+        with self._lock:
+            stored = []
+            for row in rows:
+                row = dict(row)
+                row.setdefault('id', str(uuid.uuid4()))
+                row.setdefault('created_at', datetime.datetime.now(datetime.timezone.utc).isoformat())
+                self._tables.setdefault(table, {})[str(row['id'])] = row
+                stored.append(dict(row))
+        return stored
+
+    def upsert(self, table: str, rows):
+        rows = rows if isinstance(rows, list) else [rows]
+        with self._lock:
+            existing = self._tables.setdefault(table, {})
+            for row in rows:
+                existing.setdefault(str(row['id']), {}).update(row)
+        return [dict(row) for row in rows]
+
+    def update(self, table: str, filters, fields):
+        with self._lock:
+            updated = []
+            for row in self._tables.get(table, {}).values():
+                if all(str(row.get(column)) == str(value) for column, value in filters):
+                    row.update(fields)
+                    updated.append(dict(row))
+        return updated
+
+    def run(self, query: _Query) -> _Result:
+        if query._op == 'insert':
+            return _Result(self.insert(query._table, query._payload))
+        if query._op == 'upsert':
+            return _Result(self.upsert(query._table, query._payload))
+        if query._op == 'update':
+            return _Result(self.update(query._table, query._filters, query._payload))
+        with self._lock:
+            rows = [dict(row) for row in self._tables.get(query._table, {}).values()
+                    if all(str(row.get(column)) == str(value) for column, value in query._filters)]
+        if query._order:
+            column, desc = query._order
+            rows.sort(key=lambda row: row.get(column) or '', reverse=desc)
+        count = len(rows) if query._count else None
+        rows = rows[query._offset:]
+        if query._limit is not None:
+            rows = rows[:query._limit]
+        if query._columns != '*':
+            columns = [c.strip() for c in query._columns.split(',')]
+            rows = [{c: row.get(c) for c in columns} for row in rows]
+        return _Result(rows, count)
+
+
+_supabase: Optional[FakeSupabase] = None
+
+
+def get_fake_supabase() -> FakeSupabase:
+    global _supabase
+    with _recording_lock:
+        if _supabase is None:
+            _supabase = FakeSupabase()
+    return _supabase
+
+
+def supabase_client():
+    """The FakeSupabase to use instead of create_client(), or None for the real one."""
+    return get_fake_supabase() if replaying() else None
+
+
+# --- Load test ---------------------------------------------------------------
+
+if __name__ == '__main__':
+    import argparse
+    import concurrent.futures
+    import statistics
+
+    parser = argparse.ArgumentParser(description="Drive /prompt against the replay backend")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--timezone', default='America/Los_Angeles')
+    args = parser.parse_args()
+
+    if not replaying():
+        raise SystemExit("Set SERVICE_BACKEND=replay to load-test offline")
+    os.environ.setdefault('google_client_id', 'replay')
+    os.environ.setdefault('google_client_secret', 'replay')
+    os.environ.setdefault('credentials_path', os.path.abspath(__file__))
+    os.environ.setdefault('openai_key_v3', 'replay')
+    if not os.environ.get('PROMPT_ENCRYPTION_KEY'):
+        from cryptography.fernet import Fernet
+        os.environ['PROMPT_ENCRYPTION_KEY'] = Fernet.generate_key().decode()
+
+    import app as flask_app
+
+    prompts = [
+        "dentist tomorrow at 5pm", "what's on tomorrow", "show my calendar for today",
+        "lunch with Sam and coffee with Kim on friday", "cancel standup tomorrow",
+        "team sync every monday at 10am", "gym on saturday from 7am to 8:30am",
+        "what do I have next week", "dinner with mom on sunday at 7pm", "move my 3pm to 4pm",
+    ]
+
+    def one(index: int) -> Tuple[float, int]:
+        client = flask_app.app.test_client()
+        with client.session_transaction() as sess:
+            sess['tokens'] = {'access_token': f'replay-{index % 20}', 'refresh_token': f'replay-{index % 20}'}
+            sess['user'] = {'email': f'user{index % 20}@example.com', 'db_user_id': str(index % 20)}
+        started = time.perf_counter()
+        response = client.post('/prompt', json={"prompt": prompts[index % len(prompts)],
+                                                "userTimeZone": args.timezone})
+        return time.perf_counter() - started, response.status_code
+
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(args.concurrency) as pool:
+        results = list(pool.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(result[0] * 1000 for result in results)
+    statuses: Dict[int, int] = {}
+    for _, status in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    print(f"{args.requests} requests, concurrency {args.concurrency}: {args.requests / elapsed:.1f} req/s")
+    print(f"  p50 {statistics.median(latencies):.0f} ms  "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.0f} ms  "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1]:.0f} ms  max {latencies[-1]:.0f} ms")
+    print(f"  statuses {statuses}")
@@ -0,0 +1,168 @@
+"""
+Retry policy for outbound Google API calls.
+
+Replaces the old pattern of mutating socket.setdefaulttimeout() around a call,
+which changed the timeout of every other in-flight request in the process.
+Timeouts now live on each pooled transport (see calendar_pool), and retries
+use jittered exponential backoff, honor Retry-After, and draw from a shared
+retry budget so an outage can't multiply our own traffic.
+
+Only idempotent calls (list/get/delete/freebusy, and inserts that carry a
+client-generated event id) are retried on 5xx and timeouts. For any other
+call the first attempt may already have been applied, so it is retried on
+429 only, which Google returns before doing anything.
+"""
+
+import logging
+import os
+import random
+import socket
+import ssl
+import threading
+import time
+import uuid
+from email.utils import parsedate_to_datetime
+from typing import Any, Optional
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+# Socket timeout applied to each Google transport, in seconds
+HTTP_TIMEOUT = float(os.getenv('GOOGLE_HTTP_TIMEOUT', 30))
+
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Statuses that mean the request was rejected before it ran
+NOT_APPLIED_STATUSES = frozenset({429})
+RETRYABLE_EXCEPTIONS = (
+    socket.timeout,
+    TimeoutError,
+    ConnectionError,
+    ssl.SSLError,
+    httplib2.HttpLib2Error,
+)
+
+
+class RetryBudget:
+    """
+    Token bucket shared by all calls: every call deposits `ratio` tokens and
+    every retry spends one, so retries stay a bounded fraction of traffic.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_tokens: float = 10, max_tokens: float = 100):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = float(min_tokens)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 budget: Optional[RetryBudget] = None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget or RetryBudget()
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'retries': 0, 'give_ups': 0, 'budget_exhausted': 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": uniform in [0, base * 2^attempt], capped
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    @staticmethod
+    def _retry_after(error: HttpError) -> Optional[float]:
+        value = error.resp.get('retry-after') if error.resp is not None else None
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def execute(self, request, name: str = 'google', idempotent: bool = True) -> Any:
+        """
+        Execute a googleapiclient request (or batch) with this policy.
+        A call that isn't idempotent is only retried when Google rejected it
+        unrun (429). Non-retryable errors and the final failure are re-raised
+        unchanged.
+        """
+        statuses = RETRYABLE_STATUSES if idempotent else NOT_APPLIED_STATUSES
+        self._count('calls')
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                return request.execute()
+            except HttpError as e:
+                if e.resp is None or e.resp.status not in statuses:
+                    raise
+                error = e
+                delay = self._retry_after(e)
+            except RETRYABLE_EXCEPTIONS as e:
+                if not idempotent:
+                    raise
+                error = e
+                delay = None
+
+            attempt += 1
+            if attempt >= self.max_attempts:
+                self._count('give_ups')
+                logging.error(f"{name}: giving up after {attempt} attempts: {error}")
+                raise error
+            if delay is not None and delay > self.max_delay:
+                # The server asked us to wait longer than a request should block
+                self._count('give_ups')
+                logging.error(f"{name}: Retry-After of {delay:.1f}s exceeds max delay, giving up: {error}")
+                raise error
+            if not self.budget.withdraw():
+                self._count('budget_exhausted')
+                self._count('give_ups')
+                logging.error(f"{name}: retry budget exhausted: {error}")
+                raise error
+
+            self._count('retries')
+            delay = self._backoff(attempt - 1) if delay is None else delay
+            logging.warning(f"{name}: attempt {attempt} of {self.max_attempts} failed ({error}); retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+
+def new_event_id() -> str:
+    """A client-generated Calendar event id (base32hex, 5-1024 chars), so a retried insert can't duplicate."""
+    return uuid.uuid4().hex
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed idempotent call is worth another attempt."""
+    if isinstance(error, HttpError):
+        return error.resp is not None and error.resp.status in RETRYABLE_STATUSES
+    return isinstance(error, RETRYABLE_EXCEPTIONS)
+
+
+calendar_policy = RetryPolicy(
+    max_attempts=int(os.getenv('GOOGLE_RETRY_MAX_ATTEMPTS', 3)),
+    base_delay=float(os.getenv('GOOGLE_RETRY_BASE_DELAY', 0.5)),
+    max_delay=float(os.getenv('GOOGLE_RETRY_MAX_DELAY', 8.0)),
+)
@@ -1,55 +1,169 @@
 #for the security of the app, encrypt all the prompts
 
 import os
+import re
 import base64
-from cryptography.fernet import Fernet
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 from datetime import datetime, timedelta
 import logging
 
+# "v3:" in front of a Fernet token names the key version that encrypted it
+_VERSION_HEADER = re.compile(rb'^v(\d+):')
+_RETIRED_KEY = re.compile(r'^ENCRYPTION_KEY_V(\d+)$')
+# Every Fernet token starts with its version byte and timestamp: 0x80 0x00 0x00 ...
+_FERNET_PREFIX = 'gAAAA'
+
+# Threads for decrypting a page of prompts; OpenSSL releases the GIL for the HMAC and AES work
+PROMPT_DECRYPT_WORKERS = int(os.environ.get('PROMPT_DECRYPT_WORKERS', 4))
+# Smaller pages are decrypted inline; handing them to the pool costs more than it saves
+PROMPT_DECRYPT_PARALLEL_MIN = int(os.environ.get('PROMPT_DECRYPT_PARALLEL_MIN', 8))
+
+_decrypt_pool = None
+_decrypt_pool_pid = None
+_decrypt_pool_lock = threading.Lock()
+
+
+class Keyring:
+    """
+    Every prompt encryption key this process knows, by version. The current
+    version encrypts; a versioned token is decrypted with its own key, and an
+    unversioned one (written before versions were recorded) is tried against
+    every key through MultiFernet.
+    """
+
+    def __init__(self, keys, current_version, unversioned=()):
+        self.current_version = current_version
+        self.fernets = {version: Fernet(key.encode()) for version, key in keys.items()}
+        self.current = self.fernets[current_version]
+        others = [fernet for version, fernet in sorted(self.fernets.items(), reverse=True) if version != current_version]
+        self.multi = MultiFernet([self.current] + others + [Fernet(key.encode()) for key in unversioned])
+
+    def key_for_version(self, version):
+        fernet = self.fernets.get(int(version))
+        if fernet is None:
+            raise ValueError(f"Key for version {version} not found")
+        return fernet
+
+    def encrypt(self, data: bytes) -> bytes:
+        return f"v{self.current_version}:".encode() + self.current.encrypt(data)
+
+    def decrypt(self, token: bytes, key_version=None) -> bytes:
+        match = _VERSION_HEADER.match(token)
+        if match:
+            return self.key_for_version(match.group(1)).decrypt(token[match.end():])
+        if key_version is not None and int(key_version) in self.fernets:
+            try:
+                return self.fernets[int(key_version)].decrypt(token)
+            except InvalidToken:
+                pass  # the row's key_version can be wrong; fall back to every key
+        return self.multi.decrypt(token)
+
+    # Stored text. The compact form is the token itself ("v<n>:gAAAA..."),
+    # already urlsafe base64. Older rows wrapped it in another layer of
+    # base64, which never starts with "v<n>:" or a Fernet token's "gAAAA".
+
+    def encrypt_text(self, text: str) -> str:
+        return self.encrypt(text.encode('utf-8')).decode('ascii')
+
+    def decrypt_text(self, stored: str, key_version=None) -> str:
+        token = stored.encode('ascii')
+        if not is_compact(stored):
+            token = base64.b64decode(token)
+        return self.decrypt(token, key_version).decode('utf-8')
+
+    def decrypt_many(self, stored_values):
+        """
+        decrypt_text over a page of values, in the decrypt pool when the page is
+        large enough. Returns a list in the same order, with None for values that
+        are empty or fail to decrypt.
+        """
+        def decrypt_one(stored):
+            if not stored:
+                return None
+            try:
+                return self.decrypt_text(stored)
+            except Exception:
+                return None
+
+        stored_values = list(stored_values)
+        if PROMPT_DECRYPT_WORKERS <= 1 or len(stored_values) < PROMPT_DECRYPT_PARALLEL_MIN:
+            return [decrypt_one(stored) for stored in stored_values]
+        return list(_get_decrypt_pool().map(decrypt_one, stored_values))
+
+    def is_stale(self, stored: str) -> bool:
+        """True when stored text should be rewritten: the old format, or an old key."""
+        match = _VERSION_HEADER.match(stored.encode('ascii'))
+        return not match or int(match.group(1)) != self.current_version
+
+
+def is_compact(stored: str) -> bool:
+    return stored.startswith(_FERNET_PREFIX) or bool(_VERSION_HEADER.match(stored.encode('ascii')))
+
+
+def _get_decrypt_pool() -> ThreadPoolExecutor:
+    global _decrypt_pool, _decrypt_pool_pid
+    if _decrypt_pool is None or _decrypt_pool_pid != os.getpid():
+        with _decrypt_pool_lock:
+            if _decrypt_pool is None or _decrypt_pool_pid != os.getpid():
+                _decrypt_pool = ThreadPoolExecutor(max_workers=PROMPT_DECRYPT_WORKERS, thread_name_prefix='prompt-decrypt')
+                _decrypt_pool_pid = os.getpid()
+    return _decrypt_pool
+
+
+@functools.lru_cache(maxsize=1)
+def get_keyring() -> Keyring:
+    """
+    The process-wide keyring, read from the environment once:
+    PROMPT_ENCRYPTION_KEY (or ENCRYPTION_MASTER_KEY) is version
+    ENCRYPTION_KEY_VERSION, and ENCRYPTION_KEY_V<n> are retired versions.
+    Call get_keyring.cache_clear() after changing them.
+    """
+    current_key = os.environ.get('PROMPT_ENCRYPTION_KEY') or os.environ.get('ENCRYPTION_MASTER_KEY')
+    if not current_key:
+        raise ValueError("PROMPT_ENCRYPTION_KEY environment variable required")
+    current_version = int(os.environ.get('ENCRYPTION_KEY_VERSION', 1))
+
+    keys = {}
+    for name, value in os.environ.items():
+        match = _RETIRED_KEY.match(name)
+        if match and value:
+            keys[int(match.group(1))] = value
+    keys[current_version] = current_key
+
+    # Both variables were used before they shared a keyring; keep reading the other one's rows
+    unversioned = [key for key in (os.environ.get('PROMPT_ENCRYPTION_KEY'), os.environ.get('ENCRYPTION_MASTER_KEY'))
+                   if key and key != current_key]
+    return Keyring(keys, current_version, unversioned)
+
+
 class RenderPromptEncryption:
     def __init__(self):
-        self.master_key = os.environ.get('ENCRYPTION_MASTER_KEY')
-        self.key_version = int(os.environ.get('ENCRYPTION_KEY_VERSION', 1))
-        
-        if not self.master_key:
-            raise ValueError("ENCRYPTION_MASTER_KEY environment variable required")
-        
-        self.fernet = Fernet(self.master_key.encode())
-    
+        self.keyring = get_keyring()
+        self.key_version = self.keyring.current_version
+
     def encrypt_prompt(self, prompt_text):
         """Encrypt user prompt"""
         try:
-            encrypted_bytes = self.fernet.encrypt(prompt_text.encode('utf-8'))
             return {
-                'encrypted_data': base64.b64encode(encrypted_bytes).decode('utf-8'),
+                'encrypted_data': self.keyring.encrypt_text(prompt_text),
                 'key_version': self.key_version,
                 'encrypted_at': datetime.utcnow().isoformat()
             }
         except Exception as e:
             logging.error(f"Encryption failed: {e}")
             raise
-    
+
     def decrypt_prompt(self, encrypted_data, key_version=None):
         """Decrypt user prompt"""
         try:
-            # Handle key version differences if you rotate keys later
-            decryption_key = self._get_key_for_version(key_version or self.key_version)
-            
-            encrypted_bytes = base64.b64decode(encrypted_data.encode('utf-8'))
-            decrypted_bytes = decryption_key.decrypt(encrypted_bytes)
-            return decrypted_bytes.decode('utf-8')
+            return self.keyring.decrypt_text(encrypted_data, key_version)
         except Exception as e:
             logging.error(f"Decryption failed: {e}")
             raise
-    
+
     def _get_key_for_version(self, version):
         """Get appropriate key for decryption"""
-        if version == self.key_version:
-            return self.fernet
-        else:
-            # Handle old key versions - you'd add this logic during key rotation
-            old_key = os.environ.get(f'ENCRYPTION_KEY_V{version}')
-            if old_key:
-                return Fernet(old_key.encode())
-            else:
-                raise ValueError(f"Key for version {version} not found")
\ No newline at end of file
+        return self.keyring.key_for_version(version)
@@ -0,0 +1,62 @@
+import event_schema
+
+
+def create(**event):
+    params = {"summary": "Dentist", "start": "2026-10-15T17:00:00-07:00", "end": "2026-10-15T18:00:00-07:00"}
+    params.update(event)
+    return {"action_type": "create", "eventParams": [params], "eventCompletion": "Scheduled."}
+
+
+def test_valid_results():
+    assert event_schema.validate(create()) == []
+    assert event_schema.validate({"action_type": "view", "query_details": {"date": "2026-10-15"}}) == []
+    assert event_schema.validate({"action_type": "delete", "query_details": {"title": "Dentist"}}) == []
+
+
+def test_not_an_object_or_unknown_action():
+    assert event_schema.validate([]) == ["response must be a JSON object"]
+    assert event_schema.validate({"action_type": "update"}) == ["action_type must be one of create, view, delete"]
+
+
+def test_create_needs_events_and_completion():
+    errors = event_schema.validate({"action_type": "create", "eventParams": []})
+    assert "eventParams must be a non-empty list" in errors
+    assert "eventCompletion is required" in errors
+
+
+def test_create_event_fields():
+    assert event_schema.validate(create(summary=" ")) == ["eventParams[0].summary is required"]
+    assert event_schema.validate(create(start="tomorrow")) == ["eventParams[0].start is not an ISO-8601 datetime: 'tomorrow'"]
+    assert event_schema.validate(create(start="2026-10-15T17:00:00")) == ["eventParams[0].start has no UTC offset: '2026-10-15T17:00:00'"]
+    assert event_schema.validate(create(end="2026-10-15T17:00:00-07:00")) == ["eventParams[0].end must be after start"]
+    assert event_schema.validate(create(description=None)) == ["eventParams[0].description must be a string"]
+
+
+def test_query_details():
+    assert event_schema.validate({"action_type": "view"}) == ["query_details is required and must be an object"]
+    assert event_schema.validate({"action_type": "view", "query_details": {"calendarId": "primary"}}) == [
+        "query_details needs at least one of date, title, start, end"
+    ]
+    assert event_schema.validate({"action_type": "view", "query_details": {"date": "10/15/2026"}}) == [
+        "query_details.date must be YYYY-MM-DD: '10/15/2026'"
+    ]
+    assert event_schema.validate({"action_type": "view", "query_details": {"date": "2026-02-30"}}) == [
+        "query_details.date is not a real date: '2026-02-30'"
+    ]
+    assert event_schema.validate({"action_type": "delete", "query_details": {"date": "2026-10-15", "title": 3}}) == [
+        "query_details.title must be a string"
+    ]
+
+
+def test_apply_defaults_fills_missing_fields_only():
+    result = create()
+    result["eventParams"].append({"summary": "Gym", "start": "x", "end": "y", "calendarId": "work", "description": "legs"})
+    assert event_schema.apply_defaults(result) is result
+    assert result["eventParams"][0]["calendarId"] == "primary"
+    assert result["eventParams"][0]["description"] == ""
+    assert result["eventParams"][1]["calendarId"] == "work"
+    assert result["eventParams"][1]["description"] == "legs"
+
+    view = event_schema.apply_defaults({"action_type": "view", "query_details": {"date": "2026-10-15"}})
+    assert view["query_details"]["calendarId"] == "primary"
+    assert event_schema.apply_defaults({"action_type": "view"}) == {"action_type": "view"}
@@ -0,0 +1,71 @@
+import datetime
+
+import pytz
+
+import fastpath
+
+TZ = 'America/Los_Angeles'
+# Wednesday morning
+NOW = pytz.timezone(TZ).localize(datetime.datetime(2026, 10, 14, 9, 0))
+
+
+def parse(prompt):
+    return fastpath.parse(prompt, TZ, now=NOW)
+
+
+def test_create_with_default_duration():
+    result = parse("dentist tomorrow at 5pm")
+    assert result['action_type'] == 'create'
+    event = result['eventParams'][0]
+    assert event['summary'] == 'Dentist'
+    assert event['start'] == '2026-10-15T17:00:00-07:00'
+    assert event['end'] == '2026-10-15T18:00:00-07:00'
+
+
+def test_create_with_range_and_weekday():
+    event = parse("gym on friday from 7am to 8:30am")['eventParams'][0]
+    assert event['start'] == '2026-10-16T07:00:00-07:00'
+    assert event['end'] == '2026-10-16T08:30:00-07:00'
+
+
+def test_create_keeps_the_users_casing():
+    assert parse("Lunch with Sam tomorrow at noon")['eventParams'][0]['summary'] == 'Lunch with Sam'
+
+
+def test_view():
+    assert parse("what's on tomorrow") == {
+        'action_type': 'view',
+        'query_details': {'date': '2026-10-15', 'calendarId': 'primary'}
+    }
+
+
+def test_month_day_in_the_past_rolls_to_next_year():
+    assert parse("show my calendar for oct 1")['query_details']['date'] == '2027-10-01'
+
+
+def test_delete_with_time():
+    details = parse("cancel dentist on friday at 5pm")['query_details']
+    assert details['title'] == 'Dentist'
+    assert details['start'] == '2026-10-16T17:00:00-07:00'
+
+
+def test_time_in_title_falls_back():
+    assert parse("delete my 3pm meeting tomorrow") is None
+    assert parse("the 10:30 standup tomorrow at 11am") is None
+
+
+def test_single_letter_title_falls_back():
+    assert parse("a tomorrow at 5pm") is None
+    assert parse("x tomorrow at 5pm") is None
+
+
+def test_midnight_falls_back():
+    assert parse("party friday at midnight") is None
+    assert parse("movie friday from 10pm to midnight") is None
+
+
+def test_ambiguous_prompts_fall_back():
+    assert parse("dentist tomorrow at 5") is None            # no am/pm
+    assert parse("dentist today at 8am") is None             # already past
+    assert parse("lunch and coffee tomorrow at 1pm") is None  # two events
+    assert parse("is there anything tomorrow at 5pm?") is None
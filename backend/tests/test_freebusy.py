@@ -0,0 +1,35 @@
+import datetime
+
+from freebusy import merge_intervals, overlaps
+
+
+def at(hour, minute=0):
+    return datetime.datetime(2026, 10, 15, hour, minute, tzinfo=datetime.timezone.utc)
+
+
+def test_merge_overlapping_touching_and_nested():
+    intervals = [(at(13), at(14)), (at(9), at(10)), (at(10), at(11)), (at(9, 30), at(9, 45)), (at(13, 30), at(15))]
+    assert merge_intervals(intervals) == [(at(9), at(11)), (at(13), at(15))]
+
+
+def test_merge_keeps_gaps_and_handles_empty():
+    assert merge_intervals([]) == []
+    assert merge_intervals([(at(11), at(12)), (at(9), at(10))]) == [(at(9), at(10)), (at(11), at(12))]
+
+
+def test_overlaps_is_half_open():
+    busy = merge_intervals([(at(9), at(10)), (at(12), at(13))])
+    assert overlaps(busy, at(10), at(12)) == []
+    assert overlaps(busy, at(9, 59), at(12, 1)) == busy
+
+
+def test_overlaps_finds_block_starting_before_window():
+    busy = [(at(8), at(11)), (at(14), at(15))]
+    assert overlaps(busy, at(10), at(10, 30)) == [(at(8), at(11))]
+    assert overlaps(busy, at(9), at(16)) == busy
+
+
+def test_overlaps_block_starting_at_window_start():
+    busy = [(at(9), at(10))]
+    assert overlaps(busy, at(9), at(9, 15)) == busy
+    assert overlaps([], at(9), at(10)) == []
@@ -0,0 +1,60 @@
+from interval_index import IntervalIndex
+
+HOUR = 3600.0
+DAY = 24 * HOUR
+
+
+def test_half_open_boundaries():
+    index = IntervalIndex()
+    index.insert('before', 0, 10 * HOUR)        # ends where the query starts
+    index.insert('inside', 11 * HOUR, 12 * HOUR)
+    index.insert('after', 20 * HOUR, 21 * HOUR)  # starts where the query ends
+    assert index.overlapping(10 * HOUR, 20 * HOUR) == ['inside']
+
+
+def test_zero_length_event_at_query_start_is_excluded():
+    index = IntervalIndex()
+    index.insert('point', 10 * HOUR, 10 * HOUR)
+    assert index.overlapping(10 * HOUR, 11 * HOUR) == []
+    # Strictly inside the window it does overlap
+    assert index.overlapping(9 * HOUR, 11 * HOUR) == ['point']
+
+
+def test_long_events_go_to_the_side_table():
+    index = IntervalIndex()
+    index.insert('day', 0, DAY)
+    index.insert('trip', 0, 3 * DAY)
+    assert 'trip' in index._long and 'trip' not in [key for _, key in index._short]
+    assert 'day' not in index._long
+    # The long event doesn't widen the short-event search window
+    assert index._max_short == DAY
+
+
+def test_long_event_spanning_the_window():
+    index = IntervalIndex()
+    index.insert('trip', 0, 5 * DAY)
+    index.insert('meeting', 2 * DAY + 9 * HOUR, 2 * DAY + 10 * HOUR)
+    index.insert('gone', 6 * DAY, 6 * DAY + HOUR)
+    assert index.overlapping(2 * DAY, 3 * DAY) == ['trip', 'meeting']
+    assert index.overlapping(5 * DAY, 7 * DAY) == ['gone']
+
+
+def test_results_are_ordered_by_start():
+    index = IntervalIndex()
+    index.insert('late', 5 * HOUR, 6 * HOUR)
+    index.insert('trip', 4 * HOUR, 4 * HOUR + 2 * DAY)
+    index.insert('early', 1 * HOUR, 2 * HOUR)
+    assert index.overlapping(0, 10 * HOUR) == ['early', 'trip', 'late']
+
+
+def test_insert_moves_and_delete_removes():
+    index = IntervalIndex()
+    index.insert('a', 0, HOUR)
+    index.insert('a', 5 * DAY, 7 * DAY)  # moved, and now long
+    assert len(index) == 1
+    assert index.overlapping(0, HOUR) == []
+    assert index.overlapping(6 * DAY, 6 * DAY + HOUR) == ['a']
+    index.delete('a')
+    index.delete('missing')
+    assert 'a' not in index
+    assert index.overlapping(0, 10 * DAY) == []
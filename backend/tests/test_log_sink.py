@@ -0,0 +1,76 @@
+import log_sink
+
+
+class RecordingClient:
+    """Just enough of the supabase client for LogSink.flush."""
+
+    def __init__(self):
+        self.calls = []
+
+    def table(self, name):
+        return RecordingQuery(self.calls, name)
+
+
+class RecordingQuery:
+    def __init__(self, calls, table):
+        self.calls = calls
+        self.table = table
+        self.call = None
+
+    def upsert(self, rows):
+        self.call = ('upsert', [dict(row) for row in rows])
+        return self
+
+    def update(self, fields):
+        self.call = ('update', dict(fields))
+        return self
+
+    def eq(self, column, value):
+        self.call += ((column, value),)
+        return self
+
+    def execute(self):
+        self.calls.append(self.call)
+
+
+def make_sink():
+    client = RecordingClient()
+    return log_sink.LogSink(client_factory=lambda: client), client
+
+
+def test_finished_row_is_upserted_once():
+    sink, client = make_sink()
+    sink._apply(('insert', 'p1', {'id': 'p1', 'status': 'processing'}))
+    sink._apply(('update', 'p1', {'status': 'success'}))
+    sink._apply(('complete', 'p1', None))
+    sink.flush()
+    assert client.calls == [('upsert', [{'id': 'p1', 'status': 'success'}])]
+
+
+def test_late_update_reupserts_the_remembered_row():
+    sink, client = make_sink()
+    sink._apply(('insert', 'p1', {'id': 'p1', 'status': 'success', 'event_created': False}))
+    sink._apply(('complete', 'p1', None))
+    sink.flush()
+    sink._apply(('update', 'p1', {'event_created': True}))
+    sink.flush(force=True)
+    assert client.calls[-1] == ('upsert', [{'id': 'p1', 'status': 'success', 'event_created': True}])
+
+
+def test_late_update_of_a_forgotten_row_is_an_update_by_id():
+    sink, client = make_sink()
+    sink._apply(('update', 'old', {'event_created': True}))
+    sink.flush(force=True)
+    assert client.calls == [('update', {'event_created': True}, ('id', 'old'))]
+    assert sink.stats['late_updates'] == 1
+    assert sink.metrics()['pending_rows'] == 0
+
+
+def test_insert_after_a_partial_update_is_upserted_whole():
+    # A spilled insert can be drained after an update that was queued in memory
+    sink, client = make_sink()
+    sink._apply(('update', 'p1', {'status': 'success'}))
+    sink._apply(('insert', 'p1', {'id': 'p1', 'status': 'processing', 'user_id': 'u1'}))
+    sink._apply(('complete', 'p1', None))
+    sink.flush()
+    assert client.calls == [('upsert', [{'id': 'p1', 'status': 'success', 'user_id': 'u1'}])]
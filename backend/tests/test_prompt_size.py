@@ -0,0 +1,18 @@
+import main
+
+# Characters, roughly four per token. The parser prompt is sent on every model
+# call, so growing it is a cost and latency change that should be deliberate.
+PROMPT_BUDGET_CHARS = 3000
+
+
+def test_parser_prompt_stays_under_budget():
+    context, _ = main._prompt_context('America/Los_Angeles')
+    assert len(main.EVENT_PARSER_SYSTEM_PROMPT) + len(context) < PROMPT_BUDGET_CHARS
+
+
+def test_system_prompt_is_static():
+    # Nothing per-request may leak into the system message, or the provider's prompt cache misses
+    context, tz_offset = main._prompt_context('Asia/Kolkata')
+    assert tz_offset == '+05:30'
+    assert 'Asia/Kolkata' in context
+    assert 'Asia/Kolkata' not in main.EVENT_PARSER_SYSTEM_PROMPT
@@ -0,0 +1,349 @@
+"""
+Single-flight Google OAuth token refresh.
+
+When several requests for the same user (in one worker or across workers) see
+an expiring access token, only one of them talks to Google. It holds a short
+Redis lock while refreshing and publishes the new access token under the
+user's key; everyone else waits for the lock and adopts the published token
+instead of refreshing again. Without Redis, refreshes are still single-flight
+within the process.
+"""
+
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+
+import sec
+from calendar_pool import user_key
+from redis_store import get_redis
+
+TOKEN_URI = "https://oauth2.googleapis.com/token"
+# Refresh this many seconds before Google's expiry so in-flight calls don't 401
+REFRESH_MARGIN = float(os.getenv('TOKEN_REFRESH_MARGIN', 60))
+# How long the refresh lock is held at most, and how long waiters wait for it
+REFRESH_LOCK_TIMEOUT = float(os.getenv('TOKEN_REFRESH_LOCK_TIMEOUT', 10))
+REFRESH_WAIT_TIMEOUT = float(os.getenv('TOKEN_REFRESH_WAIT_TIMEOUT', 10))
+
+_TOKEN_KEY = 'calgentic:token:{}'
+_LOCK_KEY = 'calgentic:token-lock:{}'
+
+# Striped in-process locks: bounded memory, and one user always maps to one lock
+_local_locks = [threading.Lock() for _ in range(64)]
+# Tokens refreshed by this process, so local waiters can adopt them without Redis
+_local_tokens: Dict[str, Dict[str, Any]] = {}
+_LOCAL_TOKENS_MAX = 1024
+
+stats = {'refreshes': 0, 'adopted': 0}
+
+
+def client_credentials():
+    client_id = os.getenv('GOOGLE_CLIENT_ID') or os.getenv('google_client_id')
+    client_secret = os.getenv('GOOGLE_CLIENT_SECRET') or os.getenv('google_client_secret')
+    return client_id, client_secret
+
+
+def expires_soon(token_info: Dict[str, Any], margin: float = REFRESH_MARGIN) -> bool:
+    expires_at = token_info.get('expires_at')
+    return bool(expires_at) and time.time() + margin >= float(expires_at)
+
+
+def _adopt_shared(key: str, token_info: Dict[str, Any], margin: float) -> bool:
+    """Copy a fresher token published by another request into token_info."""
+    shared = _local_tokens.get(key)
+    if not shared or time.time() + margin >= shared['expires_at']:
+        redis = get_redis()
+        if redis is None:
+            return False
+        try:
+            raw = redis.get(_TOKEN_KEY.format(key))
+        except Exception as e:
+            logging.warning(f"Could not read shared token: {e}")
+            return False
+        if not raw:
+            return False
+        shared = json.loads(raw)
+    if time.time() + margin >= shared.get('expires_at', 0):
+        return False
+    if shared['access_token'] == token_info.get('access_token'):
+        return False
+    token_info['access_token'] = shared['access_token']
+    token_info['expires_at'] = shared['expires_at']
+    stats['adopted'] += 1
+    return True
+
+
+def _publish(key: str, token_info: Dict[str, Any]):
+    ttl = int(float(token_info['expires_at']) - time.time())
+    if ttl <= 0:
+        return
+    shared = {
+        'access_token': token_info['access_token'],
+        'expires_at': token_info['expires_at']
+    }
+    if len(_local_tokens) >= _LOCAL_TOKENS_MAX:
+        now = time.time()
+        for stale in [k for k, v in _local_tokens.items() if v['expires_at'] <= now]:
+            _local_tokens.pop(stale, None)
+        if len(_local_tokens) >= _LOCAL_TOKENS_MAX:
+            _local_tokens.clear()
+    _local_tokens[key] = shared
+
+    redis = get_redis()
+    if redis is None:
+        return
+    try:
+        redis.set(_TOKEN_KEY.format(key), json.dumps(shared), ex=ttl)
+    except Exception as e:
+        logging.warning(f"Could not publish refreshed token: {e}")
+
+
+def _refresh(token_info: Dict[str, Any]):
+    client_id, client_secret = client_credentials()
+    creds = Credentials(
+        token=token_info.get('access_token'),
+        refresh_token=token_info['refresh_token'],
+        token_uri=TOKEN_URI,
+        client_id=client_id,
+        client_secret=client_secret
+    )
+    creds.refresh(Request())
+    token_info['access_token'] = creds.token
+    token_info['expires_at'] = (
+        creds.expiry.replace(tzinfo=datetime.timezone.utc).timestamp() if creds.expiry else time.time() + 3600
+    )
+    stats['refreshes'] += 1
+
+
+def ensure_fresh(token_info: Dict[str, Any], margin: float = REFRESH_MARGIN, force: bool = False) -> bool:
+    """
+    Make sure token_info holds an access token valid for at least `margin` seconds,
+    refreshing it at most once per user across all workers. Updates token_info in
+    place so the caller can save it back to the session. Returns True if the token changed.
+    """
+    if not token_info.get('refresh_token'):
+        return False
+    if not force and not expires_soon(token_info, margin):
+        return False
+
+    key = user_key(token_info)
+    if _adopt_shared(key, token_info, margin):
+        return True
+
+    with _local_locks[int(key[:8], 16) % len(_local_locks)]:
+        # Another thread in this worker may have refreshed while we waited
+        if _adopt_shared(key, token_info, margin):
+            return True
+
+        redis = get_redis()
+        lock = None
+        if redis is not None:
+            lock = redis.lock(_LOCK_KEY.format(key), timeout=REFRESH_LOCK_TIMEOUT,
+                              blocking_timeout=REFRESH_WAIT_TIMEOUT)
+            try:
+                if not lock.acquire():
+                    lock = None
+            except Exception as e:
+                logging.warning(f"Could not take token refresh lock: {e}")
+                lock = None
+        try:
+            # Whoever held the lock before us has probably published a token
+            if _adopt_shared(key, token_info, margin):
+                return True
+            _refresh(token_info)
+            _publish(key, token_info)
+            return True
+        finally:
+            if lock is not None:
+                try:
+                    lock.release()
+                except Exception:
+                    pass
+
+
+def credentials_expiry(token_info: Dict[str, Any]) -> Optional[datetime.datetime]:
+    """expires_at as the naive-UTC datetime google-auth expects."""
+    expires_at = token_info.get('expires_at')
+    if not expires_at:
+        return None
+    return datetime.datetime.fromtimestamp(float(expires_at), tz=datetime.timezone.utc).replace(tzinfo=None)
+
+
+# --- Proactive refresh -------------------------------------------------------
+#
+# Sessions that made a request recently are tracked in Redis (sorted by token
+# expiry). A daemon thread in each worker wakes every REFRESHER_INTERVAL
+# seconds; whichever worker wins the sweep lock refreshes every tracked token
+# expiring within REFRESH_LEAD seconds and publishes it through the same
+# shared store ensure_fresh() reads. The next /prompt then adopts the fresh
+# token instead of paying for an OAuth round trip. Refresh tokens are stored
+# encrypted with the prompt keyring, and a session is dropped on logout.
+
+REFRESH_LEAD = float(os.getenv('TOKEN_REFRESH_LEAD', 300))
+REFRESHER_INTERVAL = float(os.getenv('TOKEN_REFRESHER_INTERVAL', 60))
+# Stop refreshing for sessions that have been quiet this long
+ACTIVE_SESSION_IDLE = float(os.getenv('TOKEN_ACTIVE_SESSION_IDLE', 2 * 3600))
+
+_ACTIVE_EXPIRY_KEY = 'calgentic:active-tokens:expiry'
+_ACTIVE_SEEN_KEY = 'calgentic:active-tokens:seen'
+_ACTIVE_REFRESH_KEY = 'calgentic:active-tokens:refresh'
+_SWEEP_LOCK_KEY = 'calgentic:active-tokens:sweep-lock'
+
+# Per-process fallback when Redis isn't configured: key -> (refresh_token, expires_at, last_seen)
+_local_active: Dict[str, tuple] = {}
+_local_active_lock = threading.Lock()
+
+_refresher_pid = None
+_refresher_lock = threading.Lock()
+
+
+def track(token_info: Dict[str, Any]):
+    """Record that this session is active so its token is refreshed ahead of expiry."""
+    if not token_info or not token_info.get('refresh_token') or not token_info.get('expires_at'):
+        return
+    key = user_key(token_info)
+    now = time.time()
+    expires_at = float(token_info['expires_at'])
+    redis = get_redis()
+    if redis is None:
+        with _local_active_lock:
+            _local_active[key] = (token_info['refresh_token'], expires_at, now)
+        return
+    try:
+        refresh_token = sec.get_keyring().encrypt_text(token_info['refresh_token'])
+        pipe = redis.pipeline(transaction=False)
+        pipe.zadd(_ACTIVE_EXPIRY_KEY, {key: expires_at})
+        pipe.zadd(_ACTIVE_SEEN_KEY, {key: now})
+        pipe.hset(_ACTIVE_REFRESH_KEY, key, refresh_token)
+        pipe.execute()
+    except Exception as e:
+        logging.warning(f"Could not track active session: {e}")
+
+
+def untrack(token_info: Dict[str, Any]):
+    """Stop refreshing this session's token and forget the copies kept for it; called on logout."""
+    if not token_info or not (token_info.get('refresh_token') or token_info.get('access_token')):
+        return
+    key = user_key(token_info)
+    _local_tokens.pop(key, None)
+    redis = get_redis()
+    if redis is None:
+        with _local_active_lock:
+            _local_active.pop(key, None)
+        return
+    try:
+        pipe = redis.pipeline(transaction=False)
+        pipe.zrem(_ACTIVE_SEEN_KEY, key)
+        pipe.zrem(_ACTIVE_EXPIRY_KEY, key)
+        pipe.hdel(_ACTIVE_REFRESH_KEY, key)
+        pipe.delete(_TOKEN_KEY.format(key))
+        pipe.execute()
+    except Exception as e:
+        logging.warning(f"Could not untrack session: {e}")
+
+
+def _due_sessions(now: float):
+    """(key, refresh_token) pairs whose tokens expire within REFRESH_LEAD, after pruning idle ones."""
+    redis = get_redis()
+    if redis is None:
+        with _local_active_lock:
+            for key in [k for k, v in _local_active.items() if now - v[2] > ACTIVE_SESSION_IDLE]:
+                del _local_active[key]
+            return [(k, v[0]) for k, v in _local_active.items() if v[1] <= now + REFRESH_LEAD]
+
+    idle = redis.zrangebyscore(_ACTIVE_SEEN_KEY, '-inf', now - ACTIVE_SESSION_IDLE)
+    if idle:
+        pipe = redis.pipeline(transaction=False)
+        pipe.zrem(_ACTIVE_SEEN_KEY, *idle)
+        pipe.zrem(_ACTIVE_EXPIRY_KEY, *idle)
+        pipe.hdel(_ACTIVE_REFRESH_KEY, *idle)
+        pipe.execute()
+
+    due = [key.decode() for key in redis.zrangebyscore(_ACTIVE_EXPIRY_KEY, '-inf', now + REFRESH_LEAD)]
+    if not due:
+        return []
+    keyring = sec.get_keyring()
+    sessions, unreadable = [], []
+    for key, stored in zip(due, redis.hmget(_ACTIVE_REFRESH_KEY, due)):
+        if not stored:
+            continue
+        try:
+            sessions.append((key, keyring.decrypt_text(stored.decode())))
+        except Exception:
+            # Written before tokens were encrypted, or under a key since dropped;
+            # the session is tracked again on its next request
+            unreadable.append(key)
+    if unreadable:
+        pipe = redis.pipeline(transaction=False)
+        pipe.zrem(_ACTIVE_SEEN_KEY, *unreadable)
+        pipe.zrem(_ACTIVE_EXPIRY_KEY, *unreadable)
+        pipe.hdel(_ACTIVE_REFRESH_KEY, *unreadable)
+        pipe.execute()
+    return sessions
+
+
+def _record_expiry(key: str, expires_at: float):
+    redis = get_redis()
+    if redis is None:
+        with _local_active_lock:
+            if key in _local_active:
+                refresh_token, _, seen = _local_active[key]
+                _local_active[key] = (refresh_token, expires_at, seen)
+        return
+    redis.zadd(_ACTIVE_EXPIRY_KEY, {key: expires_at}, xx=True)
+
+
+def sweep():
+    """Refresh every active session's token that expires within REFRESH_LEAD. Returns how many were refreshed."""
+    redis = get_redis()
+    lock = None
+    if redis is not None:
+        lock = redis.lock(_SWEEP_LOCK_KEY, timeout=max(REFRESHER_INTERVAL, REFRESH_LOCK_TIMEOUT))
+        if not lock.acquire(blocking=False):
+            return 0  # another worker is sweeping
+    refreshed = 0
+    try:
+        for key, refresh_token in _due_sessions(time.time()):
+            # force skips the expiry check on this placeholder; ensure_fresh still
+            # adopts a token another request already refreshed
+            token_info = {'refresh_token': refresh_token, 'access_token': None, 'expires_at': 0}
+            try:
+                ensure_fresh(token_info, margin=REFRESH_LEAD, force=True)
+                _record_expiry(key, float(token_info['expires_at']))
+                refreshed += 1
+            except Exception as e:
+                logging.warning(f"Background token refresh failed: {e}")
+    finally:
+        if lock is not None:
+            try:
+                lock.release()
+            except Exception:
+                pass
+    return refreshed
+
+
+def _refresher_loop():
+    while True:
+        time.sleep(REFRESHER_INTERVAL)
+        try:
+            sweep()
+        except Exception as e:
+            logging.warning(f"Token refresher sweep failed: {e}")
+
+
+def start_background_refresher():
+    """Start the refresher thread once per process (re-started in each forked worker)."""
+    global _refresher_pid
+    if _refresher_pid == os.getpid():
+        return
+    with _refresher_lock:
+        if _refresher_pid == os.getpid():
+            return
+        _refresher_pid = os.getpid()
+        threading.Thread(target=_refresher_loop, name='token-refresher', daemon=True).start()